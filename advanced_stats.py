@@ -1,5 +1,7 @@
 import sqlite3
 from datetime import datetime
+from ranking_index import ranking_index, ranking_candidates, to_day, day_to_str
+from player_identity import identity_resolver
 
 def get_db_connection():
     conn = sqlite3.connect('tennis_data.db')
@@ -7,9 +9,11 @@ def get_db_connection():
     return conn
 
 
-def resolve_player_id(player_id):
+def resolve_player_id(player_id, conn=None):
     """
     Resolve a given player ID (Sackmann or UTR) to the UTR ID used in matches table.
+    One player_identity lookup (LRU cached); see player_identity.py.
+    Pass `conn` to reuse an open connection (it is left open).
     """
     if not player_id:
         return None
@@ -19,215 +23,101 @@ def resolve_player_id(player_id):
     if player_id.isdigit():
         return player_id
         
-    # If it's a Sackmann ID (atp_..., wta_..., sackmann_...), resolve it.
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+    # Sackmann IDs (atp_..., wta_..., sackmann_...) -> linked UTR ID, else unchanged
     try:
-        # 1. Get Name from Sackmann Profiles
-        s_id = player_id
-        if s_id.startswith('sackmann-atp-'): s_id = s_id.replace('sackmann-atp-', 'atp_')
-        elif s_id.startswith('sackmann-wta-'): s_id = s_id.replace('sackmann-wta-', 'wta_')
-        elif s_id.startswith('sackmann_'): 
-             raw = s_id.replace('sackmann_', '')
-             # Try determining prefix? Assume lookup covers both or try variations
-             # Sackmann IDs in profiles are usually atp_ or wta_ prefixed.
-             pass
-             
-        # Try direct lookup in sackmann_profiles
-        # We need to handle potential prefix mismatches if player_id is just 'sackmann_123'
-        # But let's assume standard formats first.
-        
-        full_name = None
-        c.execute("SELECT full_name FROM sackmann_profiles WHERE sackmann_id = ?", (s_id,))
-        row = c.fetchone()
-        if row:
-            full_name = row[0]
-        else:
-            # Try variations
-            if player_id.startswith('sackmann_'):
-                # could be atp_... or wta_...
-                suffix = player_id.replace('sackmann_', '')
-                c.execute("SELECT full_name FROM sackmann_profiles WHERE sackmann_id = ? OR sackmann_id = ?", (f"atp_{suffix}", f"wta_{suffix}"))
-                row = c.fetchone()
-                if row:
-                    full_name = row[0]
-
-        if not full_name:
-            conn.close()
-            return player_id # Fallback to original, maybe it works?
-            
-        # 2. Get UTR ID from Players table by Name
-        # Try exact match first
-        c.execute("SELECT player_id FROM players WHERE name = ? COLLATE NOCASE", (full_name,))
-        row = c.fetchone()
-        if row:
-            conn.close()
-            return row[0]
-            
-        # Try partial match or regex?
-        # "Iga Swiatek" vs "Swiatek I." - UTR names are usually full names "First Last".
-        # Sackmann profiles are also "First Last".
-        # So exact match should work often.
-        
-        conn.close()
-        return player_id # Fallback
-        
+        return identity_resolver.utr_id(player_id, conn)
     except Exception as e:
         print(f"Error resolving player_id {player_id}: {e}")
-        conn.close()
         return player_id
 
-def get_highest_ranked_win(player_id_input):
+def get_highest_ranked_win(player_id_input, conn=None, matches=None):
     """
     Find the highest ranked opponent a player has defeated.
     Returns dict with match details and opponent rank.
+    Pass `matches` (the player's match list incl. loser_name/loser_raw_id, see
+    AnalysisContext) to skip the wins query, and `conn` to reuse a connection.
     """
-    player_id = resolve_player_id(player_id_input)
-    conn = get_db_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    player_id = resolve_player_id(player_id_input, conn)
     c = conn.cursor()
 
     
     try:
         # Get all wins with winner/loser names
-        c.execute("""
-            SELECT m.match_id, m.date, m.tournament, m.score, m.round, m.winner_id, m.loser_id,
-                   l.name as loser_name, l.player_id as loser_raw_id
-            FROM matches m
-            JOIN players l ON m.loser_id = l.player_id
-            WHERE m.winner_id = ?
-            ORDER BY m.date DESC
-        """, (player_id,))
-        wins = [dict(row) for row in c.fetchall()]
+        if matches is None:
+            c.execute("""
+                SELECT m.match_id, m.date, m.tournament, m.score, m.round, m.winner_id, m.loser_id,
+                       l.name as loser_name, l.player_id as loser_raw_id
+                FROM matches m
+                JOIN players l ON m.loser_id = l.player_id
+                WHERE m.winner_id = ?
+                ORDER BY m.date DESC
+            """, (player_id,))
+            wins = [dict(row) for row in c.fetchall()]
+        else:
+            # Same rows as the JOIN above: wins over opponents with a players row
+            wins = [
+                {k: m.get(k) for k in ('match_id', 'date', 'tournament', 'score', 'round',
+                                       'winner_id', 'loser_id', 'loser_name', 'loser_raw_id')}
+                for m in matches
+                if str(m['winner_id']) == str(player_id) and m.get('loser_raw_id') is not None
+            ]
         
         if not wins:
-            conn.close()
+            if own_conn: conn.close()
             return None
             
-        # Collect all unique opponent IDs and Names to resolve to Sackmann IDs
-        opponent_map = {} # raw_id -> {name, sackmann_ids: []}
-        for w in wins:
-            oid = w['loser_raw_id']
-            name = w['loser_name']
-            if oid not in opponent_map:
-                opponent_map[oid] = {'name': name, 'sackmann_ids': []}
-                
-                # Check for direct ID candidates first
-                if not oid.startswith('atp_') and not oid.startswith('wta_'):
-                    opponent_map[oid]['sackmann_ids'].append(f"atp_{oid}")
-                    opponent_map[oid]['sackmann_ids'].append(f"wta_{oid}")
-                if oid.startswith('sackmann_'):
-                     opponent_map[oid]['sackmann_ids'].append(f"atp_{oid.replace('sackmann_', '')}")
-                     opponent_map[oid]['sackmann_ids'].append(f"wta_{oid.replace('sackmann_', '')}")
-
-        # Resolve IDs via Name lookup in sackmann_profiles
+        # Resolve opponent IDs to Sackmann IDs
         # This is CRITICAL because matches use UTR IDs, rankings use Sackmann IDs.
-        # We must bridge matches.loser_id -> players.name -> sackmann_profiles.full_name -> sackmann_profiles.id
+        # The bridge (id format / import map / name) is precomputed in player_identity.
+        candidates = ranking_candidates(conn, {w['loser_raw_id'] for w in wins})
         
-        for oid, data in opponent_map.items():
-            name = data['name']
-            if not name: continue
-            
-            # Simple Exact Match
-            c.execute("SELECT sackmann_id FROM sackmann_profiles WHERE full_name = ? COLLATE NOCASE", (name,))
-            rows = c.fetchall()
-            if rows:
-                for r in rows:
-                    data['sackmann_ids'].append(r[0])
-            else:
-                # Try "Last First" <-> "First Last" swap if comma exists?
-                # or just split
-                parts = name.split()
-                if len(parts) >= 2:
-                    # Try matching lastname
-                    # This is risky without strict checking, but let's try strict first.
-                    pass
-
-        # Collect all valid Sackmann IDs to fetch rankings for
-        all_sackmann_ids = set()
-        for data in opponent_map.values():
-            for sid in data['sackmann_ids']:
-                all_sackmann_ids.add(sid)
-        
-        if not all_sackmann_ids:
-            conn.close()
+        if not any(candidates.values()):
+            if own_conn: conn.close()
             return None
 
         # Determine date range
         dates = [w['date'] for w in wins if w['date']]
         if not dates:
-            conn.close()
+            if own_conn: conn.close()
             return None
-        min_date = min(dates)
-        
-        # Batch fetch rankings
-        placeholders = ','.join(['?'] * len(all_sackmann_ids))
-        c.execute(f"""
-            SELECT player_id, date, rank
-            FROM rankings
-            WHERE player_id IN ({placeholders})
-            ORDER BY date DESC
-        """, list(all_sackmann_ids))
         
-        rankings_map = {} # sackmann_id -> list of (date, rank)
-        for r in c.fetchall():
-            pid = r['player_id']
-            if pid not in rankings_map:
-                rankings_map[pid] = []
-            rankings_map[pid].append({'date': r['date'], 'rank': r['rank']})
+        # As-of lookups: latest ranking on or before the match, at most MAX_RANK_AGE_DAYS old
+        ranking_index.ensure_fresh(conn)
             
         best_win = None
         min_rank = 99999
         
         for match in wins:
-            loser_id = match['loser_raw_id']
-            match_date = match['date']
-            if not match_date: continue
+            match_day = to_day(match['date']) if match['date'] else None
+            if match_day is None: continue
             
-            # Get candidates from our map
-            cands = opponent_map.get(loser_id, {}).get('sackmann_ids', [])
-                 
-            # Find applicable ranking
-            found_rank = None
-            found_date = None
+            hit = ranking_index.first_rank_on(candidates.get(match['loser_raw_id'], []), match_day)
             
-            for cid in cands:
-                if cid in rankings_map:
-                    # Find latest ranking on or before match_date
-                    for r in rankings_map[cid]:
-                        if r['date'] <= match_date:
-                             match_dt = datetime.strptime(match_date[:10], '%Y-%m-%d')
-                             rank_dt = datetime.strptime(r['date'][:10], '%Y-%m-%d')
-                             # Allow ranking to be up to 40 days old (approx 1 month + margin)
-                             if (match_dt - rank_dt).days < 60:
-                                 found_rank = r['rank']
-                                 found_date = r['date']
-                                 break 
-                    if found_rank:
-                        break
-            
-            if found_rank is not None and found_rank < min_rank:
-                min_rank = found_rank
+            if hit and hit[0] < min_rank:
+                min_rank = hit[0]
                 best_win = match
-                best_win['loser_rank'] = found_rank
-                best_win['rank_date'] = found_date
+                best_win['loser_rank'] = hit[0]
+                best_win['rank_date'] = day_to_str(hit[1])
         
-        conn.close()
+        if own_conn: conn.close()
         return best_win
         
     except Exception as e:
         print(f"Error in get_highest_ranked_win: {e}")
-        conn.close()
+        if own_conn: conn.close()
         return None
 
 
-def get_consecutive_opening_wins(player_id_input, tourney_levels=['M', 'PM', '1000']):
+def get_consecutive_opening_wins(player_id_input, tourney_levels=['M', 'PM', '1000'], matches=None):
     """
     Calculate consecutive wins in opening matches at specified tournament levels.
+    Pass `matches` (the player's full match list) to filter in memory instead of querying.
     """
     player_id = resolve_player_id(player_id_input)
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = get_db_connection() if matches is None else None
     
     placeholders = ','.join(['?'] * len(tourney_levels))
     query = f"""
@@ -239,8 +129,13 @@ def get_consecutive_opening_wins(player_id_input, tourney_levels=['M', 'PM', '10
     """
     
     try:
-        c.execute(query, (player_id, player_id, *tourney_levels))
-        matches = [dict(row) for row in c.fetchall()]
+        if conn:
+            c = conn.cursor()
+            c.execute(query, (player_id, player_id, *tourney_levels))
+            matches = [dict(row) for row in c.fetchall()]
+        else:
+            matches = sorted((m for m in matches if m.get('tourney_level') in tourney_levels),
+                             key=lambda m: m['date'] or '')
         
         # Group by Tournament
         # We need to identify unique tournaments. (Name + Year) or (Date cluster)
@@ -289,7 +184,7 @@ def get_consecutive_opening_wins(player_id_input, tourney_levels=['M', 'PM', '10
             else:
                 current_streak = 0
                 
-        conn.close()
+        if conn: conn.close()
         return {
             "current_streak": current_streak,
             "max_streak": max_streak,
@@ -299,16 +194,16 @@ def get_consecutive_opening_wins(player_id_input, tourney_levels=['M', 'PM', '10
         
     except Exception as e:
         print(f"Error in get_consecutive_opening_wins: {e}")
-        conn.close()
+        if conn: conn.close()
         return {"error": str(e)}
 
-def get_career_milestones(player_id_input):
+def get_career_milestones(player_id_input, matches=None):
     """
     Analyze career rounds to find milestones (e.g. 1st QF, 2nd SF, etc.)
+    Pass `matches` (the player's full match list) to filter in memory instead of querying.
     """
     player_id = resolve_player_id(player_id_input)
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = get_db_connection() if matches is None else None
     
     # We look for high level rounds: QF, SF, F, W
     target_rounds = ['QF', 'SF', 'F'] # 'W' is implicitly winning F
@@ -322,8 +217,13 @@ def get_career_milestones(player_id_input):
     """
     
     try:
-        c.execute(query, (player_id, player_id))
-        matches = [dict(row) for row in c.fetchall()]
+        if conn:
+            c = conn.cursor()
+            c.execute(query, (player_id, player_id))
+            matches = [dict(row) for row in c.fetchall()]
+        else:
+            matches = sorted((m for m in matches if m.get('round') in target_rounds),
+                             key=lambda m: m['date'] or '')
         
         milestones = {
             'QF': [],
@@ -352,12 +252,12 @@ def get_career_milestones(player_id_input):
             if rd == 'F' and is_winner:
                 milestones['Titles'].append(milestone_entry)
                 
-        conn.close()
+        if conn: conn.close()
         return milestones
         
     except Exception as e:
         print(f"Error in get_career_milestones: {e}")
-        conn.close()
+        if conn: conn.close()
         return {}
 
 def get_age_records(tourney_level='G', min_age=35):
@@ -2,6 +2,10 @@ import sqlite3
 from datetime import datetime, timedelta
 import numpy as np
 import advanced_stats
+from cohort_index import cohort_index
+from similarity_engine import similarity_engine
+from analysis_context import AnalysisContext
+from match_frame import MatchFrame
 
 def get_quarterly_progress(player_id: str):
     """
@@ -119,101 +123,119 @@ def analyze_age_cohort(player_data):
     """
     Compare player to their age cohort.
     Only applies if age is known.
+    Served from the in-memory cohort index (no aggregate queries).
     """
     age = player_data.get('age')
     if not age or age < 10 or age > 22: # Focus on Junior/College age
         return None
         
-    conn = get_db_connection()
-    c = conn.cursor()
-    # Get all players of same age (gender specific if needed, usually yes)
-    gender = player_data.get('gender')
-    
-    # 1. Get Aggregates
-    query = "SELECT AVG(utr_singles) as avg_utr, MAX(utr_singles) as max_utr, COUNT(*) as total FROM players WHERE age = ? AND utr_singles > 0"
-    params = [age]
-    
-    if gender:
-        query += " AND gender = ?"
-        params.append(gender)
-        
-    c.execute(query, tuple(params))
-    stats = c.fetchone()
+    cohort_index.ensure_fresh()
+    # Gender specific if known, otherwise the whole age group
+    gender = player_data.get('gender') or None
+    my_utr = player_data.get('utr_singles') or 0
     
-    if not stats or stats['total'] == 0:
-        conn.close()
+    stats = cohort_index.cohort_stats(age, gender, my_utr)
+    if not stats:
         return None
-        
-    my_utr = player_data.get('utr_singles') or 0
-    avg_utr = stats['avg_utr']
-    max_utr = stats['max_utr']
-    total_peers = stats['total']
-    
-    # 2. Calculate Percentile (Rank)
-    # How many are BELOW me?
-    # Percentile = (Count < MyUTR) / Total * 100
-    
-    query2 = "SELECT COUNT(*) as lower_count FROM players WHERE age = ? AND utr_singles > 0 AND utr_singles < ?"
-    params2 = [age, my_utr]
-    if gender:
-        query2 += " AND gender = ?"
-        params2.append(gender)
-        
-    c.execute(query2, tuple(params2))
-    lower_count = c.fetchone()['lower_count']
     
-    conn.close()
+    result = {
+        'cohort_avg': round(stats['cohort_avg'], 2),
+        'cohort_max': round(stats['cohort_max'], 2),
+        'percentile': round(stats['percentile'], 1),
+        'total_peers': stats['total_peers']
+    }
     
-    percentile = (lower_count / total_peers) * 100
+    # National rank within the same age group
+    country = player_data.get('country')
+    if country and gender and my_utr > 0:
+        national = cohort_index.national_rank(country, age, gender, my_utr)
+        if national:
+            result['national_rank'] = national['rank']
+            result['national_peers'] = national['total']
+            result['country'] = country
     
-    return {
-        'cohort_avg': round(avg_utr, 2),
-        'cohort_max': round(max_utr, 2),
-        'percentile': round(percentile, 1),
-        'total_peers': total_peers
-    }
+    return result
 
-def find_similar_players(player_data):
+def find_similar_players(player_data, k=5, conn=None):
     """
     Find 'Nearest Neighbors': Current players with similar profile.
-    Criteria:
+    Uses the similarity engine (UTR, age, UTR trend, win/upset rate, clutch)
+    once its index is built; until then falls back to:
     - Same Gender
     - Age +/- 1 year
     - UTR +/- 0.5
     """
     if not player_data.get('utr_singles') or not player_data.get('age'):
         return []
-        
-    conn = get_db_connection()
-    c = conn.cursor()
     
     gender = player_data.get('gender')
+    if not gender:
+        return []
+    
+    neighbours = similarity_engine.query(player_data['player_id'], k=k, gender=gender)
+    if neighbours is not None:
+        return load_similar_players(neighbours, conn)
+        
+    cohort_index.ensure_fresh()
+    
     age = player_data['age']
     utr = player_data['utr_singles']
-    pid = player_data['player_id']
+    pid = str(player_data['player_id'])
+    
+    # Candidates from the cohort index: Age +/- 1, UTR +/- 0.5
+    candidates = []
+    for peer_age in (age - 1, age, age + 1):
+        ratings, ids = cohort_index.players_in_range(peer_age, gender, utr - 0.5, utr + 0.5)
+        candidates.extend(zip(np.abs(ratings - utr), ids))
     
-    # Range
-    min_age = age - 1
-    max_age = age + 1
-    min_utr = utr - 0.5
-    max_utr = utr + 0.5
+    nearest = [p for _, p in sorted(candidates, key=lambda x: x[0]) if str(p) != pid][:k]
+    if not nearest:
+        return []
     
-    query = """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    c = conn.cursor()
+    placeholders = ','.join(['?'] * len(nearest))
+    c.execute(f"""
         SELECT player_id, name, utr_singles, country, age, gender 
         FROM players 
-        WHERE gender = ? 
-          AND age BETWEEN ? AND ?
-          AND utr_singles BETWEEN ? AND ?
-          AND player_id != ?
-        ORDER BY ABS(utr_singles - ?) ASC
-        LIMIT 5
-    """
+        WHERE player_id IN ({placeholders})
+    """, nearest)
+    rows = {row['player_id']: dict(row) for row in c.fetchall()}
+    if own_conn:
+        conn.close()
     
-    c.execute(query, (gender, min_age, max_age, min_utr, max_utr, str(pid), utr))
-    peers = [dict(row) for row in c.fetchall()]
-    conn.close()
+    return [rows[p] for p in nearest if p in rows]
+
+def load_similar_players(neighbours, conn=None):
+    """Player rows for [(player_id, distance), ...] in neighbour order, with a 0-100 similarity."""
+    if not neighbours:
+        return []
     
-    return peers
+    ids = [pid for pid, _ in neighbours]
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    c = conn.cursor()
+    placeholders = ','.join(['?'] * len(ids))
+    c.execute(f"""
+        SELECT player_id, name, utr_singles, country, age, gender, scout_category
+        FROM players 
+        WHERE player_id IN ({placeholders})
+    """, ids)
+    rows = {str(row['player_id']): dict(row) for row in c.fetchall()}
+    if own_conn:
+        conn.close()
+    
+    results = []
+    for pid, distance in neighbours:
+        if pid in rows:
+            row = rows[pid]
+            row['distance'] = round(distance, 3)
+            row['similarity'] = round(100 / (1 + distance), 1)
+            results.append(row)
+    return results
 
 def calculate_clutch_score(player_data):
     """
@@ -245,31 +267,15 @@ def calculate_clutch_score(player_data):
 def calculate_form_rating(matches, player_id):
     """
     Calculate Form Rating (0-100) based on last 5 matches.
+    `matches` may be a list of match dicts or a MatchFrame.
     """
-    if not matches:
+    frame = MatchFrame.of(matches, player_id)
+    if not len(frame):
         return None
         
-    # Sort by date desc just in case
-    # Assuming matches are dicts or Rows
-    sorted_matches = sorted(matches, key=lambda x: x['date'], reverse=True)[:5]
-    
-    score = 50.0 # Base
-    
-    for m in sorted_matches:
-        is_win = str(m['winner_id']) == str(player_id)
-        
-        # Determine opponent UTR (approx)
-        # If we don't have opp UTR in match record, we assume parity or slight penalty
-        # Match record usually has `winner_utr`, `loser_utr` or similar? 
-        # let's check match schema or passed data.
-        # usually `loser_name`, `winner_name`. UTRs might not be in older match imports.
-        # But `import_matches.py` saves `winner_utr`, `loser_utr`? Let's check DB schema.
-        # If not, we skip complexity for now.
-        
-        if is_win:
-            score += 5
-        else:
-            score -= 5
+    # Last 5 by date, +5 per win / -5 per loss from a base of 50
+    last5 = frame.is_win[frame.newest_first()[:5]]
+    score = 50.0 + 5 * (2 * int(last5.sum()) - len(last5))
             
     # Cap 0-100
     return max(0, min(100, score))
@@ -280,68 +286,34 @@ def calculate_advanced_metrics(matches, player_id):
     - Upset Factor (Wins vs Higher Rated)
     - Bounce Back (Win rate after loss)
     - Consistency (Matches per month)
+    `matches` may be a list of match dicts or a MatchFrame.
     """
-    if not matches:
+    frame = MatchFrame.of(matches, player_id)
+    if not len(frame):
         return {}
 
-    # Sort ASC for chronological processing
-    sorted_matches = sorted(matches, key=lambda x: x['date'])
+    # Chronological order
+    order = frame.chronological()
+    is_win = frame.is_win[order]
     
     # Consistency
-    if len(sorted_matches) > 1:
-        start_date = datetime.strptime(sorted_matches[0]['date'].split('T')[0], '%Y-%m-%d')
-        end_date = datetime.strptime(sorted_matches[-1]['date'].split('T')[0], '%Y-%m-%d')
-        months = (end_date - start_date).days / 30.0
-        matches_per_month = len(sorted_matches) / max(months, 1.0)
+    if len(order) > 1:
+        days = int((frame.day[order[-1]] - frame.day[order[0]]).astype(int))
+        months = days / 30.0
+        matches_per_month = len(order) / max(months, 1.0)
     else:
         matches_per_month = 0
 
-    # Bounce Back
-    losses = 0
-    wins_after_loss = 0
-    previous_was_loss = False
-    
-    for m in sorted_matches:
-        is_winner = str(m['winner_id']) == str(player_id)
-        
-        if previous_was_loss:
-            if is_winner:
-                wins_after_loss += 1
-            # Reset flag after the "next match" is played
-            # (If they lost again, it counts as a failed bounce back, but sets up next one)
-        
-        if not is_winner:
-            losses += 1
-            previous_was_loss = True
-        else:
-            previous_was_loss = False
-            
+    # Bounce Back: wins in the match right after a loss
+    losses = int((~is_win).sum())
+    wins_after_loss = int((is_win[1:] & ~is_win[:-1]).sum())
     bounce_back_rate = (wins_after_loss / losses * 100) if losses > 0 else None
 
     # Upset Factor
-    # We need opponent UTR.
-    # If match has winner_utr/loser_utr, use it.
-    # Otherwise, rely on current Player UTR vs Opponent (imperfect).
-    upset_wins = 0
-    opportunities = 0
-    
-    for m in sorted_matches:
-        is_winner = str(m['winner_id']) == str(player_id)
-        
-        # Try to get UTRs from match record (if they exist)
-        # Using .get() just in case keys are missing
-        w_utr = m.get('winner_utr')
-        l_utr = m.get('loser_utr')
-        
-        if w_utr and l_utr:
-            my_utr_val = w_utr if is_winner else l_utr
-            opp_utr_val = l_utr if is_winner else w_utr
-            
-            # Define "Higher Rated" as +0.5 Diff
-            if opp_utr_val > (my_utr_val + 0.5):
-                opportunities += 1
-                if is_winner:
-                    upset_wins += 1
+    # Only matches with both UTRs recorded; "Higher Rated" means +0.5 Diff
+    higher_rated = frame.opp_utr > (frame.own_utr + 0.5)  # NaN compares False
+    opportunities = int(higher_rated.sum())
+    upset_wins = int((higher_rated & frame.is_win).sum())
                     
     upset_rate = (upset_wins / opportunities * 100) if opportunities > 0 else None
     
@@ -353,45 +325,35 @@ def calculate_advanced_metrics(matches, player_id):
         'upset_opportunities': opportunities
     }
 
-def get_player_analysis(player_id):
+def get_player_analysis(player_id, ctx=None):
     """
     Main entry point. Fetches data and computes metrics.
+    Pass an AnalysisContext to reuse already-loaded player/match rows.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get Player
-    c.execute("SELECT * FROM players WHERE player_id = ?", (str(player_id),))
-    player = c.fetchone()
+    if ctx is None:
+        ctx = AnalysisContext.load(player_id)
     
+    player = ctx.player
     if not player:
-        conn.close()
         return None
         
-    # Get Matches
-    # Reuse valid SQL from tennis_db or just query here
-    c.execute("""
-        SELECT * FROM matches 
-        WHERE winner_id = ? OR loser_id = ? 
-        ORDER BY date DESC
-    """, (str(player_id), str(player_id)))
-    matches = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
+    matches = ctx.matches
+    frame = ctx.frame
     
     # Calculate
-    clutch = calculate_clutch_score(dict(player))
-    form = calculate_form_rating(matches, player_id)
-    # Cast to dict because row object is immutable/weird sometimes
-    age_stats = analyze_age_cohort(dict(player)) 
-    similar = find_similar_players(dict(player))
-    advanced = calculate_advanced_metrics(matches, player_id)
+    clutch = calculate_clutch_score(player)
+    form = calculate_form_rating(frame, player_id)
+    age_stats = analyze_age_cohort(player) 
+    similar = find_similar_players(player, conn=ctx.conn)
+    advanced = calculate_advanced_metrics(frame, player_id)
     
     # New Advanced Stats
+    # The preloaded matches are keyed by the raw id; only reuse them if it is already a UTR id
+    shared = matches if advanced_stats.resolve_player_id(str(player_id), ctx.conn) == str(player_id) else None
     try:
-        highest_win = advanced_stats.get_highest_ranked_win(player_id)
-        opening_wins = advanced_stats.get_consecutive_opening_wins(player_id)
-        milestones = advanced_stats.get_career_milestones(player_id)
+        highest_win = advanced_stats.get_highest_ranked_win(player_id, conn=ctx.conn, matches=shared)
+        opening_wins = advanced_stats.get_consecutive_opening_wins(player_id, matches=shared)
+        milestones = advanced_stats.get_career_milestones(player_id, matches=shared)
     except Exception as e:
         print(f"Error fetching advanced stats: {e}")
         highest_win = None
@@ -1,6 +1,8 @@
 import math
 import sqlite3
+import numpy as np
 import tennis_abstract_scraper
+from elo_engine import elo_ratings, expected_score
 from datetime import datetime
 
 def get_db_connection():
@@ -8,9 +10,11 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def predict_match_outcome(player1_id, player2_id, use_live_elo=False):
+def predict_match_outcome(player1_id, player2_id, use_live_elo=False, surface=None):
     """
     Predict match outcome based on UTR (and Elo if available).
+    Elo comes from the in-house ratings (elo_engine.py, surface-blended when `surface`
+    is given); use_live_elo scrapes Tennis Abstract instead.
     Returns dict with win probabilities.
     """
     conn = get_db_connection()
@@ -36,9 +40,19 @@ def predict_match_outcome(player1_id, player2_id, use_live_elo=False):
     k = 1.5 
     utr_prob = 1 / (1 + math.exp(-k * utr_diff))
     
-    # 2. Tennis Abstract Elo (Optional)
+    # 2. In-house Elo (in memory, no network)
     elo_prob = None
     elo1, elo2 = None, None
+    elo_source = None
+    if not use_live_elo:
+        elo_ratings.ensure_fresh()
+        elo_prob = elo_ratings.predict(player1_id, player2_id, surface)
+        if elo_prob is not None:
+            elo1 = round(elo_ratings.rating(player1_id, surface), 1)
+            elo2 = round(elo_ratings.rating(player2_id, surface), 1)
+            elo_source = 'In-house Elo' + (f" ({surface} blend)" if surface else '')
+    
+    # 3. Tennis Abstract Elo (Optional, live scrape)
     if use_live_elo:
         try:
             # Attempt to fetch live Elo
@@ -56,6 +70,7 @@ def predict_match_outcome(player1_id, player2_id, use_live_elo=False):
                     # Elo formula: 1 / (1 + 10^((r2-r1)/400))
                     elo_diff = elo1 - elo2
                     elo_prob = 1 / (1 + 10 ** (-elo_diff / 400))
+                    elo_source = 'Tennis Abstract (live)'
         except Exception as e:
             print(f"Elo fetch failed: {e}")
 
@@ -78,11 +93,61 @@ def predict_match_outcome(player1_id, player2_id, use_live_elo=False):
         result['elo_prediction'] = {
             'player1_elo': elo1,
             'player2_elo': elo2,
-            'player1_win_prob': round(elo_prob * 100, 1)
+            'player1_win_prob': round(elo_prob * 100, 1),
+            'source': elo_source
         }
         
     return result
 
+def predict_match_outcomes_batch(pairs, surface=None):
+    """
+    Vectorized predict_match_outcome for many (player1_id, player2_id) pairs.
+    One players query for all ids; UTR and in-house Elo probabilities computed as arrays.
+    Returns compact parallel arrays (probabilities in % for player1, None where unavailable).
+    """
+    p1_ids = [str(p[0]) for p in pairs]
+    p2_ids = [str(p[1]) for p in pairs]
+    ids = list(dict.fromkeys(p1_ids + p2_ids))
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    players = {}
+    # Chunked to stay under SQLite's host parameter limit
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        c.execute(f"SELECT player_id, utr_singles FROM players WHERE player_id IN ({','.join(['?'] * len(chunk))})", chunk)
+        for row in c.fetchall():
+            players[str(row['player_id'])] = row['utr_singles'] or 0
+    conn.close()
+    
+    # Same UTR logistic as predict_match_outcome
+    k = 1.5
+    utr1 = np.array([players.get(p, 0) for p in p1_ids], dtype=np.float64)
+    utr2 = np.array([players.get(p, 0) for p in p2_ids], dtype=np.float64)
+    utr_prob = 1 / (1 + np.exp(-k * (utr1 - utr2)))
+    found = np.array([a in players and b in players for a, b in zip(p1_ids, p2_ids)], dtype=bool)
+    
+    elo_ratings.ensure_fresh()
+    elo_by_id = {pid: elo_ratings.rating(pid, surface) for pid in ids}
+    elo1 = np.array([elo_by_id[p] if elo_by_id[p] is not None else np.nan for p in p1_ids], dtype=np.float64)
+    elo2 = np.array([elo_by_id[p] if elo_by_id[p] is not None else np.nan for p in p2_ids], dtype=np.float64)
+    elo_prob = expected_score(elo1, elo2)
+    has_elo = found & ~np.isnan(elo_prob)
+    
+    def percent(values, mask):
+        return [round(v * 100, 1) if ok else None for v, ok in zip(values.tolist(), mask.tolist())]
+    
+    return {
+        'count': len(pairs),
+        'surface': surface,
+        'model': 'UTR Logistic Regression (k=1.5)',
+        'player1': p1_ids,
+        'player2': p2_ids,
+        'player1_win_prob': percent(utr_prob, found),
+        'elo_player1_win_prob': percent(elo_prob, has_elo),
+        'missing': np.flatnonzero(~found).tolist()
+    }
+
 def get_match_charting(match_id):
     """
     Get shot-by-shot or summary stats for a charted match.
@@ -1,42 +1,27 @@
-import os
-import google.generativeai as genai
 import analysis
+from analysis_context import AnalysisContext
+from llm_gateway import llm_gateway
 import logging
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_gemini_key():
-    return os.getenv("GEMINI_API_KEY")
-
 def generate_game_plan_real(player_id):
     """
     Generate a REAL Game Plan using Google Gemini API.
     """
-    api_key = get_gemini_key()
-    if not api_key:
-        logger.warning("No GEMINI_API_KEY found. Falling back to mock.")
+    if not llm_gateway.available():
+        logger.warning("No LLM provider configured (GEMINI_API_KEY / LLM_PROVIDER). Falling back to mock.")
         return analysis.generate_mock_game_plan(player_id)
         
-    # Get Data
-    stats = analysis.get_player_analysis(player_id)
+    # Get Data (player row and matches loaded once, shared with the analysis)
+    ctx = AnalysisContext.load(player_id)
+    stats = analysis.get_player_analysis(player_id, ctx=ctx)
     if not stats:
         return None
         
-    player_name = "Player" # Ideally fetch name or pass it in. 
-    # Since stats result from analysis.get_player_analysis contains ID but not name directly (it returns dict), 
-    # we might need to fetch name or just use generic.
-    # Actually, let's fetch name quickly or update analysis.py to return it.
-    # checking analysis.get_player_analysis return... it has 'player_id' but not name.
-    # I will do a quick DB lookup here or update analysis.py.
-    # For speed, I'll just use "The Player" or fetch quickly.
-    
-    conn = analysis.get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT name, age, utr_singles FROM players WHERE player_id = ?", (player_id,))
-    p_row = c.fetchone()
-    conn.close()
+    p_row = ctx.player
     
     if p_row:
         player_name = p_row['name']
@@ -90,12 +75,10 @@ def generate_game_plan_real(player_id):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('game_plan', prompt)
         
         return {
-            "plan_text": response.text,
+            "plan_text": text,
             "source": "Gemini Pro"
         }
     except Exception as e:
@@ -109,8 +92,7 @@ def generate_quarterly_review(player_id):
     """
     Generate a Quarterly Performance Review using Gemini.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"report_text": "AI Config Missing", "source": "None"}
         
     # Get Quarterly Stats
@@ -171,13 +153,10 @@ def generate_quarterly_review(player_id):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        # Use the discoverable model
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('quarterly_review', prompt)
         
         return {
-            "report_text": response.text,
+            "report_text": text,
             "metrics": progress
         }
     except Exception as e:
@@ -187,24 +166,18 @@ def simulate_match_ai(p1_id, p2_id):
     """
     Simulate a match between two players using AI.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"report_text": "AI Config Missing", "source": "None"}
         
-    s1 = analysis.get_player_analysis(p1_id)
+    ctx1 = AnalysisContext.load(p1_id)
+    s1 = analysis.get_player_analysis(p1_id, ctx=ctx1)
     if not s1: return None
-    s2 = analysis.get_player_analysis(p2_id)
+    ctx2 = AnalysisContext.load(p2_id)
+    s2 = analysis.get_player_analysis(p2_id, ctx=ctx2)
     if not s2: return None
     
-    conn = analysis.get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT name FROM players WHERE player_id = ?", (str(p1_id),))
-    r1 = c.fetchone()
-    p1_name = r1['name'] if r1 else "Player A"
-    c.execute("SELECT name FROM players WHERE player_id = ?", (str(p2_id),))
-    r2 = c.fetchone()
-    p2_name = r2['name'] if r2 else "Player B"
-    conn.close()
+    p1_name = ctx1.player['name'] or "Player A"
+    p2_name = ctx2.player['name'] or "Player B"
 
     prompt = f"""
     Act as a Tennis Data Analyst. SIMULATE a match between:
@@ -235,10 +208,8 @@ def simulate_match_ai(p1_id, p2_id):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        return {"report_text": response.text}
+        text = llm_gateway.generate('match_simulation', prompt)
+        return {"report_text": text}
     except Exception as e:
         logger.error(f"Sim Error: {e}")
         return {"report_text": f"Simulation failed: {e}"}
@@ -248,21 +219,15 @@ def generate_recruiting_email(player_id):
     """
     Generate a College Recruiting Email draft.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"email_text": "AI Config Missing", "source": "None"}
         
-    s = analysis.get_player_analysis(player_id)
+    ctx = AnalysisContext.load(player_id)
+    s = analysis.get_player_analysis(player_id, ctx=ctx)
     if not s: return None
     
-    # Get Name & Country & UTR
-    conn = analysis.get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT name, country, age, utr_singles FROM players WHERE player_id = ?", (str(player_id),))
-    row = c.fetchone()
-    conn.close()
-    
-    if not row: return None
+    # Name & Country & UTR from the already-loaded player row
+    row = ctx.player
     name = row['name']
     country = row['country']
     age = row['age']
@@ -298,10 +263,8 @@ def generate_recruiting_email(player_id):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        return {"email_text": response.text}
+        text = llm_gateway.generate('recruiting_email', prompt)
+        return {"email_text": text}
     except Exception as e:
         logger.error(f"Recruiting Error: {e}")
         return {"email_text": f"Error generating email: {e}"}
@@ -311,21 +274,15 @@ def generate_training_focus(player_id, user_context=""):
     """
     Generate personalized training focus recommendations based on weaknesses.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"recommendations": "AI Config Missing", "source": "None"}
         
-    s = analysis.get_player_analysis(player_id)
+    ctx = AnalysisContext.load(player_id)
+    s = analysis.get_player_analysis(player_id, ctx=ctx)
     if not s: return None
     
-    # Get Player Info
-    conn = analysis.get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT name, utr_singles, tiebreak_wins, tiebreak_losses, three_set_wins, three_set_losses FROM players WHERE player_id = ?", (str(player_id),))
-    row = c.fetchone()
-    conn.close()
-    
-    if not row: return None
+    # Player Info from the already-loaded player row
+    row = ctx.player
     
     name = row['name']
     utr = row['utr_singles'] or 0.0
@@ -402,12 +359,10 @@ def generate_training_focus(player_id, user_context=""):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('training_focus', prompt)
         
         return {
-            "recommendations": response.text,
+            "recommendations": text,
             "weaknesses": weaknesses,
             "stats": {
                 "clutch": clutch,
@@ -425,8 +380,7 @@ def generate_trajectory_prediction(player_id, user_context=""):
     """
     Predict career trajectory based on UTR history and growth rate.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"prediction": "AI Config Missing", "source": "None"}
     
     # Get Player Info & UTR History
@@ -606,12 +560,10 @@ def generate_trajectory_prediction(player_id, user_context=""):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('trajectory', prompt)
         
         return {
-            "analysis": response.text,
+            "analysis": text,
             "stats": {
                 "current_utr": round(current_utr, 2),
                 "age": age,
@@ -650,8 +602,7 @@ def generate_scholarship_estimate(player_id):
     """
     Estimate potential athletic scholarship value based on UTR and gender.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"estimate": "AI Config Missing", "source": "None"}
     
     # Get Player Info
@@ -837,12 +788,10 @@ def generate_scholarship_estimate(player_id):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('scholarship', prompt)
         
         return {
-            "analysis": response.text,
+            "analysis": text,
             "estimates": estimates,
             "summary": {
                 "current_utr": round(current_utr, 2),
@@ -881,26 +830,15 @@ def generate_mental_coach(player_id, user_context=""):
     """
     Generate personalized mental game tips and pre-match routine.
     """
-    api_key = get_gemini_key()
-    if not api_key:
+    if not llm_gateway.available():
         return {"routine": "AI Config Missing", "source": "None"}
     
-    s = analysis.get_player_analysis(player_id)
+    ctx = AnalysisContext.load(player_id)
+    s = analysis.get_player_analysis(player_id, ctx=ctx)
     if not s: return None
     
-    # Get Player Info
-    conn = analysis.get_db_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT name, utr_singles, tiebreak_wins, tiebreak_losses, 
-               three_set_wins, three_set_losses, comeback_wins
-        FROM players WHERE player_id = ?
-    """, (str(player_id),))
-    row = c.fetchone()
-    conn.close()
-    
-    if not row:
-        return None
+    # Player Info from the already-loaded player row
+    row = ctx.player
     
     name = row['name']
     utr = row['utr_singles'] or 0.0
@@ -1023,12 +961,10 @@ def generate_mental_coach(player_id, user_context=""):
     """
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        text = llm_gateway.generate('mental_coach', prompt)
         
         return {
-            "routine": response.text,
+            "routine": text,
             "patterns": mental_patterns,
             "strengths": strengths,
             "stats": {
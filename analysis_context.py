@@ -0,0 +1,65 @@
+"""
+Analysis Context - Per-request snapshot of one player's data.
+
+Loads the player row, the full match list (with opponent names, ages and
+countries) and the UTR history once over the thread's pooled connection,
+so analysis, advanced stats, insights and AI prompt building all work from
+the same rows instead of each re-querying matches.
+"""
+
+import tennis_db
+from match_frame import MatchFrame
+
+
+class AnalysisContext:
+    def __init__(self, player_id, conn, player, matches, history):
+        self.player_id = player_id
+        self.conn = conn
+        self.player = player        # dict or None
+        self.matches = matches      # newest first
+        self.history = history      # utr_history rows, oldest first
+        self._frame = None
+
+    @property
+    def frame(self):
+        """Columnar MatchFrame over self.matches, built on first use."""
+        if self._frame is None:
+            self._frame = MatchFrame.from_matches(self.matches, self.player_id)
+        return self._frame
+
+    @classmethod
+    def load(cls, player_id, conn=None):
+        """Fetch player, matches and UTR history for player_id (one query each)."""
+        player_id = str(player_id)
+        if conn is None:
+            conn = tennis_db.get_pooled_connection()
+        c = conn.cursor()
+
+        c.execute("SELECT * FROM players WHERE player_id = ?", (player_id,))
+        row = c.fetchone()
+        player = dict(row) if row else None
+
+        matches = []
+        history = []
+        if player:
+            c.execute("""
+                SELECT m.*,
+                       w.name as winner_name, w.age as winner_age, w.country as winner_country,
+                       l.name as loser_name, l.age as loser_age, l.country as loser_country,
+                       l.player_id as loser_raw_id
+                FROM matches m
+                LEFT JOIN players w ON m.winner_id = w.player_id
+                LEFT JOIN players l ON m.loser_id = l.player_id
+                WHERE m.winner_id = ? OR m.loser_id = ?
+                ORDER BY m.date DESC
+            """, (player_id, player_id))
+            matches = [dict(r) for r in c.fetchall()]
+
+            c.execute("SELECT * FROM utr_history WHERE player_id = ? ORDER BY date ASC", (player_id,))
+            history = [dict(r) for r in c.fetchall()]
+
+        return cls(player_id, conn, player, matches, history)
+
+    def matches_since(self, date_str):
+        """Matches on or after date_str (YYYY-MM-DD), newest first."""
+        return [m for m in self.matches if m['date'] and m['date'] >= date_str]
@@ -1,17 +1,34 @@
 
-from fastapi import FastAPI, HTTPException, Query, status, Depends
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Request, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import advanced_stats
 import tennis_db
 import analysis
 import analysis_ai
+from llm_gateway import llm_gateway
+from job_runner import JobRunner, QueueFull, get_job
+from single_flight import single_flight
 import insights_generator
 import sqlite3
 from typing import List, Optional
 import analysis_advanced
 import analysis_advanced
+import head_to_head
+import favorites_feed
+import recent_matches
+import tournaments
+import bracket_simulator
+from analysis_context import AnalysisContext
+from ranking_index import ranking_index, ranking_candidates, to_day, day_to_str
+from ranking_series import load_series
+from ongoing_tournaments import ongoing_tournaments
+import downsample
+from similarity_engine import similarity_engine
 import college_service
 import social_service
+import news_service
 
 app = FastAPI(title="CourtSide Analytics API", description="API for Tennis Player Data")
 
@@ -31,10 +48,10 @@ app.add_middleware(
 )
 
 # --- AUTHENTICATION SETUP ---
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from fastapi.security import OAuth2PasswordRequestForm
 import auth
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 class UserCreate(BaseModel):
     email: str
@@ -304,6 +321,8 @@ def get_player_matches(
     conn = get_db_connection()
     # Get paginated matches with optional year filter
     matches = tennis_db.get_player_matches(conn, player_id, year=year, limit=limit, offset=offset)
+    # ATP/WTA rank of both players at match time
+    ranking_index.annotate_matches(conn, matches)
     # Get total count for pagination info
     total_count = tennis_db.get_player_matches_count(conn, player_id, year=year)
     # Get available years for this player
@@ -327,14 +346,23 @@ def get_player_matches(
         "data": matches
     }
 
+@app.on_event("startup")
+def start_social_prefetch():
+    # Refreshes stale Instagram caches off the request path; SOCIAL_PREFETCH_INTERVAL=0 disables it
+    if social_service.SOCIAL_PREFETCH_INTERVAL > 0 and social_service.INSTALOADER_AVAILABLE:
+        social_service.social_prefetcher.start()
+
 @app.get("/players/{player_id}/social")
 def get_player_social(player_id: str):
-    """Get social media feed for a player (Instagram)."""
+    """Get the cached social media feed for a player (Instagram); stale feeds are refreshed in the background."""
     try:
-        posts = social_service.social_service.get_player_social_feed(player_id)
+        feed = social_service.social_service.get_player_social_feed(player_id)
+        social_service.social_prefetcher.note_view(player_id, feed['stale'])
         return {
             "status": "success",
-            "data": posts,
+            "data": feed['data'],
+            "stale": feed['stale'],
+            "fetched_at": feed['fetched_at'],
             "provider": "instagram",
             "connected": social_service.INSTALOADER_AVAILABLE
         }
@@ -350,92 +378,199 @@ def get_player_match_years(player_id: str):
     conn.close()
     return {"years": years}
 
+def _chart_window(start, end):
+    """Validate optional YYYY-MM-DD chart bounds -> (start, day after end) strings for range filters."""
+    for value in (start, end):
+        if value and to_day(value) is None:
+            raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    end_exclusive = day_to_str(to_day(end) + 1) if end else None
+    return start[:10] if start else None, end_exclusive
+
+def _check_downsample(max_points, method):
+    if max_points is not None and max_points < 2:
+        raise HTTPException(status_code=400, detail="max_points must be at least 2")
+    if method not in downsample.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(downsample.METHODS)}")
+
 @app.get("/players/{player_id}/history")
-def get_player_history(player_id: str):
+def get_player_history(
+    player_id: str,
+    start: Optional[str] = Query(None, description="Only ratings on or after this date (YYYY-MM-DD)"),
+    end: Optional[str] = Query(None, description="Only ratings on or before this date (YYYY-MM-DD)"),
+    max_points: Optional[int] = Query(None, description="Downsample each rating type to at most this many points"),
+    method: str = Query("lttb", description="Downsampling method: lttb or minmax"),
+    format: str = Query("rows", description="rows (list of objects) or columns (arrays per field)")
+):
+    _check_downsample(max_points, method)
+    start, end_exclusive = _chart_window(start, end)
+    
+    sql = "SELECT * FROM utr_history WHERE player_id = ?"
+    params = [player_id]
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+    if end_exclusive:
+        sql += " AND date < ?"
+        params.append(end_exclusive)
+    
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM utr_history WHERE player_id = ? ORDER BY date ASC", (player_id,))
+    c.execute(sql + " ORDER BY date ASC", params)
     history = [dict(row) for row in c.fetchall()]
     conn.close()
+    
+    if max_points and len(history) > max_points:
+        # Downsample singles and doubles separately so each line keeps its shape
+        keep = []
+        by_type = {}
+        for i, row in enumerate(history):
+            day = to_day(row['date'] or '')
+            if row['rating'] is not None and day is not None:
+                by_type.setdefault(row['type'], []).append((i, day, row['rating']))
+        for points in by_type.values():
+            rows, x, y = zip(*points)
+            keep.extend(rows[k] for k in downsample.downsample_indices(x, y, max_points, method))
+        history = [history[i] for i in sorted(keep)]
+    
+    if format == "columns":
+        fields = list(history[0].keys()) if history else ['history_id', 'player_id', 'date', 'rating', 'type']
+        return {"count": len(history), "format": "columns", "data": {f: [row[f] for row in history] for f in fields}}
     return {"count": len(history), "data": history}
 
 @app.get("/players/{player_id}/insights")
 def get_player_insights(player_id: str, years: int = 5):
     """Get interesting patterns and insights for a player."""
-    insights = insights_generator.get_player_insights(player_id, years)
+    insights = single_flight.do('insights', (player_id, years),
+                                lambda: insights_generator.get_player_insights(player_id, years))
     return {"count": len(insights), "data": insights}
 
 @app.get("/players/{player_id}/analysis")
 @app.get("/players/{player_id}/advanced")
 def get_player_analysis(player_id: str):
-    result = analysis.get_player_analysis(player_id)
+    result = single_flight.do('analysis', (player_id,), lambda: analysis.get_player_analysis(player_id))
     if not result:
         raise HTTPException(status_code=404, detail="Player not found")
     return {"status": "success", "data": result}
     
-@app.post("/players/{player_id}/game_plan")
-def create_game_plan(player_id: str):
-    # Route to Real AI (which falls back to mock if no key)
-    result = analysis_ai.generate_game_plan_real(player_id)
-    if not result:
+@app.get("/players/{player_id}/profile_bundle")
+def get_player_profile_bundle(player_id: str, years: int = 5):
+    """Player detail, UTR history, analysis and insights in one response, computed from a single data load."""
+    bundle = single_flight.do('profile_bundle', (player_id, years), lambda: _build_profile_bundle(player_id, years))
+    if bundle is None:
         raise HTTPException(status_code=404, detail="Player not found")
-    return {"status": "success", "data": result}
+    return bundle
+
+def _build_profile_bundle(player_id, years):
+    ctx = AnalysisContext.load(player_id)
+    if not ctx.player:
+        return None
     
-@app.post("/players/{player_id}/quarterly_review")
-def create_quarterly_review(player_id: str):
-    result = analysis_ai.generate_quarterly_review(player_id)
+    analysis_result = analysis.get_player_analysis(player_id, ctx=ctx)
+    insights = insights_generator.get_player_insights(player_id, years, matches=ctx.matches)
+    return {
+        "player": ctx.player,
+        "history": {"count": len(ctx.history), "data": ctx.history},
+        "analysis": {"status": "success", "data": analysis_result},
+        "insights": {"count": len(insights), "data": insights}
+    }
+    
+# Gemini-backed reports run on a bounded executor: handlers await the job (or hand back
+# its id with ?wait=false) instead of holding a request thread for the whole round trip
+ai_jobs = JobRunner('ai', max_workers=int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+                    max_pending=int(os.getenv("AI_MAX_PENDING", "100")))
+
+AI_FAILED = "Player not found or Analysis failed"
+
+
+def _ai_report(fn, *args):
+    result = fn(*args)
     if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
+        raise LookupError(AI_FAILED)
+    return result
+
+
+async def _run_ai_job(kind, fn, *args, wait=True, params=None):
+    try:
+        job = ai_jobs.submit(kind, _ai_report, fn, *args, params=params)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "status": "accepted", "job_id": job.id, "poll": f"/jobs/{job.id}"
+        })
+    try:
+        result = await job.wait()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return {"status": "success", "data": result}
+
+
+def _user_context(body):
+    return body.get("user_context", "") if body else ""
+
+
+@app.post("/players/{player_id}/game_plan")
+async def create_game_plan(player_id: str, wait: bool = True):
+    # Route to Real AI (which falls back to mock if no key)
+    return await _run_ai_job('game_plan', analysis_ai.generate_game_plan_real, player_id,
+                             wait=wait, params={'player_id': player_id})
     
+@app.post("/players/{player_id}/quarterly_review")
+async def create_quarterly_review(player_id: str, wait: bool = True):
+    return await _run_ai_job('quarterly_review', analysis_ai.generate_quarterly_review, player_id,
+                             wait=wait, params={'player_id': player_id})
+    
+@app.get("/ai/metrics")
+def get_ai_metrics(days: int = Query(7, ge=1, le=90)):
+    """LLM gateway call counts, cache hit / coalesce outcomes, latency and token totals per report type."""
+    return {"days": days, "data": llm_gateway.summary(days), "jobs": ai_jobs.stats()}
+
+@app.get("/cache/single_flight")
+def get_single_flight_stats():
+    """Hit / miss / coalesced counters of the per-player request coalescing layer."""
+    return {"data": single_flight.stats()}
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """Status of a background job; `result` is filled once status is 'done'."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
 class MatchSimRequest(BaseModel):
     p1_id: str
     p2_id: str
 
 @app.post("/simulate_match")
-def simulate_match_endpoint(req: MatchSimRequest):
-    result = analysis_ai.simulate_match_ai(req.p1_id, req.p2_id)
-    if not result:
-        raise HTTPException(status_code=400, detail="Simulation failed")
-    return {"status": "success", "data": result}
+async def simulate_match_endpoint(req: MatchSimRequest, wait: bool = True):
+    return await _run_ai_job('match_simulation', analysis_ai.simulate_match_ai, req.p1_id, req.p2_id,
+                             wait=wait, params={'p1_id': req.p1_id, 'p2_id': req.p2_id})
 
 @app.post("/players/{player_id}/recruiting_brief")
-def create_recruiting_brief(player_id: str):
-    result = analysis_ai.generate_recruiting_email(player_id)
-    if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
-    return {"status": "success", "data": result}
+async def create_recruiting_brief(player_id: str, wait: bool = True):
+    return await _run_ai_job('recruiting_email', analysis_ai.generate_recruiting_email, player_id,
+                             wait=wait, params={'player_id': player_id})
 
 @app.post("/players/{player_id}/training_focus")
-def create_training_focus(player_id: str, body: dict = None):
-    user_context = body.get("user_context", "") if body else ""
-    result = analysis_ai.generate_training_focus(player_id, user_context)
-    if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
-    return {"status": "success", "data": result}
+async def create_training_focus(player_id: str, body: dict = None, wait: bool = True):
+    return await _run_ai_job('training_focus', analysis_ai.generate_training_focus, player_id, _user_context(body),
+                             wait=wait, params={'player_id': player_id})
 
 @app.post("/players/{player_id}/trajectory")
-def create_trajectory_prediction(player_id: str, body: dict = None):
-    user_context = body.get("user_context", "") if body else ""
-    result = analysis_ai.generate_trajectory_prediction(player_id, user_context)
-    if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
-    return {"status": "success", "data": result}
+async def create_trajectory_prediction(player_id: str, body: dict = None, wait: bool = True):
+    return await _run_ai_job('trajectory', analysis_ai.generate_trajectory_prediction, player_id, _user_context(body),
+                             wait=wait, params={'player_id': player_id})
 
 @app.post("/players/{player_id}/scholarship")
-def create_scholarship_estimate(player_id: str):
-    result = analysis_ai.generate_scholarship_estimate(player_id)
-    if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
-    return {"status": "success", "data": result}
+async def create_scholarship_estimate(player_id: str, wait: bool = True):
+    return await _run_ai_job('scholarship', analysis_ai.generate_scholarship_estimate, player_id,
+                             wait=wait, params={'player_id': player_id})
 
 @app.post("/players/{player_id}/mental_coach")
-def create_mental_coach(player_id: str, body: dict = None):
-    user_context = body.get("user_context", "") if body else ""
-    result = analysis_ai.generate_mental_coach(player_id, user_context)
-    if not result:
-        raise HTTPException(status_code=404, detail="Player not found or Analysis failed")
-    return {"status": "success", "data": result}
+async def create_mental_coach(player_id: str, body: dict = None, wait: bool = True):
+    return await _run_ai_job('mental_coach', analysis_ai.generate_mental_coach, player_id, _user_context(body),
+                             wait=wait, params={'player_id': player_id})
 
 # --- SOCIAL MEDIA ENDPOINTS ---
 class SocialMediaLink(BaseModel):
@@ -448,111 +583,38 @@ class SocialMediaLink(BaseModel):
 def get_player_opponents(player_id: str):
     """Get opponent analysis for a player: most encountered, always lose to, always win against, closest matchups."""
     conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get all matches for this player
-    query = """
-        SELECT m.*, 
-               w.name as winner_name, w.utr_singles as winner_utr_current, w.country as winner_country,
-               l.name as loser_name, l.utr_singles as loser_utr_current, l.country as loser_country
-        FROM matches m
-        LEFT JOIN players w ON m.winner_id = w.player_id
-        LEFT JOIN players l ON m.loser_id = l.player_id
-        WHERE m.winner_id = ? OR m.loser_id = ?
-        ORDER BY m.date DESC
-    """
-    c.execute(query, (player_id, player_id))
-    matches = [dict(row) for row in c.fetchall()]
+    summary = head_to_head.get_opponent_summary(conn, player_id)
     conn.close()
-    
-    if not matches:
-        return {"data": {"most_encountered": [], "always_lose": [], "always_win": [], "closest_matchups": []}}
-    
-    # Aggregate by opponent
-    opponent_stats = {}
-    for m in matches:
-        is_winner = str(m['winner_id']) == str(player_id)
-        if is_winner:
-            opp_id = m['loser_id']
-            opp_name = m['loser_name']
-            opp_utr = m['loser_utr_current']
-            opp_country = m['loser_country']
-        else:
-            opp_id = m['winner_id']
-            opp_name = m['winner_name']
-            opp_utr = m['winner_utr_current']
-            opp_country = m['winner_country']
-        
-        if not opp_id:
-            continue
-            
-        if opp_id not in opponent_stats:
-            opponent_stats[opp_id] = {
-                "player_id": opp_id,
-                "name": opp_name or "Unknown",
-                "utr_singles": opp_utr,
-                "country": opp_country,
-                "wins": 0,
-                "losses": 0,
-                "total": 0,
-                "last_match": None,
-                "matches": []
-            }
-        
-        opponent_stats[opp_id]['total'] += 1
-        if is_winner:
-            opponent_stats[opp_id]['wins'] += 1
-        else:
-            opponent_stats[opp_id]['losses'] += 1
-        
-        # Track last match
-        if not opponent_stats[opp_id]['last_match'] or m['date'] > opponent_stats[opp_id]['last_match']:
-            opponent_stats[opp_id]['last_match'] = m['date']
-        
-        # Add match details (limit to 5 most recent per opponent)
-        if len(opponent_stats[opp_id]['matches']) < 5:
-            opponent_stats[opp_id]['matches'].append({
-                "date": m['date'],
-                "score": m['score'],
-                "tournament": m['tournament'],
-                "won": is_winner
-            })
-    
-    opponents_list = list(opponent_stats.values())
-    
-    # Most Encountered (top 5 by total matches)
-    most_encountered = sorted(opponents_list, key=lambda x: x['total'], reverse=True)[:5]
-    
-    # Always Lose (100% loss rate, 3+ matches)
-    always_lose = sorted(
-        [o for o in opponents_list if o['losses'] >= 3 and o['wins'] == 0],
-        key=lambda x: x['total'], reverse=True
-    )[:5]
-    
-    # Always Win (100% win rate, 3+ matches)
-    always_win = sorted(
-        [o for o in opponents_list if o['wins'] >= 3 and o['losses'] == 0],
-        key=lambda x: x['total'], reverse=True
-    )[:5]
-    
-    # Closest Matchups (4+ matches, closest to 50/50 record)
-    def closeness_score(o):
-        if o['total'] == 0:
-            return float('inf')
-        win_rate = o['wins'] / o['total']
-        return abs(0.5 - win_rate)
-    
-    eligible_for_close = [o for o in opponents_list if o['total'] >= 4]
-    closest_matchups = sorted(eligible_for_close, key=closeness_score)[:5]
-    
-    return {
-        "data": {
-            "most_encountered": most_encountered,
-            "always_lose": always_lose,
-            "always_win": always_win,
-            "closest_matchups": closest_matchups
-        }
-    }
+    return {"data": summary}
+
+@app.get("/h2h/{p1}/{p2}")
+def get_head_to_head(p1: str, p2: str, limit: int = Query(10, ge=1, le=head_to_head.RECENT_MATCH_LIMIT)):
+    """Get the head-to-head record of p1 against p2 with their most recent meetings."""
+    conn = get_db_connection()
+    result = head_to_head.get_head_to_head(conn, p1, p2, limit=limit)
+    conn.close()
+    return {"data": result}
+
+@app.on_event("startup")
+def start_similarity_engine():
+    similarity_engine.start_background_refresh()
+
+@app.get("/players/{player_id}/similar")
+def get_similar_players(
+    player_id: str,
+    k: int = Query(10, ge=1, le=100),
+    gender: Optional[str] = None,
+    country: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """Top-k most similar players by UTR, age, UTR trend, win/upset rate and clutch. Optional gender/country/scout category filters."""
+    if not similarity_engine.ready:
+        raise HTTPException(status_code=503, detail="Similarity index is still building")
+    neighbours = similarity_engine.query(player_id, k=k, gender=gender, country=country, category=category)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Player not found or has no UTR rating")
+    results = analysis.load_similar_players(neighbours)
+    return {"count": len(results), "data": results}
 
 @app.get("/players/{player_id}/social_media")
 def get_player_social_media(player_id: str):
@@ -731,70 +793,51 @@ def get_news(limit: int = 50, category: str = None):
     conn.close()
     return {"count": len(news), "data": news}
 
+@app.on_event("startup")
+def start_news_worker():
+    # Scheduled ingestion; NEWS_REFRESH_INTERVAL=0 leaves it to /news/refresh
+    if news_service.NEWS_REFRESH_INTERVAL > 0:
+        news_service.news_worker.start()
+
 @app.post("/news/refresh")
-def refresh_news():
-    import news_service
-    # Run fetchers (this might vary in duration, usually better in background task)
-    news_service.generate_internal_news()
-    news_service.fetch_external_news()
-    news_service.fetch_favorites_news()
-    return {"status": "success", "message": "News feed refreshed"}
+async def refresh_news(wait: bool = True):
+    """Run an ingestion pass on the news worker (shared with any run already requested)."""
+    future = news_service.news_worker.trigger()
+    if not wait:
+        return JSONResponse(status_code=202, content={"status": "accepted", "message": "News refresh scheduled"})
+    stats = await asyncio.wrap_future(future)
+    return {"status": "success", "message": "News feed refreshed", "data": stats}
+
+@app.get("/news/feeds")
+def get_news_feeds():
+    """Polling state of each news feed (validators, last status / error) and the worker's last run."""
+    conn = get_db_connection()
+    feeds = [dict(r) for r in conn.execute("SELECT * FROM news_feed_state ORDER BY last_fetched_at DESC").fetchall()]
+    conn.close()
+    return {
+        "count": len(feeds),
+        "data": feeds,
+        "last_run": news_service.news_worker.last_run,
+        "last_run_at": news_service.news_worker.last_run_at,
+    }
 
 @app.get("/tournaments")
 def get_tournaments():
     conn = get_db_connection()
     c = conn.cursor()
-    # Aggregate tournaments from matches table
+    # Aggregate tournament editions (see tournaments.py)
     query = """
-        SELECT tournament, COUNT(*) as match_count, MAX(date) as last_date 
-        FROM matches 
-        WHERE tournament IS NOT NULL 
-        GROUP BY tournament 
+        SELECT name as tournament, SUM(match_count) as match_count, MAX(end_date) as last_date 
+        FROM tournaments 
+        WHERE name IS NOT NULL 
+        GROUP BY name 
         ORDER BY last_date DESC 
         LIMIT 100
     """
     c.execute(query)
-    tournaments = [dict(row) for row in c.fetchall()]
+    data = [dict(row) for row in c.fetchall()]
     conn.close()
-    return {"count": len(tournaments), "data": tournaments}
-
-def standardize_name(name, level, source):
-    """Standardize tournament name based on level and source."""
-    if not name or not level:
-        return name
-        
-    name = name.strip()
-    source = source or ''
-    is_female = 'wta' in source.lower() or 'women' in source.lower()
-    
-    # Cleaning Logic
-    import re
-    # Remove common suffixes like " 15K", " $25,000", " $15K", " CH"
-    name = re.sub(r'\s+\$?\d+(?:,\d+)?K?$', '', name, flags=re.IGNORECASE)
-    if level == 'C' and name.lower().endswith(' ch'):
-        name = name[:-3]
-    name = name.strip()
-    
-    # Standardization Logic
-    final_name = name
-    if level in ['15', '25', '35', '50', '60', '75', '80', '100']:
-        prefix = 'W' if is_female else 'M'
-        target_prefix = f"{prefix}{level}"
-        
-        if not name.startswith(target_prefix):
-            # Clean up suffix redundancy if strict mismatch
-            if name.endswith(f" {prefix}{level}"):
-                name = name[:-len(f" {prefix}{level}")]
-            elif name.endswith(f" {level}"):
-                name = name[:-len(f" {level}")]
-                
-            final_name = f"{target_prefix} {name}"
-    
-    elif level == 'C':
-        if not name.lower().startswith('challenger'):
-            final_name = f"Challenger {name}"
-            
-    return final_name
+    return {"count": len(data), "data": data}
 
 @app.get("/tournaments/list")
 def get_tournament_list(search: str = Query(None, description="Search tournament name")):
@@ -802,36 +845,25 @@ def get_tournament_list(search: str = Query(None, description="Search tournament
     conn = get_db_connection()
     c = conn.cursor()
     
+    # Canonical names are standardized once per edition when it is stored
     query = """
-        SELECT DISTINCT m.tournament, m.tourney_level, m.source
-        FROM matches m
-        WHERE m.tournament IS NOT NULL 
-          AND m.tournament != ''
-          AND m.round = 'F'
+        SELECT DISTINCT canonical_name
+        FROM tournaments
+        WHERE final_match_id IS NOT NULL
+          AND name != ''
           -- Explicitly filter for valid professional levels
-          AND m.tourney_level IN ('G', 'F', 'M', 'PM', 'A', 'P', 'C', '15', '25', '35', '50', '60', '75', '80', '100')
+          AND level IN ('G', 'F', 'M', 'PM', 'A', 'P', 'C', '15', '25', '35', '50', '60', '75', '80', '100')
           -- Double check to exclude UTR sources specifically if they sneak in
-          AND (m.source IS NULL OR m.source NOT LIKE '%UTR%')
-        ORDER BY m.tournament ASC
+          AND (source IS NULL OR source NOT LIKE '%UTR%')
+          AND canonical_name IS NOT NULL AND canonical_name != ''
+        ORDER BY canonical_name ASC
     """
     
     c.execute(query)
-    
-    # Process and Standardize Names
-    raw_tournaments = [dict(row) for row in c.fetchall()]
-    standardized_set = set()
-    
-    for t in raw_tournaments:
-        final_name = standardize_name(t['tournament'], t['tourney_level'], t['source'])
-        if final_name:
-             standardized_set.add(final_name)
-        
+    names = [row[0] for row in c.fetchall()]
     conn.close()
     
-    # Sort alphabetically
-    tournaments = sorted(list(standardized_set))
-    
-    return {"count": len(tournaments), "data": tournaments}
+    return {"count": len(names), "data": names}
 
 @app.get("/tournaments/history")
 def get_tournament_history(
@@ -854,43 +886,43 @@ def get_tournament_history(
         'futures': ['10', '15', '25', '35', '40', '50', '60', '75', '80', '100', 'S', 'I'],
     }
     
-    # Build query for finals
+    # One row per edition with a final (see tournaments.py)
     query = """
         SELECT 
-            m.tournament,
-            m.date,
-            m.surface,
-            m.tourney_level,
-            m.score,
-            m.winner_id,
-            m.loser_id,
-            w.name as winner_name,
-            l.name as finalist_name,
-            m.source
-        FROM matches m
-        LEFT JOIN players w ON m.winner_id = w.player_id
-        LEFT JOIN players l ON m.loser_id = l.player_id
-        WHERE m.round = 'F'
-        AND m.tourney_level IS NOT NULL
+            t.tournament_id,
+            t.canonical_name as tournament,
+            t.final_date as date,
+            t.surface,
+            t.level as tourney_level,
+            t.final_score as score,
+            t.winner_id,
+            t.finalist_id as loser_id,
+            t.winner_name,
+            t.finalist_name,
+            t.source,
+            t.category
+        FROM tournaments t
+        WHERE t.final_match_id IS NOT NULL
+        AND t.level IS NOT NULL
     """
     params = []
     
     # Category filter
     if category != 'all' and category in category_map:
         placeholders = ','.join(['?' for _ in category_map[category]])
-        query += f" AND m.tourney_level IN ({placeholders})"
+        query += f" AND t.level IN ({placeholders})"
         params.extend(category_map[category])
     
     # Gender filter (based on source)
     if gender == 'M':
-        query += " AND (m.source LIKE 'sackmann-atp%')"
+        query += " AND (t.source LIKE 'sackmann-atp%')"
     elif gender == 'F':
-        query += " AND (m.source LIKE 'sackmann-wta%')"
+        query += " AND (t.source LIKE 'sackmann-wta%')"
     
-    # Year filter
+    # Year filter (date range so the final_date index applies)
     if year:
-        query += " AND strftime('%Y', m.date) = ?"
-        params.append(str(year))
+        query += " AND t.final_date >= ? AND t.final_date < ?"
+        params.extend([str(year), str(year + 1)])
     
     # Search filter with Standardization Parsing
     if search:
@@ -903,80 +935,56 @@ def get_tournament_history(
         
         if itf_match:
             # User selected "M15 Monastir"
-            # Filter matches by Level=15 AND (Source implied Gender) AND Name LIKE %Monastir%
+            # Filter editions by Level=15 AND (Source implied Gender) AND Name LIKE %Monastir%
             gender_code = itf_match.group(1) # M or W
             level_code = itf_match.group(2)  # 15, 25...
             name_part = itf_match.group(3)
             
-            query += " AND m.tourney_level = ?"
+            query += " AND t.level = ?"
             params.append(level_code)
             
             if gender_code == 'M':
-                query += " AND (m.source LIKE 'sackmann-atp%' OR m.source NOT LIKE 'sackmann-wta%')" # Default to M if unsure?
+                query += " AND (t.source LIKE 'sackmann-atp%' OR t.source NOT LIKE 'sackmann-wta%')" # Default to M if unsure?
             else:
-                query += " AND (m.source LIKE 'sackmann-wta%')"
+                query += " AND (t.source LIKE 'sackmann-wta%')"
                 
-            query += " AND m.tournament LIKE ?"
+            query += " AND t.name LIKE ?"
             params.append(f"%{name_part}%")
             
         elif challenger_match:
             # User selected "Challenger Phoenix"
             name_part = challenger_match.group(1)
-            query += " AND m.tourney_level = 'C'"
-            query += " AND m.tournament LIKE ?"
-            params.append(f"%{name_part}%")
-            
-            query += " AND m.tournament LIKE ?"
+            query += " AND t.level = 'C'"
+            query += " AND t.name LIKE ?"
             params.append(f"%{name_part}%")
             
         else:
             # Standard search
             # Special Logic for Canadian Open (Toronto/Montreal/Canada Masters)
             if 'toronto' in search.lower() or 'montreal' in search.lower():
-                 query += " AND (m.tournament LIKE ? OR m.tournament = 'Canada Masters')"
+                 query += " AND (t.name LIKE ? OR t.name = 'Canada Masters')"
                  params.append(f"%{search}%")
             else:
-                 query += " AND m.tournament LIKE ?"
+                 query += " AND t.name LIKE ?"
                  params.append(f"%{search}%")
     
-    query += " ORDER BY m.date DESC LIMIT ?"
+    query += " ORDER BY t.final_date DESC LIMIT ?"
     params.append(limit)
     
     c.execute(query, params)
     
-    tournaments = []
+    editions = []
     for row in c.fetchall():
         row_dict = dict(row)
         
-        # Standardize the name here too!
-        row_dict['tournament'] = standardize_name(
-            row_dict['tournament'], 
-            row_dict.get('tourney_level'), 
-            row_dict.get('source')
-        )
-        
         # Generate a unique tournament ID
         date_str = row_dict['date'][:10] if row_dict['date'] else ''
         tourney_name = row_dict['tournament'] or ''
         row_dict['id'] = f"{date_str}_{tourney_name.replace(' ', '_').lower()}"
-        
-        # Map tourney_level to category
-        level = row_dict.get('tourney_level', '')
-        if level == 'G':
-            row_dict['category'] = 'Grand Slam'
-        elif level in ['M', 'PM']:
-            row_dict['category'] = 'Masters'
-        elif level in ['A', 'P']:
-            row_dict['category'] = 'ATP/WTA Tour'
-        elif level == 'C':
-            row_dict['category'] = 'Challenger'
-        else:
-            row_dict['category'] = 'ITF/Futures'
-        
-        tournaments.append(row_dict)
+        editions.append(row_dict)
     
     conn.close()
-    return {"count": len(tournaments), "data": tournaments}
+    return {"count": len(editions), "data": editions}
 
 @app.get("/tournaments/{tournament_name}/draw")
 def get_tournament_draw(
@@ -1003,13 +1011,11 @@ def get_tournament_draw(
         FROM matches m
         LEFT JOIN players w ON m.winner_id = w.player_id
         LEFT JOIN players l ON m.loser_id = l.player_id
-        WHERE m.tournament = ?
     """
-    params = [tournament_name]
-    
-    if year:
-        query += " AND strftime('%Y', m.date) = ?"
-        params.append(str(year))
+    # Editions by id, raw or canonical name (see tournaments.py)
+    edition_ids = tournaments.edition_ids(conn, tournament_name, year)
+    query += f" WHERE m.tournament_id IN ({','.join(['?'] * len(edition_ids))})"
+    params = edition_ids
     
     # Order by round (F, SF, QF, R16, R32, etc)
     query += """
@@ -1042,91 +1048,85 @@ def get_tournament_draw(
     
     return {"tournament": tournament_name, "year": year, "rounds": rounds, "total_matches": len(matches)}
 
-@app.get("/tournaments/ongoing")
-def get_ongoing_tournaments():
-    print("Fetching ongoing tournaments...")
+@app.get("/tournaments/{tournament_name}/forecast")
+def get_tournament_forecast(
+    tournament_name: str,
+    year: int = Query(None, description="Year of the tournament"),
+    surface: str = Query(None, description="Hard, Clay, Grass or Carpet (default: the tournament's surface)"),
+    simulations: int = Query(bracket_simulator.DEFAULT_SIMULATIONS, ge=1000, le=bracket_simulator.MAX_SIMULATIONS)
+):
+    """Monte Carlo round-by-round odds for a tournament draw, with matches already played fixed."""
     conn = get_db_connection()
     c = conn.cursor()
+    if year:
+        edition_ids = tournaments.edition_ids(conn, tournament_name, year)
+    else:
+        # Without a year, forecast the latest edition rather than merging every year into one draw
+        latest = tournaments.latest_edition_id(conn, tournament_name)
+        edition_ids = [latest] if latest else []
+    query = f"SELECT round, date, winner_id, loser_id, surface FROM matches WHERE tournament_id IN ({','.join(['?'] * len(edition_ids))})"
+    c.execute(query + " ORDER BY date ASC, match_id ASC", edition_ids)
+    matches = [dict(row) for row in c.fetchall()]
     
-    # Get tournaments active in last 7 days
-    cutoff = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-    
-    # 1. Get List of Tournaments
-    query_t = """
-        SELECT tournament, MIN(date) as start_date, MAX(date) as end_date, COUNT(*) as count
-        FROM matches
-        WHERE date >= ? AND tournament IS NOT NULL
-        GROUP BY tournament
-        ORDER BY end_date DESC, count DESC
-        LIMIT 20
-    """
-    c.execute(query_t, (cutoff,))
-    tournaments = [dict(row) for row in c.fetchall()]
-    
-    # Helper function to determine tournament type priority
-    def get_tournament_priority(name):
-        name_lower = name.lower() if name else ""
-        # WTA/ATP (highest priority)
-        if 'wta' in name_lower or 'atp' in name_lower or 'grand slam' in name_lower:
-            return 0
-        # ITF (non-junior)
-        if 'itf' in name_lower and 'junior' not in name_lower and 'jr' not in name_lower:
-            return 1
-        # ITF Junior
-        if 'itf' in name_lower and ('junior' in name_lower or 'jr' in name_lower):
-            return 2
-        # College/NCAA
-        if 'college' in name_lower or 'ncaa' in name_lower or 'university' in name_lower or 'collegiate' in name_lower:
-            return 3
-        # Other
-        return 4
-    
-    results = []
-    for t in tournaments:
-        t_name = t['tournament']
-        # 2. Get Matches for each - include player IDs for profile linking
-        query_m = """
-            SELECT m.match_id, m.date, m.score, 
-                   m.winner_id, w.name as winner, w.utr_singles as winner_utr,
-                   m.loser_id, l.name as loser, l.utr_singles as loser_utr
-            FROM matches m
-            JOIN players w ON m.winner_id = w.player_id
-            JOIN players l ON m.loser_id = l.player_id
-            WHERE m.tournament = ? AND m.date >= ?
-            ORDER BY m.date DESC, m.match_id DESC
-            LIMIT 50
-        """
-        c.execute(query_m, (t_name, cutoff))
-        matches = [dict(row) for row in c.fetchall()]
-        
-        results.append({
-            "name": t_name,
-            "start_date": t['start_date'],
-            "last_activity": t['end_date'],
-            "match_count": t['count'],
-            "matches": matches,
-            "priority": get_tournament_priority(t_name)
-        })
+    slots, results = bracket_simulator.draw_from_matches(matches)
+    if not slots:
+        conn.close()
+        raise HTTPException(status_code=404, detail="No bracket matches found for this tournament")
+    if not surface:
+        surfaces = [m['surface'] for m in matches if m['surface']]
+        surface = max(set(surfaces), key=surfaces.count) if surfaces else None
     
-    # Sort by priority (WTA/ATP first, then ITF, ITF Junior, College, Other)
-    from functools import cmp_to_key
-    def compare_tournaments(a, b):
-        if a['priority'] != b['priority']:
-            return a['priority'] - b['priority']
-        # Same priority: sort by last_activity descending
-        if a['last_activity'] > b['last_activity']:
-            return -1
-        elif a['last_activity'] < b['last_activity']:
-            return 1
-        return 0
-    
-    results.sort(key=cmp_to_key(compare_tournaments))
-        
+    result = bracket_simulator.forecast(slots, conn, surface=surface, simulations=simulations, results=results)
     conn.close()
-    return {"count": len(results), "data": results}
+    if 'error' in result:
+        raise HTTPException(status_code=400, detail=result['error'])
+    return {"tournament": tournament_name, "year": year, **result}
+
+class BracketSimRequest(BaseModel):
+    player_ids: List[Optional[str]] = Field(..., max_length=bracket_simulator.MAX_DRAW_SIZE)
+    surface: Optional[str] = None
+    simulations: int = Field(bracket_simulator.DEFAULT_SIMULATIONS, ge=1, le=bracket_simulator.MAX_SIMULATIONS)
+    seed: Optional[int] = None
+
+@app.post("/simulate/bracket")
+def simulate_bracket_endpoint(req: BracketSimRequest):
+    """Title odds for a hypothetical draw: player ids in draw order (null = bye), padded to a power of two."""
+    result = bracket_simulator.forecast(req.player_ids, surface=req.surface, simulations=req.simulations, seed=req.seed)
+    if 'error' in result:
+        raise HTTPException(status_code=400, detail=result['error'])
+    return result
+
+@app.get("/tournaments/ongoing")
+def get_ongoing_tournaments():
+    """Tournaments active in the last 7 days with their latest matches (cached, see ongoing_tournaments.py)."""
+    snapshot = ongoing_tournaments.get()
+    return {"count": snapshot['count'], "data": snapshot['data']}
+
+@app.get("/tournaments/ongoing/stream")
+async def stream_ongoing_tournaments(request: Request):
+    """Server-Sent Events: the ongoing tournaments now and again whenever they change."""
+    return StreamingResponse(
+        ongoing_tournaments.stream(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Excel exports run one or two at a time off the request threadpool; identical filter sets
+# are served from the cached workbook until the players / matches / history data changes
+export_jobs = JobRunner('export', max_workers=int(os.getenv("EXPORT_MAX_CONCURRENCY", "2")), max_pending=20)
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _export_file_response(filepath):
+    from fastapi.responses import FileResponse
+    if not filepath or not os.path.exists(filepath):
+        raise HTTPException(status_code=404, detail="No data found to export")
+    return FileResponse(filepath, filename=os.path.basename(filepath), media_type=XLSX_MEDIA_TYPE)
+
 
 @app.get("/export")
-def export_excel(
+async def export_excel(
     country: str = Query('ALL'),
     category: str = Query('junior'),
     gender: str = Query(None),
@@ -1134,19 +1134,36 @@ def export_excel(
     name: str = Query(None),
     min_utr: float = Query(0.0),
     min_age: int = Query(None, description="Minimum Age"),
-    max_age: int = Query(None, description="Maximum Age")
+    max_age: int = Query(None, description="Maximum Age"),
+    wait: bool = Query(True, description="False: return a job id at once, poll /jobs/{id} and fetch /export/{id}/download"),
+    refresh: bool = Query(False, description="Rebuild even if a cached report matches the current data")
 ):
-    from fastapi.responses import FileResponse
     from export_players_excel import generate_excel_report
-    import os
-    
-    # Generate the report
-    filepath = generate_excel_report(country, category, gender, count, name, min_utr, min_age, max_age, output_dir='output')
     
-    if not filepath or not os.path.exists(filepath):
-        raise HTTPException(status_code=404, detail="No data found to export")
-        
-    return FileResponse(filepath, filename=os.path.basename(filepath), media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    params = {'country': country, 'category': category, 'gender': gender, 'count': count, 'name': name,
+              'min_utr': min_utr, 'min_age': min_age, 'max_age': max_age}
+    try:
+        job = export_jobs.submit('export', generate_excel_report, country, category, gender, count, name, min_utr,
+                                 min_age, max_age, output_dir='output', use_cache=not refresh,
+                                 params=params, progress=True)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "status": "accepted", "job_id": job.id, "poll": f"/jobs/{job.id}", "download": f"/export/{job.id}/download"
+        })
+    return _export_file_response(await job.wait())
+
+@app.get("/export/{job_id}/download")
+def download_export(job_id: str):
+    job = get_job(job_id)
+    if job is None or job.kind != 'export':
+        raise HTTPException(status_code=404, detail="Export job not found or expired")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Export is still {job.status}")
+    if job.error:
+        raise HTTPException(status_code=500, detail=f"Export failed: {job.error}")
+    return _export_file_response(job.result)
 
 # Mount Static Files (Frontend) if built - MUST BE LAST to not intercept API routes
 
@@ -1154,134 +1171,23 @@ def export_excel(
 
 # --- RECENT MATCHES ENDPOINT ---
 
+@app.on_event("startup")
+def start_recent_matches_maintenance():
+    # Builds the recent_matches window, then prunes / rebuilds it periodically
+    recent_matches.recent_matches_maintainer.start()
+
 @app.get("/matches/recent")
 def get_recent_matches_endpoint(
     country: str = Query(None),
     category: str = Query(None),
     gender: str = Query(None),
-    days: int = Query(10, description="Days to look back")
+    days: int = Query(10, ge=1, le=recent_matches.WINDOW_DAYS, description="Days to look back")
 ):
+    """Recent matches of players rated above UTR 8 (one row per qualifying side, see recent_matches.py)."""
     conn = get_db_connection()
-    c = conn.cursor()
-    
-    cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-    
-    with open("api_debug.log", "a") as f:
-        f.write(f"[{datetime.now()}] params: country={country}, category={category}, gender={gender}, days={days}. Cutoff={cutoff_date}\n")
-
-    # Use UNION approach for much better performance
-    # This allows SQLite to use indexes efficiently for each half of the union
-    
-    # Part 1: Matches where WINNER meets criteria
-    winner_part = """
-        SELECT m.match_id, m.date, m.tournament, m.round, m.score,
-               m.winner_id, m.loser_id,
-               w.name as winner_name, w.country as winner_country, w.utr_singles as winner_utr, 
-               w.age as winner_age, w.age_group as winner_age_group, w.gender as winner_gender,
-               w.comeback_wins as winner_comeback_wins, w.tiebreak_wins as winner_tiebreak_wins, 
-               w.tiebreak_losses as winner_tiebreak_losses, w.three_set_wins as winner_three_set_wins, 
-               w.three_set_losses as winner_three_set_losses,
-               l.name as loser_name, l.country as loser_country, l.utr_singles as loser_utr,
-               l.age as loser_age, l.age_group as loser_age_group, l.gender as loser_gender,
-               l.comeback_wins as loser_comeback_wins, l.tiebreak_wins as loser_tiebreak_wins,
-               l.tiebreak_losses as loser_tiebreak_losses, l.three_set_wins as loser_three_set_wins,
-               l.three_set_losses as loser_three_set_losses
-        FROM matches m
-        JOIN players w ON m.winner_id = w.player_id
-        JOIN players l ON m.loser_id = l.player_id
-        WHERE m.date >= ?
-          AND w.utr_singles > 8
-    """
-    
-    loser_part = """
-        SELECT m.match_id, m.date, m.tournament, m.round, m.score,
-               m.winner_id, m.loser_id,
-               w.name as winner_name, w.country as winner_country, w.utr_singles as winner_utr, 
-               w.age as winner_age, w.age_group as winner_age_group, w.gender as winner_gender,
-               w.comeback_wins as winner_comeback_wins, w.tiebreak_wins as winner_tiebreak_wins, 
-               w.tiebreak_losses as winner_tiebreak_losses, w.three_set_wins as winner_three_set_wins, 
-               w.three_set_losses as winner_three_set_losses,
-               l.name as loser_name, l.country as loser_country, l.utr_singles as loser_utr,
-               l.age as loser_age, l.age_group as loser_age_group, l.gender as loser_gender,
-               l.comeback_wins as loser_comeback_wins, l.tiebreak_wins as loser_tiebreak_wins,
-               l.tiebreak_losses as loser_tiebreak_losses, l.three_set_wins as loser_three_set_wins,
-               l.three_set_losses as loser_three_set_losses
-        FROM matches m
-        JOIN players w ON m.winner_id = w.player_id
-        JOIN players l ON m.loser_id = l.player_id
-        WHERE m.date >= ?
-          AND l.utr_singles > 8
-    """
-    
-    # Add gender filter
-    if gender and gender != 'ALL':
-        winner_part += f"\n          AND w.gender = '{gender}'"
-        loser_part += f"\n          AND l.gender = '{gender}'"
-    
-    # Add category filter (junior/adult)
-    if category == 'junior':
-        winner_part += """
-          AND (
-              (w.age IS NOT NULL AND w.age <= 18)
-              OR (w.age_group IS NOT NULL AND (
-                  w.age_group LIKE '%U%' OR w.age_group LIKE '%Junior%' OR 
-                  w.age_group LIKE '%12%' OR w.age_group LIKE '%14%' OR 
-                  w.age_group LIKE '%16%' OR w.age_group LIKE '%18%'
-              ))
-          )
-        """
-        loser_part += """
-          AND (
-              (l.age IS NOT NULL AND l.age <= 18)
-              OR (l.age_group IS NOT NULL AND (
-                  l.age_group LIKE '%U%' OR l.age_group LIKE '%Junior%' OR 
-                  l.age_group LIKE '%12%' OR l.age_group LIKE '%14%' OR 
-                  l.age_group LIKE '%16%' OR l.age_group LIKE '%18%'
-              ))
-          )
-        """
-    elif category == 'adult':
-        winner_part += """
-          AND NOT (
-              (w.age IS NOT NULL AND w.age <= 18)
-              OR (w.age_group IS NOT NULL AND (
-                  w.age_group LIKE '%U%' OR w.age_group LIKE '%Junior%' OR 
-                  w.age_group LIKE '%12%' OR w.age_group LIKE '%14%' OR 
-                  w.age_group LIKE '%16%' OR w.age_group LIKE '%18%'
-              ))
-          )
-        """
-        loser_part += """
-          AND NOT (
-              (l.age IS NOT NULL AND l.age <= 18)
-              OR (l.age_group IS NOT NULL AND (
-                  l.age_group LIKE '%U%' OR l.age_group LIKE '%Junior%' OR 
-                  l.age_group LIKE '%12%' OR l.age_group LIKE '%14%' OR 
-                  l.age_group LIKE '%16%' OR l.age_group LIKE '%18%'
-              ))
-          )
-        """
-    
-    # Add country filter if specified
-    if country and country != 'ALL':
-        winner_part += f"\n          AND w.country = '{country}'"
-        loser_part += f"\n          AND l.country = '{country}'"
-    
-    # Combine with UNION ALL
-    query = winner_part + "\n    UNION ALL\n" + loser_part
-    
-    # Add sorting and limit
-    query += "\n    ORDER BY 17 DESC, 2 DESC\n    LIMIT 500"
-    
-    # Execute
-    c.execute(query, (cutoff_date, cutoff_date))
-    columns = [description[0] for description in c.description]
-    all_matches = [dict(zip(columns, row)) for row in c.fetchall()]
+    all_matches = recent_matches.query(conn, days=days, country=country, category=category, gender=gender)
     conn.close()
 
-    with open("api_debug.log", "a") as f:
-        f.write(f"[{datetime.now()}] Found {len(all_matches)} matches after SQL filter.\n")
-
     # Calculate sort_utr for compatibility
     for m in all_matches:
         m['sort_utr'] = max(m['winner_utr'] or 0, m['loser_utr'] or 0)
@@ -1311,6 +1217,7 @@ async def toggle_favorite_alias(player_id: str, current_user: dict = Depends(aut
     else:
         c.execute("INSERT INTO user_favorites (user_id, player_id) VALUES (?, ?)", (current_user['id'], player_id))
         status = "added"
+    favorites_feed.rebuild_user(conn, current_user['id'])
     conn.commit()
     conn.close()
     return {"status": "success", "action": status}
@@ -1321,6 +1228,7 @@ def add_favorite(player_id: str, current_user: dict = Depends(auth.get_current_u
     user_id = current_user['id']
     try:
         conn.execute("INSERT INTO user_favorites (user_id, player_id) VALUES (?, ?)", (user_id, player_id))
+        favorites_feed.rebuild_user(conn, user_id)
         conn.commit()
     except sqlite3.IntegrityError:
         pass # Already exists
@@ -1332,6 +1240,7 @@ def remove_favorite(player_id: str, current_user: dict = Depends(auth.get_curren
     conn = get_db_connection()
     user_id = current_user['id']
     conn.execute("DELETE FROM user_favorites WHERE user_id = ? AND player_id = ?", (user_id, player_id))
+    favorites_feed.rebuild_user(conn, user_id)
     conn.commit()
     conn.close()
     return {"status": "success", "message": f"Removed {player_id} from favorites"}
@@ -1355,144 +1264,64 @@ def get_favorites(current_user: dict = Depends(auth.get_current_user)):
 
 @app.get("/users/favorites/feed")
 def get_favorites_feed(limit: int = 50, current_user: dict = Depends(auth.get_current_user)):
+    """Recent matches and news of the user's favorite players, newest first (see favorites_feed.py)."""
     conn = get_db_connection()
-    c = conn.cursor()
-    user_id = current_user['id']
-    
-    # Get recent matches for favored players
-    matches_query = """
-        SELECT m.*, 'match' as type, m.date as timestamp,
-               w.name as winner_name, l.name as loser_name,
-               f.player_id as favorite_id
-        FROM matches m
-        JOIN user_favorites f ON (m.winner_id = f.player_id OR m.loser_id = f.player_id)
-        JOIN players w ON m.winner_id = w.player_id
-        JOIN players l ON m.loser_id = l.player_id
-        WHERE f.user_id = ?
-        ORDER BY m.date DESC
-        LIMIT ?
-    """
-    c.execute(matches_query, (user_id, limit))
-    matches = [dict(row) for row in c.fetchall()]
-
-    # Process matches to be player-centric
-    for m in matches:
-        fav_id = m.get('favorite_id')
-        if str(fav_id) == str(m.get('winner_id')):
-            m['player_id'] = m['winner_id']
-            m['player_name'] = m.get('winner_name')
-            m['opponent_id'] = m.get('loser_id')
-            m['opponent_name'] = m.get('loser_name')
-            m['result'] = 'W'
-        else:
-            m['player_id'] = m['loser_id']
-            m['player_name'] = m.get('loser_name')
-            m['opponent_id'] = m.get('winner_id')
-            m['opponent_name'] = m.get('winner_name')
-            m['result'] = 'L'
-
-    # Get news for favored players
-    news_query = """
-        SELECT n.*, 'news' as type, n.published_at as timestamp,
-               p.name as player_name
-        FROM news_items n
-        JOIN user_favorites f ON n.player_id_ref = f.player_id
-        JOIN players p ON n.player_id_ref = p.player_id
-        WHERE f.user_id = ?
-        ORDER BY n.published_at DESC
-        LIMIT ?
-    """
-    c.execute(news_query, (user_id, limit))
-    news = [dict(row) for row in c.fetchall()]
-    
+    feed = favorites_feed.get_feed(conn, current_user['id'], limit)
     conn.close()
-    
-    # Combine and sort
-    feed = sorted(matches + news, key=lambda x: x.get('timestamp') or '', reverse=True)[:limit]
-    
     return {"count": len(feed), "data": feed}
 
 @app.get("/players/{player_id}/rankings")
-def get_player_rankings(player_id: str):
+def get_player_rankings(
+    player_id: str,
+    start: Optional[str] = Query(None, description="Only weeks on or after this date (YYYY-MM-DD)"),
+    end: Optional[str] = Query(None, description="Only weeks on or before this date (YYYY-MM-DD)"),
+    max_points: Optional[int] = Query(None, description="Downsample to at most this many weeks"),
+    method: str = Query("lttb", description="Downsampling method: lttb or minmax"),
+    format: str = Query("rows", description="rows (list of objects) or columns (arrays per field)")
+):
     """Get historical ATP/WTA rankings for a player."""
+    _check_downsample(max_points, method)
+    _chart_window(start, end)
     conn = get_db_connection()
-    c = conn.cursor()
-    print(f"DEBUG: Fetching rankings for {player_id}")
-    
-    # Try direct ID match (mapping Sackmann format to internal storage)
-    sackmann_ids = [player_id]
-    if player_id.startswith('sackmann-atp-'):
-        sackmann_ids.append(player_id.replace('sackmann-atp-', 'atp_'))
-    elif player_id.startswith('sackmann-wta-'):
-        sackmann_ids.append(player_id.replace('sackmann-wta-', 'wta_'))
-    elif player_id.startswith('sackmann_'):
-        id_num = player_id.replace('sackmann_', '')
-        sackmann_ids.append(f"atp_{id_num}")
-        sackmann_ids.append(f"wta_{id_num}")
-    
-    # 1. Query by ID
-    query = """
-        SELECT date, rank, points, tours
-        FROM rankings
-        WHERE player_id = ?
-        ORDER BY date ASC
-    """
-    results = None
-    for s_id in sackmann_ids:
-        c.execute(query, (s_id,))
-        rows = c.fetchall()
-        if rows:
-            results = rows
-            break
-    
-    # 2. If no results, try name match via sackmann_profiles
-    if not results:
-        # Get player name
-        c.execute("SELECT name, country FROM players WHERE player_id = ?", (player_id,))
-        player = c.fetchone()
-        
-        if player and player['name']:
-            name = player['name']
-            
-            # Formats to try:
-            # 1. Exact match (case-insensitive) - e.g. "Jannik SINNER" == "Jannik Sinner"
-            # 2. "Last, First" swap -> "First Last"
-            
-            candidates = [name]
-            if ',' in name:
-                parts = name.split(',')
-                if len(parts) == 2:
-                    candidates.append(f"{parts[1].strip()} {parts[0].strip()}")
-            
-            rank_matches = []
-            for cand in candidates:
-                # Try to find profile
-                c.execute("""
-                    SELECT sackmann_id 
-                    FROM sackmann_profiles 
-                    WHERE full_name = ? COLLATE NOCASE
-                """, (cand,))
-                profile = c.fetchone()
-                
-                if profile:
-                    s_id = str(profile[0])
-                    print(f"DEBUG: Found Sackmann ID {s_id} for player {name}")
-                    c.execute(query, (s_id,))
-                    rank_matches = c.fetchall()
-                    if rank_matches:
-                        results = rank_matches
-                        break
-                else:
-                    print(f"DEBUG: No profile found for candidate {cand}")
-            
-            # If still no match, try searching by last name only + country? 
-            # Risk of false positives (e.g. "Williams", "USA"). 
-            # Let's stick to full name for safety.
-
-    rankings = [dict(row) for row in results] if results else []
     
+    # UTR / Sackmann id -> rankings id via the precomputed identity map (see player_identity.py)
+    ranking_ids = ranking_candidates(conn, [player_id])[player_id]
+    
+    # One compact ranking_series row per candidate (see ranking_series.py)
+    series = load_series(conn, ranking_ids)
     conn.close()
-    return {"data": rankings}
+    
+    # Unlinked ids may have two format guesses (atp_/wta_); keep the first one that has rankings
+    ranking_id = next((r for r in ranking_ids if r in series), None)
+    if not ranking_id:
+        if format == "columns":
+            return {"count": 0, "format": "columns", "data": {'date': [], 'rank': [], 'points': [], 'tours': []}}
+        return {"data": []}
+    
+    weeks = series[ranking_id].between(start, end).downsample(max_points, method)
+    if format == "columns":
+        return {"count": len(weeks), "format": "columns", "data": weeks.to_columns()}
+    return {"data": weeks.to_rows()}
+
+@app.get("/players/{player_id}/rank_at")
+def get_player_rank_at(player_id: str, date: str = Query(..., description="Date (YYYY-MM-DD)")):
+    """ATP/WTA rank of a player as of a date (latest ranking published within the preceding 60 days)."""
+    day = to_day(date)
+    if day is None:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    
+    conn = get_db_connection()
+    ranking_index.ensure_fresh(conn)
+    candidates = ranking_candidates(conn, [player_id])[player_id]
+    conn.close()
+    
+    hit = ranking_index.first_rank_on(candidates, day)
+    return {
+        "player_id": player_id,
+        "date": date[:10],
+        "rank": hit[0] if hit else None,
+        "rank_date": day_to_str(hit[1]) if hit else None
+    }
 
 
 # --- TENNIS ABSTRACT ELO ENDPOINTS ---
@@ -1606,8 +1435,7 @@ def get_player_consecutive_opening_wins(
     
 @app.get("/players/{player_id}/stats/best-win")
 def get_player_best_win(player_id: str):
-    import advanced_stats
-    result = advanced_stats.get_highest_ranked_win(player_id)
+    result = single_flight.do('best_win', (player_id,), lambda: advanced_stats.get_highest_ranked_win(player_id))
     return {"data": result}
 
 @app.get("/players/{player_id}/stats/milestones")
@@ -1717,9 +1545,24 @@ def get_grand_slam_leaders(
 # --- ANALYSIS & INTEGRATIONS ---
 
 @app.get("/analysis/match_prediction")
-def get_match_prediction(p1: str, p2: str):
+def get_match_prediction(p1: str, p2: str, surface: str = Query(None, description="Hard, Clay, Grass or Carpet")):
     """Predict match outcome between two players."""
-    return analysis_advanced.predict_match_outcome(p1, p2)
+    return analysis_advanced.predict_match_outcome(p1, p2, surface=surface)
+
+MAX_PREDICTION_PAIRS = 5000
+
+class MatchPredictionBatch(BaseModel):
+    pairs: List[List[str]]
+    surface: Optional[str] = None
+
+@app.post("/analysis/match_prediction/batch")
+def get_match_prediction_batch(req: MatchPredictionBatch):
+    """Predict many pairings at once (one players query, vectorized); returns parallel arrays."""
+    if len(req.pairs) > MAX_PREDICTION_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PREDICTION_PAIRS} pairs per request")
+    if any(len(pair) != 2 for pair in req.pairs):
+        raise HTTPException(status_code=400, detail="Each pair must be [player1_id, player2_id]")
+    return analysis_advanced.predict_match_outcomes_batch(req.pairs, surface=req.surface)
 
 @app.get("/integrations/tennis_abstract/charting")
 def get_charting_overview(player_name: str, gender: str = 'F'):
@@ -1884,12 +1727,7 @@ def get_charting_overview_stats():
 def search_colleges_endpoint(query: str = None, division: str = 'D1', gender: str = 'M'):
     """Search for colleges."""
     print(f"API: Searching for {query}, gender={gender}")
-    import importlib
-    import college_service
-    import college_roster_scraper
     try:
-        importlib.reload(college_roster_scraper)
-        importlib.reload(college_service)
         results = college_service.search_colleges(query, division, gender)
         print(f"API: Found {len(results)} results")
         return {"data": results}
@@ -2000,16 +1838,17 @@ def get_slam_stats_overview():
     
     return stats
 
+@app.on_event("startup")
+def start_roster_prefetch():
+    # Keeps the D1/D2 rosters warm; needs UTR credentials, ROSTER_PREFETCH_INTERVAL=0 disables it
+    if college_service.ROSTER_PREFETCH_INTERVAL > 0 and college_service.UTR_CONFIG.get('email'):
+        college_service.roster_prefetcher.start()
+
 @app.get("/college/{club_id}/roster")
 def get_college_roster_endpoint(club_id: str, gender: str = 'M'):
-    """Get roster for a college."""
+    """Get roster for a college (cached with stale-while-revalidate, see college_service.get_roster)."""
     print(f"API: Roster for {club_id}")
-    import importlib
-    import college_service
-    import college_roster_scraper
     try:
-        importlib.reload(college_roster_scraper)
-        importlib.reload(college_service)
         roster = college_service.get_roster(club_id, gender)
         print(f"API: Roster count {len(roster)}")
         return {"data": roster}
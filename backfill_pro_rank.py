@@ -4,6 +4,7 @@ import json
 import time
 import os
 import sys
+import tennis_db
 
 # Load config
 try:
@@ -89,6 +90,7 @@ def backfill_ranks():
                 if rank_str:
                     print(f"  -> FOUND RANK: {rank_str}")
                     c.execute("UPDATE players SET pro_rank = ? WHERE player_id = ?", (rank_str, pid))
+                    tennis_db.bump_version(conn, 'players')
                     conn.commit()
                     updated += 1
                 else:
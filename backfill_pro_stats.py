@@ -127,9 +127,12 @@ def backfill_tour_year(conn, tour, year, dry_run=False):
             updated_count += 1
             
             if updated_count % 100 == 0:
+                tennis_db.bump_version(conn, 'matches')
                 conn.commit()
                 print(f"    Updated {updated_count} matches...")
                 
+    if updated_count:
+        tennis_db.bump_version(conn, 'matches')
     conn.commit()
     print(f"  Successfully updated {updated_count} matches for {source_name} {year}")
     return updated_count
@@ -0,0 +1,164 @@
+"""
+Batch Loader - Set-based loading of matches and UTR history for many players at once.
+
+Multi-player reports (the Excel export, refresh_stats) used to run
+get_player_matches and a utr_history query per player. PlayerBatch loads
+the ids into a temp table and pulls every player's matches and history with
+a handful of joins, grouping the rows per player in memory. Match rows have
+the same shape as tennis_db.get_player_matches (newest first, with
+winner_/loser_ player fields attached).
+
+UTR trend lookups ("rating closest to N days ago") go through UTRTrend,
+which parses the history dates once into a sorted array and bisects instead
+of re-parsing and scanning the whole history for every window.
+
+Usage:
+    batch = PlayerBatch.load(conn, player_ids)
+    for pid in player_ids:
+        matches = batch.matches(pid)
+        delta_1y = batch.trend(pid).delta(current_utr, 365)
+"""
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import tennis_db
+
+# Same default as get_player_matches
+DEFAULT_MATCH_LIMIT = 100
+
+# A trend only counts if a history point lies within this many days of the target date
+MAX_TREND_GAP_DAYS = 60
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _history_seconds(date_str):
+    """Seconds since the epoch for a utr_history date, or None if unparseable."""
+    try:
+        date_str = date_str.replace('Z', '')
+        if 'T' in date_str:
+            dt = datetime.fromisoformat(date_str)
+        else:
+            dt = datetime.strptime(date_str, "%Y-%m-%d")
+        return (dt - _EPOCH).total_seconds()
+    except (AttributeError, ValueError, TypeError):
+        # Timezone-aware dates cannot be compared with the naive target dates either
+        return None
+
+
+class UTRTrend:
+    """One player's UTR history as parallel sorted arrays (seconds, rating) for bisect lookups."""
+
+    def __init__(self, history):
+        points = []
+        # Newest first, so on equal timestamps the newer row sorts first and wins ties
+        for h in sorted(history, key=lambda h: h.get('date') or '', reverse=True):
+            seconds = _history_seconds(h.get('date'))
+            if seconds is not None:
+                points.append((seconds, h.get('rating')))
+        points.sort(key=lambda p: p[0])
+        self.seconds = [p[0] for p in points]
+        self.ratings = [p[1] for p in points]
+
+    @classmethod
+    def of(cls, history):
+        return history if isinstance(history, cls) else cls(history or [])
+
+    def closest(self, target):
+        """(rating, gap_seconds) of the history point closest to target (a datetime), or (None, inf)."""
+        if not self.seconds:
+            return None, float('inf')
+        t = (target - _EPOCH).total_seconds()
+        i = bisect_left(self.seconds, t)
+        best = None
+        # On equal gaps the later point wins (the original newest-first scan kept the first it saw)
+        for j in (i, i - 1):
+            if 0 <= j < len(self.seconds):
+                gap = abs(self.seconds[j] - t)
+                if best is None or gap < best[1]:
+                    best = (j, gap)
+        return self.ratings[best[0]], best[1]
+
+    def delta(self, current_utr, days_ago, max_gap_days=MAX_TREND_GAP_DAYS, now=None):
+        """current_utr minus the rating closest to days_ago days back, or None if there is none close enough."""
+        target = (now or datetime.now()) - timedelta(days=days_ago)
+        prior, gap = self.closest(target)
+        if prior and current_utr and gap < max_gap_days * 86400:
+            return current_utr - prior
+        return None
+
+
+class PlayerBatch:
+    def __init__(self, matches, history):
+        self._matches = matches     # player_id -> matches, newest first
+        self._history = history     # player_id -> utr_history rows, newest first
+        self._trends = {}
+
+    @classmethod
+    def load(cls, conn, player_ids, match_limit=DEFAULT_MATCH_LIMIT, with_matches=True, with_history=True):
+        """
+        Load matches (newest match_limit per player, None = all) and UTR history for player_ids.
+        Uses a temp table on conn, so conn must not be shared with another thread while loading.
+        """
+        ids = list(dict.fromkeys(str(pid) for pid in player_ids))
+        matches = {pid: [] for pid in ids}
+        history = {pid: [] for pid in ids}
+        if not ids:
+            return cls(matches, history)
+
+        c = conn.cursor()
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS batch_player_ids (player_id TEXT PRIMARY KEY)")
+        c.execute("DELETE FROM batch_player_ids")
+        c.executemany("INSERT INTO batch_player_ids (player_id) VALUES (?)", [(pid,) for pid in ids])
+        try:
+            if with_matches:
+                cols = [col.strip() for col in tennis_db.PLAYER_MATCH_COLUMNS.split(',')]
+                m_cols = ', '.join(f"m.{col}" for col in cols)
+                # Rank each player's matches newest first so the limit is applied before rows leave SQLite
+                sql = f"""
+                    SELECT player_id, {', '.join(cols)} FROM (
+                        SELECT *, ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY date DESC) AS rn FROM (
+                            SELECT b.player_id, {m_cols} FROM batch_player_ids b JOIN matches m ON m.winner_id = b.player_id
+                            UNION ALL
+                            SELECT b.player_id, {m_cols} FROM batch_player_ids b JOIN matches m ON m.loser_id = b.player_id
+                        )
+                    )
+                """
+                params = []
+                if match_limit is not None:
+                    sql += " WHERE rn <= ?"
+                    params.append(match_limit)
+                c.execute(sql + " ORDER BY player_id, rn", params)
+                columns = [d[0] for d in c.description][1:]
+                all_rows = []
+                for row in c.fetchall():
+                    m = dict(zip(columns, row[1:]))
+                    matches[row[0]].append(m)
+                    all_rows.append(m)
+                tennis_db.attach_match_players(conn, all_rows)
+
+            if with_history:
+                c.execute("""
+                    SELECT h.* FROM batch_player_ids b JOIN utr_history h ON h.player_id = b.player_id
+                    ORDER BY h.player_id, h.date DESC
+                """)
+                columns = [d[0] for d in c.description]
+                for row in c.fetchall():
+                    h = dict(zip(columns, row))
+                    history[str(h['player_id'])].append(h)
+        finally:
+            c.execute("DELETE FROM batch_player_ids")
+        return cls(matches, history)
+
+    def matches(self, player_id):
+        return self._matches.get(str(player_id), [])
+
+    def history(self, player_id):
+        return self._history.get(str(player_id), [])
+
+    def trend(self, player_id):
+        pid = str(player_id)
+        trend = self._trends.get(pid)
+        if trend is None:
+            trend = self._trends[pid] = UTRTrend(self.history(pid))
+        return trend
@@ -0,0 +1,252 @@
+"""
+Benchmark: per-player metrics as dict loops vs. vectorized MatchFrame.
+
+Generates a synthetic career (default 3,000 matches), runs the original
+loop implementations of the form / advanced / insight / export metrics
+against the MatchFrame versions, checks the results agree and prints timings.
+
+Usage:
+    python benchmark_match_frame.py
+    python benchmark_match_frame.py --matches 10000 --repeat 20
+"""
+
+import argparse
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+import analysis
+import insights_generator
+import export_players_excel
+from match_frame import MatchFrame
+
+PLAYER_ID = '1000'
+
+
+def make_career(n, seed=42):
+    """Synthetic match list for PLAYER_ID, newest first (like the matches queries)."""
+    rng = random.Random(seed)
+    scores = ['6-4 6-3', '4-6 6-3 6-2', '7-6(5) 6-7(3) 7-5', '6-3 7-6(4)', '3-6 6-4 1-0', 'W/O']
+    start = datetime(2010, 1, 1)
+    matches = []
+    for i in range(n):
+        won = rng.random() < 0.55
+        opp = str(2000 + rng.randint(0, 400))
+        my_utr = round(rng.uniform(8, 12), 2)
+        opp_utr = round(my_utr + rng.uniform(-2, 2), 2)
+        matches.append({
+            'match_id': str(i),
+            'date': (start + timedelta(days=i * 1.7)).strftime('%Y-%m-%d'),
+            'winner_id': PLAYER_ID if won else opp,
+            'loser_id': opp if won else PLAYER_ID,
+            'winner_utr': my_utr if won else opp_utr,
+            'loser_utr': opp_utr if won else my_utr,
+            'winner_age': rng.choice([None, 17, 22, 38]),
+            'loser_age': rng.choice([None, 19, 25, 40]),
+            'winner_country': rng.choice(['USA', 'ESP', 'FRA', None]),
+            'loser_country': rng.choice(['USA', 'GER', 'ITA', None]),
+            'winner_name': 'Winner', 'loser_name': 'Loser',
+            'surface': rng.choice(['Hard', 'Clay', 'Grass']),
+            'round': rng.choice(['R32', 'R16', 'QF', 'SF', 'F']),
+            'score': rng.choice(scores),
+            'tournament': f"Event {rng.randint(0, 150)}",
+        })
+    matches.reverse()
+    return matches
+
+
+# --- Reference loop implementations (pre-MatchFrame) ---
+
+def loop_form_rating(matches, player_id):
+    if not matches:
+        return None
+    score = 50.0
+    for m in sorted(matches, key=lambda x: x['date'], reverse=True)[:5]:
+        score += 5 if str(m['winner_id']) == str(player_id) else -5
+    return max(0, min(100, score))
+
+
+def loop_advanced_metrics(matches, player_id):
+    if not matches:
+        return {}
+    sorted_matches = sorted(matches, key=lambda x: x['date'])
+    if len(sorted_matches) > 1:
+        start_date = datetime.strptime(sorted_matches[0]['date'].split('T')[0], '%Y-%m-%d')
+        end_date = datetime.strptime(sorted_matches[-1]['date'].split('T')[0], '%Y-%m-%d')
+        matches_per_month = len(sorted_matches) / max((end_date - start_date).days / 30.0, 1.0)
+    else:
+        matches_per_month = 0
+
+    losses = wins_after_loss = 0
+    previous_was_loss = False
+    for m in sorted_matches:
+        is_winner = str(m['winner_id']) == str(player_id)
+        if previous_was_loss and is_winner:
+            wins_after_loss += 1
+        if not is_winner:
+            losses += 1
+        previous_was_loss = not is_winner
+    bounce_back_rate = (wins_after_loss / losses * 100) if losses > 0 else None
+
+    upset_wins = opportunities = 0
+    for m in sorted_matches:
+        is_winner = str(m['winner_id']) == str(player_id)
+        w_utr, l_utr = m.get('winner_utr'), m.get('loser_utr')
+        if w_utr and l_utr:
+            my_utr_val = w_utr if is_winner else l_utr
+            opp_utr_val = l_utr if is_winner else w_utr
+            if opp_utr_val > (my_utr_val + 0.5):
+                opportunities += 1
+                if is_winner:
+                    upset_wins += 1
+    upset_rate = (upset_wins / opportunities * 100) if opportunities > 0 else None
+
+    return {
+        'matches_per_month': round(matches_per_month, 1),
+        'bounce_back_rate': round(bounce_back_rate, 1) if bounce_back_rate is not None else None,
+        'upset_rate': round(upset_rate, 1) if upset_rate is not None else None,
+        'upset_wins': upset_wins,
+        'upset_opportunities': opportunities
+    }
+
+
+def loop_insight_records(matches, player_id):
+    """(wins, losses) per insight bucket, computed the way the old detectors looped."""
+    records = {}
+
+    def add(key, is_win):
+        w, l = records.get(key, (0, 0))
+        records[key] = (w + is_win, l + (not is_win))
+
+    for m in matches:
+        is_win = str(m.get('winner_id')) == str(player_id)
+        opp_age = m.get('loser_age') if is_win else m.get('winner_age')
+        if opp_age and 37 <= opp_age <= 100:
+            add('age_37+', is_win)
+        if opp_age and 0 <= opp_age <= 20:
+            add('age_under_21', is_win)
+        add(f"surface_{m.get('surface')}", is_win)
+        add(f"round_{m.get('round')}", is_win)
+        opp_country = m.get('loser_country') if is_win else m.get('winner_country')
+        if opp_country:
+            add(f"country_{opp_country}", is_win)
+    return records
+
+
+def frame_insight_records(frame):
+    records = {}
+    for key, mask in [('age_37+', (frame.opp_age >= 37) & (frame.opp_age <= 100)),
+                      ('age_under_21', (frame.opp_age >= 0) & (frame.opp_age <= 20))]:
+        records[key] = insights_generator._record(frame, mask)
+    for surface in ('Hard', 'Clay', 'Grass'):
+        records[f"surface_{surface}"] = insights_generator._record(frame, frame.surface_mask(surface))
+    for round_code in ('R32', 'R16', 'QF', 'SF', 'F'):
+        records[f"round_{round_code}"] = insights_generator._record(frame, frame.round_mask(round_code))
+    for country in ('USA', 'ESP', 'FRA', 'GER', 'ITA'):
+        records[f"country_{country}"] = insights_generator._record(frame, frame.opp_country == country)
+    return {k: v for k, v in records.items() if sum(v)}
+
+
+def loop_export_counts(matches, player_id):
+    """Record / upsets / 3-set / tiebreak counters of export_players_excel.calculate_metrics."""
+    wins = losses = upsets = three_set_wins = three_set_losses = tb_wins = tb_losses = 0
+    for m in sorted(matches, key=lambda x: x['date'] if x['date'] else '', reverse=True):
+        is_winner = str(m['winner_id']) == str(player_id)
+        is_loser = str(m['loser_id']) == str(player_id)
+        opp_utr = m['loser_utr'] if is_winner else m['winner_utr']
+        my_utr = m['winner_utr'] if is_winner else m['loser_utr']
+        sets = re.sub(r'\(\d+\)', '', m['score']).split() if m['score'] else []
+        for s in sets:
+            try:
+                p1, p2 = map(int, s.split('-')[:2])
+            except ValueError:
+                continue
+            if (p1, p2) in ((7, 6), (6, 7)):
+                if (p1 > p2) == is_winner:
+                    tb_wins += 1
+                else:
+                    tb_losses += 1
+        if is_winner:
+            wins += 1
+            three_set_wins += len(sets) >= 3
+            if opp_utr and my_utr and opp_utr > my_utr:
+                upsets += 1
+        elif is_loser:
+            losses += 1
+            three_set_losses += len(sets) >= 3
+    three_set_str = f"{three_set_wins}W-{three_set_losses}L"
+    if three_set_wins + three_set_losses > 0:
+        three_set_str += f" ({int(three_set_wins/(three_set_wins + three_set_losses)*100)}%)"
+    return {
+        'Record': f"{wins}W-{losses}L",
+        'Upset Ratio': f"{upsets}/{wins} ({int(upsets/wins*100)}%)" if wins > 0 else "0/0",
+        '3-Set Record': three_set_str,
+        'Tiebreak Record': f"{tb_wins}W-{tb_losses}L",
+    }
+
+
+def run_loops(matches):
+    return (
+        loop_form_rating(matches, PLAYER_ID),
+        loop_advanced_metrics(matches, PLAYER_ID),
+        loop_insight_records(matches, PLAYER_ID),
+        loop_export_counts(matches, PLAYER_ID),
+    )
+
+
+def run_frame(matches):
+    frame = MatchFrame.from_matches(matches, PLAYER_ID)
+    export = export_players_excel.calculate_metrics(PLAYER_ID, frame, [], None)
+    return (
+        analysis.calculate_form_rating(frame, PLAYER_ID),
+        analysis.calculate_advanced_metrics(frame, PLAYER_ID),
+        frame_insight_records(frame),
+        {k: export[k] for k in ('Record', 'Upset Ratio', '3-Set Record', 'Tiebreak Record')},
+    )
+
+
+def run_frame_metrics(frame):
+    """Metrics on an already-built frame (what AnalysisContext.frame reuses per request)."""
+    analysis.calculate_form_rating(frame, PLAYER_ID)
+    analysis.calculate_advanced_metrics(frame, PLAYER_ID)
+    frame_insight_records(frame)
+    export_players_excel.calculate_metrics(PLAYER_ID, frame, [], None)
+
+
+def time_it(fn, matches, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(matches)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loop vs MatchFrame player metrics")
+    parser.add_argument('--matches', type=int, default=3000, help='Career length (matches)')
+    parser.add_argument('--repeat', type=int, default=10, help='Timing repetitions (best of)')
+    args = parser.parse_args()
+
+    matches = make_career(args.matches)
+    print(f"Synthetic career: {len(matches)} matches")
+
+    loop_result = run_loops(matches)
+    frame_result = run_frame(matches)
+    for name, a, b in zip(('form', 'advanced', 'insight records', 'export counts'), loop_result, frame_result):
+        status = "OK" if a == b else f"MISMATCH\n  loop:  {a}\n  frame: {b}"
+        print(f"  {name:16s} {status}")
+
+    loop_time = time_it(run_loops, matches, args.repeat)
+    frame_time = time_it(run_frame, matches, args.repeat)
+    frame = MatchFrame.from_matches(matches, PLAYER_ID)
+    metrics_time = time_it(lambda _: run_frame_metrics(frame), matches, args.repeat)
+
+    print(f"\nDict loops:                    {loop_time * 1000:8.2f} ms")
+    print(f"MatchFrame (build + metrics):  {frame_time * 1000:8.2f} ms  ({loop_time / frame_time:.1f}x)")
+    print(f"MatchFrame (metrics only):     {metrics_time * 1000:8.2f} ms  ({loop_time / metrics_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Bracket Simulator - Monte Carlo title odds for single-elimination draws.
+
+Builds a pairwise win-probability matrix for the draw (in-house Elo when both
+players have enough rated matches, else the UTR logistic model used by
+predict_match_outcome) and plays every simulated bracket at once: each
+round is one NumPy step over an (n_simulations, slots) array of survivors.
+100k brackets of a 128 draw take a fraction of a second.
+
+Draws come either from a posted list of player ids (draw order, None = bye)
+or from a tournament's matches, where the bracket order is rebuilt from who
+met whom and matches already played are fixed results.
+"""
+
+import numpy as np
+import tennis_db
+from elo_engine import elo_ratings, expected_score, SURFACE_WEIGHT
+
+DEFAULT_SIMULATIONS = 100000
+MAX_SIMULATIONS = 1000000
+
+# Brackets simulated per NumPy pass (bounds memory at ~SIMULATION_BATCH x draw size)
+SIMULATION_BATCH = 100000
+
+# Largest draw accepted (a 128 draw is the biggest real bracket)
+MAX_DRAW_SIZE = 128
+
+# Elo is only trusted once both players have this many rated matches
+MIN_ELO_MATCHES = 10
+
+# UTR logistic slope (same as analysis_advanced.predict_match_outcome)
+UTR_K = 1.5
+
+BYE = None
+
+# Round label by number of players entering it
+ROUND_SIZES = {'R128': 128, 'R64': 64, 'R32': 32, 'R16': 16, 'QF': 8, 'SF': 4, 'F': 2}
+_ROUND_BY_SIZE = {size: name for name, size in ROUND_SIZES.items()}
+
+
+def round_labels(draw_size):
+    """Labels for reaching each round, e.g. 8 -> ['QF', 'SF', 'F', 'W']."""
+    labels = []
+    size = draw_size
+    while size >= 2:
+        labels.append(_ROUND_BY_SIZE.get(size, f"R{size}"))
+        size //= 2
+    return labels + ['W']
+
+
+def win_probability_matrix(players, surface=None):
+    """
+    players: list of dicts with player_id and utr_singles.
+    Returns (P, sources): P[i, j] = P(i beats j); sources[i, j] True where Elo was used.
+    """
+    elo_ratings.ensure_fresh()
+    n = len(players)
+    utr = np.array([p.get('utr_singles') or 0.0 for p in players], dtype=np.float64)
+    utr_prob = 1.0 / (1.0 + np.exp(-UTR_K * (utr[:, None] - utr[None, :])))
+
+    elo = np.full(n, np.nan)
+    for i, p in enumerate(players):
+        lines = elo_ratings.get(p['player_id'])
+        if lines and lines.get('all', (None, 0))[1] >= MIN_ELO_MATCHES:
+            elo[i] = elo_ratings.rating(p['player_id'], surface)
+    rated = ~np.isnan(elo)
+    use_elo = rated[:, None] & rated[None, :]
+    elo_prob = expected_score(np.nan_to_num(elo)[:, None], np.nan_to_num(elo)[None, :])
+
+    P = np.where(use_elo, elo_prob, utr_prob)
+    np.fill_diagonal(P, 0.5)
+    return P, use_elo
+
+
+def simulate_bracket(P, slots, simulations=DEFAULT_SIMULATIONS, seed=None):
+    """
+    P: (n, n) win probabilities; slots: draw order as player indices (-1 = bye), length a power of two.
+    Returns (rounds, n) array: probability of each player reaching each round (last row = title).
+    """
+    n = P.shape[0]
+    bye = n
+    # Extended matrix: anyone beats a bye; a bye never wins (bye vs bye stays a bye)
+    P_ext = np.zeros((n + 1, n + 1))
+    P_ext[:n, :n] = P
+    P_ext[:n, bye] = 1.0
+
+    rng = np.random.default_rng(seed)
+    dtype = np.int16 if n < np.iinfo(np.int16).max else np.int32
+    slots = np.where(np.asarray(slots) < 0, bye, slots).astype(dtype)
+
+    rounds = int(np.log2(len(slots)))
+    counts = np.zeros((rounds, n + 1))
+    for done in range(0, simulations, SIMULATION_BATCH):
+        batch = min(SIMULATION_BATCH, simulations - done)
+        alive = np.broadcast_to(slots, (batch, len(slots)))
+        for r in range(rounds):
+            a, b = alive[:, 0::2], alive[:, 1::2]
+            a_wins = rng.random(a.shape) < P_ext[a, b]
+            alive = np.where(a_wins, a, b)
+            counts[r] += np.bincount(alive.ravel(), minlength=n + 1)
+    reach = [np.bincount(slots, minlength=n + 1)[:n].astype(np.float64)]
+    return np.vstack(reach + [c[:n] / simulations for c in counts])
+
+
+def _pad_draw(slots):
+    size = 2
+    while size < len(slots):
+        size *= 2
+    return list(slots) + [BYE] * (size - len(slots))
+
+
+def draw_from_matches(matches):
+    """
+    Rebuild draw order from a tournament's matches (dicts with round, winner_id, loser_id).
+    Players who met in a later round end up in adjacent halves; unplayed parts of the
+    bracket keep the order the earlier matches were listed in.
+    Returns (slots, results) - slots padded with BYE to a power of two, results = [(winner, loser)].
+    """
+    rounds = [r for r in sorted(ROUND_SIZES, key=ROUND_SIZES.get, reverse=True)
+              if any(m.get('round') == r for m in matches)]
+    results = [(str(m['winner_id']), str(m['loser_id'])) for m in matches
+               if m.get('round') in ROUND_SIZES and m.get('winner_id') and m.get('loser_id')]
+    if not rounds:
+        return [], results
+    draw_size = ROUND_SIZES[rounds[0]]
+
+    groups = []         # contiguous blocks of the draw, in order
+    for rnd in rounds:
+        block = draw_size // ROUND_SIZES[rnd]
+        round_matches = [(str(m['winner_id']), str(m['loser_id'])) for m in matches
+                         if m.get('round') == rnd and m.get('winner_id') and m.get('loser_id')]
+        placed = {pid for g in groups for pid in g}
+        for w, l in round_matches:
+            for pid in (w, l):
+                if pid not in placed:
+                    # Entered in this round (bye / qualifier): fill the earlier rounds with byes
+                    groups.append([pid] + [BYE] * (block - 1))
+                    placed.add(pid)
+
+        owner = {pid: i for i, g in enumerate(groups) for pid in g if pid is not BYE}
+        partner = {}
+        for w, l in round_matches:
+            gw, gl = owner[w], owner[l]
+            if gw != gl:
+                partner[gw], partner[gl] = gl, gw
+
+        merged, leftovers, used = [], [], set()
+        for i, g in enumerate(groups):
+            if i in used:
+                continue
+            j = partner.get(i)
+            # Inconsistent data (a player in two matches of a round) falls back to draw order
+            if j is not None and j not in used and partner.get(j) == i:
+                used.update((i, j))
+                merged.append(g + groups[j])
+            else:
+                leftovers.append(g)
+        # Unplayed matches of this round: pair the remaining blocks in order
+        for k in range(0, len(leftovers), 2):
+            pair = leftovers[k:k + 2]
+            merged.append(pair[0] + (pair[1] if len(pair) > 1 else [BYE] * len(pair[0])))
+        groups = merged
+
+    slots = [pid for g in groups for pid in g]
+    return _pad_draw(slots), results
+
+
+def forecast(player_slots, conn=None, surface=None, simulations=DEFAULT_SIMULATIONS, seed=None, results=None):
+    """
+    Title / round odds for a draw.
+    player_slots: player ids in draw order (None or '' = bye); results: known (winner, loser) pairs.
+    """
+    simulations = max(1, min(int(simulations), MAX_SIMULATIONS))
+    if len(player_slots) > MAX_DRAW_SIZE:
+        return {'error': f'A draw has at most {MAX_DRAW_SIZE} slots'}
+    slots = _pad_draw([str(p) if p else BYE for p in player_slots])
+    ids = list(dict.fromkeys(p for p in slots if p is not BYE))
+    if len(ids) < 2:
+        return {'error': 'A draw needs at least two players'}
+    if len(ids) != sum(p is not BYE for p in slots):
+        return {'error': 'A player appears more than once in the draw'}
+
+    own_conn = conn is None
+    if own_conn:
+        conn = tennis_db.get_connection()
+    try:
+        placeholders = ','.join(['?'] * len(ids))
+        rows = conn.execute(
+            f"SELECT player_id, name, utr_singles FROM players WHERE player_id IN ({placeholders})", ids
+        ).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    known = {str(r[0]): {'player_id': str(r[0]), 'name': r[1], 'utr_singles': r[2]} for r in rows}
+    players = [known.get(pid, {'player_id': pid, 'name': None, 'utr_singles': None}) for pid in ids]
+    index = {pid: i for i, pid in enumerate(ids)}
+
+    P, used_elo = win_probability_matrix(players, surface)
+    for winner, loser in results or []:
+        if winner in index and loser in index:
+            P[index[winner], index[loser]] = 1.0
+            P[index[loser], index[winner]] = 0.0
+
+    reach = simulate_bracket(P, [index[p] if p is not BYE else -1 for p in slots], simulations, seed)
+    labels = round_labels(len(slots))
+
+    data = []
+    for i, p in enumerate(players):
+        data.append({
+            'player_id': p['player_id'],
+            'name': p['name'],
+            'utr': p['utr_singles'],
+            'elo': round(elo_ratings.rating(p['player_id'], surface), 1) if elo_ratings.get(p['player_id']) else None,
+            'draw_position': slots.index(p['player_id']) + 1,
+            'rounds': {label: round(float(reach[r, i]), 4) for r, label in enumerate(labels)},
+            'title_probability': round(float(reach[-1, i]) * 100, 2),
+        })
+    data.sort(key=lambda d: d['title_probability'], reverse=True)
+    return {
+        'draw_size': len(slots),
+        'simulations': simulations,
+        'surface': surface,
+        'rounds': labels,
+        'model': f"Elo (surface weight {SURFACE_WEIGHT}) where both players have {MIN_ELO_MATCHES}+ rated matches, else UTR logistic (k={UTR_K})",
+        'elo_pairs': round(float(used_elo.mean()), 3),
+        'fixed_results': len(results or []),
+        'data': data,
+    }
@@ -0,0 +1,148 @@
+"""
+Cohort Index - In-memory rating distributions for age cohort percentiles.
+
+Holds sorted NumPy arrays of utr_singles per (age, gender) and per
+(country, age, gender), so percentile, mean, max and rank lookups are
+binary searches instead of aggregate queries over the players table.
+The index is rebuilt whenever the players data version changes.
+"""
+
+import threading
+import time
+import numpy as np
+import tennis_db
+
+# How often (seconds) to poll data_versions for changes
+VERSION_CHECK_INTERVAL = 5.0
+
+
+class _Cohort:
+    """Sorted ratings (ascending) with the matching player ids."""
+    __slots__ = ('ratings', 'player_ids', 'mean')
+
+    def __init__(self, ratings, player_ids):
+        order = np.argsort(ratings, kind='stable')
+        self.ratings = ratings[order]
+        self.player_ids = player_ids[order]
+        self.mean = float(self.ratings.mean()) if len(self.ratings) else 0.0
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def count_below(self, utr):
+        return int(np.searchsorted(self.ratings, utr, side='left'))
+
+    def count_above(self, utr):
+        return len(self.ratings) - int(np.searchsorted(self.ratings, utr, side='right'))
+
+    def in_range(self, min_utr, max_utr):
+        lo = np.searchsorted(self.ratings, min_utr, side='left')
+        hi = np.searchsorted(self.ratings, max_utr, side='right')
+        return self.ratings[lo:hi], self.player_ids[lo:hi]
+
+
+class CohortIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._by_age = {}        # (age, gender) -> _Cohort; gender None = all genders
+        self._by_country = {}    # (country, age, gender) -> _Cohort
+
+    def build(self, conn):
+        """Load all rated players with a known age and rebuild the sorted arrays."""
+        start = time.time()
+        version = tennis_db.get_data_version(conn, 'players')
+        rows = conn.execute("""
+            SELECT player_id, age, gender, country, utr_singles
+            FROM players
+            WHERE age IS NOT NULL AND utr_singles > 0
+        """).fetchall()
+
+        groups = {}
+        national = {}
+        for player_id, age, gender, country, utr in rows:
+            groups.setdefault((age, gender), []).append((utr, player_id))
+            # Players without a gender are already in the all-genders cohort
+            if gender is not None:
+                groups.setdefault((age, None), []).append((utr, player_id))
+            if country:
+                national.setdefault((country, age, gender), []).append((utr, player_id))
+
+        def to_cohorts(grouped):
+            cohorts = {}
+            for key, items in grouped.items():
+                ratings = np.fromiter((u for u, _ in items), dtype=np.float64, count=len(items))
+                ids = np.array([pid for _, pid in items], dtype=object)
+                cohorts[key] = _Cohort(ratings, ids)
+            return cohorts
+
+        by_age = to_cohorts(groups)
+        by_country = to_cohorts(national)
+
+        with self._lock:
+            self._by_age = by_age
+            self._by_country = by_country
+            self._version = version
+            self._checked_at = time.time()
+
+        print(f"CohortIndex: indexed {len(rows)} players into {len(by_age)} cohorts in {time.time() - start:.2f}s")
+
+    def ensure_fresh(self, conn=None):
+        """Rebuild if the players table changed since the last build (polled at most every few seconds)."""
+        now = time.time()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+
+        # Only the first build blocks; later rebuilds serve the old arrays meanwhile
+        if not self._build_lock.acquire(blocking=self._version is None):
+            return
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = tennis_db.get_connection()
+            version = tennis_db.get_data_version(conn, 'players')
+            self._checked_at = now
+            if version != self._version:
+                self.build(conn)
+        finally:
+            if own_conn and conn is not None:
+                conn.close()
+            self._build_lock.release()
+
+    def cohort_stats(self, age, gender, utr):
+        """Mean, max, percentile and rank of a UTR within an (age, gender) cohort."""
+        cohort = self._by_age.get((age, gender))
+        if not cohort or len(cohort) == 0:
+            return None
+
+        total = len(cohort)
+        return {
+            'cohort_avg': cohort.mean,
+            'cohort_max': float(cohort.ratings[-1]),
+            'percentile': cohort.count_below(utr) / total * 100,
+            'rank': cohort.count_above(utr) + 1,
+            'total_peers': total
+        }
+
+    def national_rank(self, country, age, gender, utr):
+        """Rank of a UTR among players of the same country, age and gender."""
+        cohort = self._by_country.get((country, age, gender))
+        if not cohort or len(cohort) == 0:
+            return None
+        return {
+            'rank': cohort.count_above(utr) + 1,
+            'total': len(cohort)
+        }
+
+    def players_in_range(self, age, gender, min_utr, max_utr):
+        """(ratings, player_ids) of an (age, gender) cohort within a UTR band."""
+        cohort = self._by_age.get((age, gender))
+        if not cohort:
+            return np.empty(0), np.empty(0, dtype=object)
+        return cohort.in_range(min_utr, max_utr)
+
+
+# Singleton instance
+cohort_index = CohortIndex()
@@ -3,6 +3,11 @@ from config import UTR_CONFIG
 import logging
 import os
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import tennis_db
+from single_flight import single_flight
 
 # Configure logging
 logging.basicConfig(
@@ -35,19 +40,37 @@ def get_auth(force_refresh=False):
 
 import json
 
-# Cache for college data
+# Cache for college data (written by refresh_college_cache.py)
 COLLEGE_CACHE_FILE = 'college_data.json'
 COLLEGE_CACHE = {}
+_college_cache_mtime = None
+
+# Seconds a cached roster is served as fresh; older ones are served while being refetched
+ROSTER_TTL = float(os.getenv("ROSTER_TTL_HOURS", "24")) * 3600
+
+# Seconds between background prefetch passes over PREFETCH_DIVISIONS (0 = disabled)
+ROSTER_PREFETCH_INTERVAL = float(os.getenv("ROSTER_PREFETCH_INTERVAL", "21600"))
+PREFETCH_DIVISIONS = ('D1', 'D2')
+
+# Pause between prefetched rosters so the UTR API is not hammered
+PREFETCH_DELAY = 1.0
 
 def load_cache():
-    global COLLEGE_CACHE
-    if os.path.exists(COLLEGE_CACHE_FILE):
-        try:
-            with open(COLLEGE_CACHE_FILE, 'r') as f:
-                COLLEGE_CACHE = json.load(f)
-            logging.info(f"Loaded college cache with {sum(len(v) for v in COLLEGE_CACHE.values())} entries.")
-        except Exception as e:
-            logging.error(f"Failed to load college cache: {e}")
+    """(Re)load the college list when the cache file changed since the last load."""
+    global COLLEGE_CACHE, _college_cache_mtime
+    try:
+        mtime = os.path.getmtime(COLLEGE_CACHE_FILE)
+    except OSError:
+        return
+    if mtime == _college_cache_mtime:
+        return
+    try:
+        with open(COLLEGE_CACHE_FILE, 'r') as f:
+            COLLEGE_CACHE = json.load(f)
+        _college_cache_mtime = mtime
+        logging.info(f"Loaded college cache with {sum(len(v) for v in COLLEGE_CACHE.values())} entries.")
+    except Exception as e:
+        logging.error(f"Failed to load college cache: {e}")
 
 # Load cache on module import
 load_cache()
@@ -58,9 +81,8 @@ def search_colleges(query, division='D1', gender='M'):
     """
     logging.info(f"Searching colleges: query='{query}', division='{division}', gender='{gender}'")
     
-    # Reload cache if empty (maybe first run or file just created)
-    if not COLLEGE_CACHE:
-        load_cache()
+    # Pick up a refreshed (or newly created) cache file
+    load_cache()
 
     # Optimized Cache Search
     if division in COLLEGE_CACHE:
@@ -134,9 +156,9 @@ def search_colleges(query, division='D1', gender='M'):
             return []
     return []
 
-def get_roster(club_id, gender='M'):
+def fetch_roster(club_id, gender='M'):
     """
-    Get roster for a college.
+    Get roster for a college live from the UTR API.
     """
     logging.info(f"Fetching roster for club_id={club_id}, gender={gender}")
     
@@ -156,3 +178,124 @@ def get_roster(club_id, gender='M'):
                 continue
             return []
     return []
+
+def _cached_roster(club_id, gender):
+    """(roster, fetched_at) from the college_rosters table, or None."""
+    conn = tennis_db.get_pooled_connection()
+    row = conn.execute(
+        "SELECT roster, fetched_at FROM college_rosters WHERE club_id = ? AND gender = ?", (str(club_id), gender)
+    ).fetchone()
+    if not row:
+        return None
+    return json.loads(row[0]), row[1]
+
+def refresh_roster(club_id, gender='M'):
+    """Fetch a roster live and store it. Empty results (usually a failed fetch) never replace a cached roster."""
+    roster = fetch_roster(club_id, gender)
+    if roster:
+        conn = tennis_db.get_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO college_rosters (club_id, gender, roster, player_count, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (str(club_id), gender, json.dumps(roster), len(roster), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+    return roster
+
+_revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="roster-refresh")
+_revalidating = set()
+_revalidate_lock = threading.Lock()
+
+def _revalidate(club_id, gender):
+    """Refetch a stale roster in the background (once at a time per club / gender)."""
+    key = (str(club_id), gender)
+    with _revalidate_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def run():
+        try:
+            refresh_roster(club_id, gender)
+        except Exception as e:
+            logging.error(f"Background roster refresh failed for {key}: {e}")
+        finally:
+            with _revalidate_lock:
+                _revalidating.discard(key)
+
+    _revalidate_executor.submit(run)
+
+def get_roster(club_id, gender='M'):
+    """
+    Get roster for a college. Served from the college_rosters cache; stale entries (older than
+    ROSTER_TTL) are returned as-is while a background refetch runs. Only a cold miss waits for the API.
+    """
+    cached = _cached_roster(club_id, gender)
+    if cached is not None:
+        roster, fetched_at = cached
+        if time.time() - fetched_at > ROSTER_TTL:
+            _revalidate(club_id, gender)
+        return roster
+    # Concurrent cold misses for the same club share one fetch
+    return single_flight.do('college_roster', (str(club_id), gender), lambda: refresh_roster(club_id, gender))
+
+def prefetch_targets(divisions=PREFETCH_DIVISIONS):
+    """(club_id, gender) of every cached college in `divisions`, using the gender-specific club ids."""
+    load_cache()
+    targets = []
+    for division in divisions:
+        for college in COLLEGE_CACHE.get(division, []):
+            base_id = college.get('clubId') or college.get('id')
+            for gender, key in (('M', 'mensClubId'), ('F', 'womensClubId')):
+                club_id = college.get(key) or base_id
+                if club_id:
+                    targets.append((str(club_id), gender))
+    return list(dict.fromkeys(targets))
+
+def prefetch_rosters(divisions=PREFETCH_DIVISIONS, delay=PREFETCH_DELAY, stop=None):
+    """Warm the roster cache for `divisions`, skipping rosters that are still fresh. Returns the number fetched."""
+    fetched = 0
+    for club_id, gender in prefetch_targets(divisions):
+        if stop is not None and stop.is_set():
+            break
+        cached = _cached_roster(club_id, gender)
+        if cached is not None and time.time() - cached[1] <= ROSTER_TTL:
+            continue
+        try:
+            if refresh_roster(club_id, gender):
+                fetched += 1
+        except Exception as e:
+            logging.error(f"Prefetch failed for club_id={club_id}, gender={gender}: {e}")
+        time.sleep(delay)
+    logging.info(f"Roster prefetch refreshed {fetched} rosters for {', '.join(divisions)}")
+    return fetched
+
+class RosterPrefetcher:
+    """Daemon thread running prefetch_rosters every interval."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, interval=ROSTER_PREFETCH_INTERVAL):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    prefetch_rosters(stop=self._stop)
+                except Exception as e:
+                    logging.error(f"Roster prefetch failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="roster-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+# Singleton instance
+roster_prefetcher = RosterPrefetcher()
@@ -0,0 +1,78 @@
+"""
+Downsample - Reduce long time series to a plottable number of points.
+
+Ranking and UTR charts only need a few hundred points to look identical to
+the full series. Both methods return sorted row indices into the input, so
+callers can take any parallel columns (dates, points, types) along with y.
+
+  lttb    Largest-Triangle-Three-Buckets: keeps the points that preserve the
+          visual shape (peaks, drops) - the default
+  minmax  lowest and highest point of each bucket - keeps every extreme
+"""
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, max_points):
+    """Indices of the max_points points picked by LTTB (first and last always kept)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max(max_points, 0)], dtype=np.int64)
+
+    # Interior points split into max_points - 2 buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], max(edges[b + 1], edges[b] + 1)
+        # Average of the next bucket (the last point for the final bucket)
+        if b + 2 < len(edges):
+            next_end = max(edges[b + 2], end + 1)
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - avg_x) * (y[start:end] - py) - (px - x[start:end]) * (avg_y - py))
+        previous = start + int(np.argmax(areas))
+        selected[b + 1] = previous
+    return selected
+
+
+def minmax_indices(x, y, max_points):
+    """Indices of the min and max y of each of (max_points - 2) // 2 buckets (first and last always kept)."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 4:
+        # No room for a bucket's min and max next to the endpoints
+        return np.array([0, n - 1][:max(max_points, 0)], dtype=np.int64)
+    buckets = (max_points - 2) // 2
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picked = {0, n - 1}
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            picked.add(start + int(np.argmin(y[start:end])))
+            picked.add(start + int(np.argmax(y[start:end])))
+    return np.array(sorted(picked), dtype=np.int64)
+
+
+def downsample_indices(x, y, max_points, method='lttb'):
+    """Row indices to keep (sorted). x must be ascending; max_points=None keeps everything."""
+    n = len(y)
+    if not max_points or max_points >= n:
+        return np.arange(n)
+    if method == 'minmax':
+        return minmax_indices(x, y, max_points)
+    if method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method: {method} (expected one of {', '.join(METHODS)})")
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Elo Engine - In-house overall and per-surface Elo ratings over the matches table.
+
+Replays matches in date order, one vectorized batch per day: every match of
+the day is scored against the ratings at the start of that day and the
+rating changes are summed per player (np.add.at). Ratings use the
+FiveThirtyEight-style decaying K factor, so new players move fast and
+established ones settle. Surface ratings are separate Elo lines updated only
+by matches on that surface; predictions blend overall and surface Elo.
+
+Results are stored in elo_ratings (current rating per player and surface)
+and elo_history (rating after each day a player played). Updates are
+incremental: only matches added since the last run (by matches rowid) are
+replayed on top of the stored ratings. elo_applied records every replayed
+match, so a REPLACEd match with unchanged result is skipped, while a changed
+result or a match dated before the last replayed day falls back to a full
+replay (Elo depends on match order).
+
+Usage:
+    python elo_engine.py --update
+    python elo_engine.py --full
+    python elo_engine.py --predict 12345 67890 --surface Clay
+"""
+
+import argparse
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import tennis_db
+
+INITIAL_RATING = 1500.0
+SURFACES = ('Hard', 'Clay', 'Grass', 'Carpet')
+OVERALL = 'all'
+
+# Weight of the surface rating in surface-specific predictions
+SURFACE_WEIGHT = 0.5
+
+# How often (seconds) the in-memory ratings poll data_versions for a new run
+VERSION_CHECK_INTERVAL = 30.0
+
+_SURFACE_CODES = {s.lower(): i for i, s in enumerate(SURFACES)}
+
+
+def k_factor(matches_played):
+    """K = 250 / (n + 5)^0.4 - large for new players, ~20-30 after a few hundred matches."""
+    return 250.0 / np.power(np.asarray(matches_played, dtype=np.float64) + 5.0, 0.4)
+
+
+def expected_score(rating_a, rating_b):
+    """Probability that a player rated rating_a beats one rated rating_b."""
+    return 1.0 / (1.0 + np.power(10.0, (np.asarray(rating_b) - np.asarray(rating_a)) / 400.0))
+
+
+def surface_code(surface):
+    return _SURFACE_CODES.get((surface or '').strip().lower(), -1)
+
+
+class EloState:
+    """Ratings as arrays indexed by player position; row 0 of `rating` is overall, rows 1.. the SURFACES."""
+
+    def __init__(self):
+        self.ids = []
+        self.index = {}
+        self.rating = np.empty((len(SURFACES) + 1, 0))
+        self.played = np.empty((len(SURFACES) + 1, 0), dtype=np.int64)
+        self.last_date = np.empty((len(SURFACES) + 1, 0), dtype=object)
+
+    def positions(self, player_ids):
+        """Array positions for player ids, adding unseen players at INITIAL_RATING."""
+        new = [pid for pid in dict.fromkeys(player_ids) if pid not in self.index]
+        if new:
+            for pid in new:
+                self.index[pid] = len(self.ids)
+                self.ids.append(pid)
+            rows = self.rating.shape[0]
+            self.rating = np.hstack([self.rating, np.full((rows, len(new)), INITIAL_RATING)])
+            self.played = np.hstack([self.played, np.zeros((rows, len(new)), dtype=np.int64)])
+            self.last_date = np.hstack([self.last_date, np.full((rows, len(new)), None, dtype=object)])
+        return np.array([self.index[pid] for pid in player_ids], dtype=np.int64)
+
+    @classmethod
+    def load(cls, conn):
+        state = cls()
+        rows = conn.execute("SELECT player_id, surface, rating, matches, last_date FROM elo_ratings").fetchall()
+        if not rows:
+            return state
+        pos = state.positions([r[0] for r in rows])
+        for p, (_, surface, rating, played, last_date) in zip(pos, rows):
+            row = 0 if surface == OVERALL else surface_code(surface) + 1
+            if row < 0:
+                continue
+            state.rating[row, p] = rating
+            state.played[row, p] = played
+            state.last_date[row, p] = last_date
+        return state
+
+
+def _apply_day(rating, played, winners, losers):
+    """One simultaneous Elo update for all matches of a day on one rating line."""
+    expected = expected_score(rating[winners], rating[losers])
+    surprise = 1.0 - expected
+    delta = np.zeros_like(rating)
+    np.add.at(delta, winners, k_factor(played[winners]) * surprise)
+    np.add.at(delta, losers, -k_factor(played[losers]) * surprise)
+    rating += delta
+    np.add.at(played, winners, 1)
+    np.add.at(played, losers, 1)
+
+
+def replay(state, matches):
+    """
+    Apply matches (rowid, date, winner_id, loser_id, surface, ...), sorted by date, to state.
+    Returns history rows (player_id, surface, date, rating) for every day a player played.
+    """
+    history = []
+    if not matches:
+        return history
+    days = [m[1][:10] for m in matches]
+    winners_all = state.positions([str(m[2]) for m in matches])
+    losers_all = state.positions([str(m[3]) for m in matches])
+    surfaces_all = np.array([surface_code(m[4]) for m in matches], dtype=np.int64)
+
+    # Day boundaries (matches are date-sorted)
+    starts = [0] + [i for i in range(1, len(days)) if days[i] != days[i - 1]] + [len(days)]
+    for start, end in zip(starts[:-1], starts[1:]):
+        day = days[start]
+        winners, losers = winners_all[start:end], losers_all[start:end]
+        surfaces = surfaces_all[start:end]
+        lines = [(0, winners, losers)]
+        for code in np.unique(surfaces[surfaces >= 0]):
+            on_surface = surfaces == code
+            lines.append((int(code) + 1, winners[on_surface], losers[on_surface]))
+        for row, w, l in lines:
+            _apply_day(state.rating[row], state.played[row], w, l)
+            touched = np.unique(np.concatenate([w, l]))
+            state.last_date[row, touched] = day
+            label = OVERALL if row == 0 else SURFACES[row - 1]
+            history.extend((state.ids[p], label, day, round(float(state.rating[row, p]), 1)) for p in touched)
+    return history
+
+
+def _get_state(conn, key):
+    row = conn.execute("SELECT value FROM elo_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _signature(match):
+    """What a replay of (rowid, date, winner_id, loser_id, surface, match_id) depends on."""
+    return f"{match[1][:10]}|{match[2]}|{match[3]}|{surface_code(match[4])}"
+
+
+def _new_matches(conn, last_rowid):
+    return conn.execute("""
+        SELECT rowid, date, winner_id, loser_id, surface, match_id FROM matches
+        WHERE rowid > ? AND date IS NOT NULL AND date != ''
+          AND winner_id IS NOT NULL AND loser_id IS NOT NULL
+        ORDER BY substr(date, 1, 10), rowid
+    """, (last_rowid,)).fetchall()
+
+
+def _needs_full_replay(conn, matches):
+    """
+    Drop matches already replayed unchanged (REPLACE gives them a new rowid) from `matches`
+    and return True if the rest cannot be replayed on top of the stored ratings: a replayed
+    match changed, or a new match is dated before the last replayed day.
+    """
+    last_day = _get_state(conn, 'last_day') or ''
+    applied = {}
+    ids = [str(m[5]) for m in matches]
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        applied.update(conn.execute(
+            f"SELECT match_id, signature FROM elo_applied WHERE match_id IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    fresh = []
+    for m in matches:
+        previous = applied.get(str(m[5]))
+        if previous == _signature(m):
+            continue
+        if previous is not None or m[1][:10] < last_day:
+            return True
+        fresh.append(m)
+    matches[:] = fresh
+    return False
+
+
+def update_ratings(conn, full=False):
+    """Replay new matches (all matches with full=True) and persist ratings and history."""
+    start = time.time()
+    c = conn.cursor()
+    last_rowid = 0 if full else int(_get_state(conn, 'last_rowid') or 0)
+    if last_rowid and not c.execute("SELECT 1 FROM elo_applied LIMIT 1").fetchone():
+        # Ratings from before elo_applied was kept: replay once to record what was applied
+        full, last_rowid = True, 0
+
+    matches = _new_matches(conn, last_rowid)
+    max_rowid = max((m[0] for m in matches), default=last_rowid)
+    if not full and _needs_full_replay(conn, matches):
+        print("Elo: replaced or back-dated matches, replaying all matches")
+        full = True
+        matches = _new_matches(conn, 0)
+        max_rowid = max((m[0] for m in matches), default=0)
+    if not matches:
+        if max_rowid != last_rowid:
+            c.execute("INSERT OR REPLACE INTO elo_state (key, value) VALUES ('last_rowid', ?)", (str(max_rowid),))
+            conn.commit()
+        print("Elo: no new matches")
+        return 0
+
+    state = EloState() if full else EloState.load(conn)
+    history = replay(state, matches)
+
+    # Changed (player, line) pairs only
+    touched = {(pid, surface) for pid, surface, _, _ in history}
+    rows = []
+    for pid, surface in touched:
+        p = state.index[pid]
+        row = 0 if surface == OVERALL else SURFACES.index(surface) + 1
+        rows.append((pid, surface, round(float(state.rating[row, p]), 1), int(state.played[row, p]), state.last_date[row, p]))
+
+    if full:
+        c.execute("DELETE FROM elo_ratings")
+        c.execute("DELETE FROM elo_history")
+        c.execute("DELETE FROM elo_applied")
+    c.executemany("INSERT OR REPLACE INTO elo_applied (match_id, signature) VALUES (?, ?)",
+                  [(str(m[5]), _signature(m)) for m in matches])
+    c.executemany("""
+        INSERT OR REPLACE INTO elo_ratings (player_id, surface, rating, matches, last_date)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    c.executemany("INSERT OR REPLACE INTO elo_history (player_id, surface, date, rating) VALUES (?, ?, ?, ?)", history)
+    c.execute("INSERT OR REPLACE INTO elo_state (key, value) VALUES ('last_rowid', ?)", (str(max_rowid),))
+    # Date-sorted, and never before the previous last_day (else it was a full replay)
+    c.execute("INSERT OR REPLACE INTO elo_state (key, value) VALUES ('last_day', ?)", (matches[-1][1][:10],))
+    c.execute("INSERT OR REPLACE INTO elo_state (key, value) VALUES ('updated_at', ?)", (datetime.now().isoformat(),))
+    tennis_db.bump_version(conn, 'elo_ratings')
+    conn.commit()
+    print(f"Elo: replayed {len(matches)} matches, updated {len(rows)} ratings in {time.time() - start:.1f}s")
+    return len(matches)
+
+
+class EloRatings:
+    """Current ratings held in memory for request-time predictions (no queries per call)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._ratings = {}      # player_id -> {line: (rating, matches)}
+
+    def ensure_fresh(self, conn=None):
+        now = time.time()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        own_conn = conn is None
+        if own_conn:
+            conn = tennis_db.get_connection()
+        try:
+            version = tennis_db.get_data_version(conn, 'elo_ratings')
+            self._checked_at = now
+            if version == self._version:
+                return
+            ratings = {}
+            try:
+                rows = conn.execute("SELECT player_id, surface, rating, matches FROM elo_ratings").fetchall()
+            except Exception:
+                rows = []
+            for pid, surface, rating, played in rows:
+                ratings.setdefault(pid, {})[surface] = (rating, played)
+            with self._lock:
+                self._ratings = ratings
+                self._version = version
+        finally:
+            if own_conn:
+                conn.close()
+
+    def get(self, player_id):
+        """{'all': (rating, matches), 'Hard': ..., ...} or None if the player has no rated matches."""
+        return self._ratings.get(str(player_id))
+
+    def rating(self, player_id, surface=None):
+        """Overall Elo, or the overall/surface blend when surface is given (None if unrated)."""
+        lines = self.get(player_id)
+        if not lines or OVERALL not in lines:
+            return None
+        overall = lines[OVERALL][0]
+        if surface and surface_code(surface) >= 0:
+            on_surface = lines.get(SURFACES[surface_code(surface)])
+            surface_rating = on_surface[0] if on_surface else INITIAL_RATING
+            return (1 - SURFACE_WEIGHT) * overall + SURFACE_WEIGHT * surface_rating
+        return overall
+
+    def predict(self, player1_id, player2_id, surface=None):
+        """P(player1 beats player2), or None if either player is unrated."""
+        r1 = self.rating(player1_id, surface)
+        r2 = self.rating(player2_id, surface)
+        if r1 is None or r2 is None:
+            return None
+        return float(expected_score(r1, r2))
+
+
+# Singleton instance
+elo_ratings = EloRatings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='In-house overall / surface Elo ratings')
+    parser.add_argument('--update', action='store_true', help='Replay matches added since the last run')
+    parser.add_argument('--full', action='store_true', help='Recompute all ratings from scratch')
+    parser.add_argument('--predict', nargs=2, metavar=('PLAYER1', 'PLAYER2'), help='Win probability of PLAYER1')
+    parser.add_argument('--surface', help='Surface for --predict (Hard, Clay, Grass, Carpet)')
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.update or args.full:
+            update_ratings(conn, full=args.full)
+        if args.predict:
+            elo_ratings.ensure_fresh(conn)
+            p1, p2 = args.predict
+            prob = elo_ratings.predict(p1, p2, args.surface)
+            if prob is None:
+                print("One of the players has no Elo rating yet (run --update)")
+            else:
+                print(f"{p1} ({elo_ratings.rating(p1, args.surface):.0f}) vs {p2} ({elo_ratings.rating(p2, args.surface):.0f}): "
+                      f"{prob * 100:.1f}% for {p1}")
+        if not (args.update or args.full or args.predict):
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
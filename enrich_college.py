@@ -2,6 +2,7 @@ import sqlite3
 import requests
 import json
 import time
+import tennis_db
 from import_players import login, process_player, get_v2_profile
 
 def enrich_existing_players():
@@ -99,6 +100,7 @@ def enrich_existing_players():
                     SET college_name = ?, college_id = ?, grad_year = ?, is_active_college = ?
                     WHERE player_id = ?
                 """, (college_name, college_id, grad_year, is_active_int, pid))
+                tennis_db.bump_version(conn, 'players')
                 conn.commit()
                 print(f" UPDATED! College: {college_name}, Active: {is_active_college}")
                 total_updated += 1
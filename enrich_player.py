@@ -1,6 +1,7 @@
 import sqlite3
 import requests
 import json
+import tennis_db
 from config import UTR_CONFIG
 
 LOGIN_URL = "https://app.utrsports.net/api/v1/auth/login"
@@ -65,6 +66,7 @@ def enrich_player(player_id, division=None):
         c.execute("INSERT INTO players (player_id, name, college_name, is_active_college, division) VALUES (?, ?, ?, 1, ?)", 
                   (player_id, name, college_name, division.upper() if division else None))
     
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
     conn.close()
     print("Updated successfully.")
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Export Columnar - Parquet snapshots of the core tables for analysis notebooks.
+
+Streams matches, players, utr_history and rankings out of SQLite in chunks
+into Hive-partitioned Parquet files, so notebooks can read them with
+pyarrow.dataset / pandas / DuckDB instead of querying the live database:
+
+    <out>/matches/year=2023/tour=atp/part-0.parquet
+    <out>/utr_history/year=2023/part-0.parquet
+    <out>/rankings/tour=wta/part-0.parquet
+    <out>/players/part-0.parquet
+
+Columns are typed from the table schema (ints, floats, booleans, date32 for
+dates) and low-cardinality strings (tournament, round, surface, country...)
+are dictionary-encoded, so they load as categoricals. Rankings are exported
+from ranking_series plus any unsynced rankings rows, so pruned weeks are
+included.
+
+Incremental mode (the default) keeps a manifest of each partition's row
+count and rowid fingerprint and rewrites only partitions that gained, lost or
+replaced rows since the last export; tables whose data_versions entry has not
+moved are skipped outright. Rows edited in place (e.g. import_sackmann
+--update-stats) do not change the fingerprint: run --full after such updates.
+
+Requires pyarrow (pip install pyarrow).
+
+Usage:
+    python export_columnar.py                      # incremental export to ./columnar
+    python export_columnar.py --full --out /data/columnar
+    python export_columnar.py --tables matches utr_history
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+import tennis_db
+from ranking_series import load_series
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+DEFAULT_OUTPUT_DIR = 'columnar'
+MANIFEST_FILE = '_manifest.json'
+
+# Rows fetched from SQLite per fetchmany() call
+CHUNK_ROWS = 50000
+
+# Rows buffered per partition before a row group is written
+ROW_GROUP_ROWS = 128000
+
+# Ranking ids decoded per load_series() call
+RANKING_PLAYERS_PER_CHUNK = 500
+
+# Partition key expressions (SQL)
+YEAR_EXPR = "CASE WHEN date GLOB '[0-9][0-9][0-9][0-9]*' THEN substr(date, 1, 4) ELSE 'unknown' END"
+MATCH_TOUR_EXPR = "CASE WHEN source LIKE 'sackmann-%' THEN substr(source, 10) ELSE 'utr' END"
+
+TABLES = {
+    'matches': {
+        'partition': (('year', YEAR_EXPR), ('tour', MATCH_TOUR_EXPR)),
+        'order_by': 'date',
+        'dates': ('date',),
+        'dictionary': ('tournament', 'round', 'source', 'surface', 'tourney_level'),
+    },
+    'utr_history': {
+        'partition': (('year', YEAR_EXPR),),
+        'order_by': None,       # no date index; rows are buffered per year instead
+        'dates': ('date',),
+        'dictionary': ('type',),
+    },
+    'players': {
+        'partition': (),
+        'order_by': None,
+        'dates': ('birth_date',),
+        'dictionary': ('country', 'gender', 'college', 'college_name', 'location', 'age_group',
+                       'grad_year', 'scout_category', 'pro_rank'),
+    },
+}
+
+
+def _arrow_type(decl_type):
+    decl = (decl_type or '').upper()
+    if 'INT' in decl:
+        return pa.int64()
+    if any(t in decl for t in ('REAL', 'FLOA', 'DOUB', 'NUMERIC')):
+        return pa.float64()
+    if 'BOOL' in decl:
+        return pa.bool_()
+    return pa.string()
+
+
+def _coerce(value, arrow_type):
+    """Best-effort conversion of a stray SQLite value (dynamic typing) to the column's type."""
+    if value is None or value == '':
+        return None
+    try:
+        if pa.types.is_integer(arrow_type):
+            return int(float(value))
+        if pa.types.is_floating(arrow_type):
+            return float(value)
+        if pa.types.is_boolean(arrow_type):
+            return bool(int(value))
+        return str(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _column_array(values, arrow_type, is_date=False, dictionary=False):
+    if is_date:
+        strings = pa.array([str(v)[:10] if v else None for v in values], type=pa.string())
+        parsed = pc.strptime(strings, format='%Y-%m-%d', unit='s', error_is_null=True)
+        return parsed.cast(pa.date32())
+    try:
+        array = pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        array = pa.array([_coerce(v, arrow_type) for v in values], type=arrow_type)
+    if dictionary:
+        array = array.dictionary_encode()
+    return array
+
+
+def table_schema(conn, table, spec):
+    """(column names, pyarrow schema) for a SQLite table."""
+    columns = [(r[1], r[2]) for r in conn.execute(f"PRAGMA table_info({table})")]
+    fields = []
+    for name, decl in columns:
+        if name in spec.get('dates', ()):
+            fields.append(pa.field(name, pa.date32()))
+        elif name in spec.get('dictionary', ()):
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(name, _arrow_type(decl)))
+    return [c[0] for c in columns], pa.schema(fields)
+
+
+def _to_record_batch(rows, schema):
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [r[i] for r in rows]
+        is_dict = pa.types.is_dictionary(field.type)
+        arrays.append(_column_array(
+            values,
+            field.type.value_type if is_dict else field.type,
+            is_date=pa.types.is_date32(field.type),
+            dictionary=is_dict,
+        ))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class PartitionWriter:
+    """Buffers rows per partition and writes them as row groups of one Parquet file each."""
+
+    def __init__(self, root, names, schema):
+        self.root = root
+        self.names = names
+        self.schema = schema
+        self._buffers = {}
+        self._writers = {}
+        self.rows = {}
+
+    def _path(self, key):
+        return os.path.join(self.root, key, 'part-0.parquet') if key else os.path.join(self.root, 'part-0.parquet')
+
+    def add(self, key, row):
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(row)
+        if len(buffer) >= ROW_GROUP_ROWS:
+            self._flush(key)
+
+    def _flush(self, key):
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        writer = self._writers.get(key)
+        if writer is None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = pq.ParquetWriter(path + '.tmp', self.schema, compression='zstd', use_dictionary=True)
+            self._writers[key] = writer
+        writer.write_batch(_to_record_batch(rows, self.schema))
+        self.rows[key] = self.rows.get(key, 0) + len(rows)
+
+    def close(self, prefix=''):
+        """Finish the partitions whose key starts with prefix (all by default): flush, close, move into place."""
+        keys = [k for k in set(self._buffers) | set(self._writers) if k.startswith(prefix)]
+        for k in keys:
+            self._flush(k)
+            writer = self._writers.pop(k, None)
+            if writer is not None:
+                writer.close()
+                os.replace(self._path(k) + '.tmp', self._path(k))
+
+
+def _partition_key(spec, values):
+    return '/'.join(f"{name}={value}" for (name, _), value in zip(spec['partition'], values))
+
+
+def partition_fingerprints(conn, table, spec):
+    """{partition key: [rows, max rowid, rowid sum]} from one GROUP BY over the table."""
+    exprs = [expr for _, expr in spec['partition']]
+    group = ', '.join(str(i + 1) for i in range(len(exprs)))
+    select = ', '.join(exprs + ['COUNT(*)', 'MAX(rowid)', 'SUM(rowid)'])
+    sql = f"SELECT {select} FROM {table}" + (f" GROUP BY {group}" if exprs else "")
+    result = {}
+    for row in conn.execute(sql):
+        if row[len(exprs)] == 0:
+            continue
+        result[_partition_key(spec, row[:len(exprs)])] = list(row[len(exprs):])
+    return result
+
+
+def _remove_partition(root, key):
+    path = os.path.join(root, key) if key else root
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    # Drop parent partition directories left empty (e.g. year=2019 after its last tour went)
+    parent = os.path.dirname(path)
+    while key and os.path.abspath(parent) != os.path.abspath(root) and os.path.isdir(parent) and not os.listdir(parent):
+        os.rmdir(parent)
+        parent = os.path.dirname(parent)
+
+
+def export_table(conn, table, out_dir, previous, full=False):
+    """Export one table; returns its manifest entry."""
+    spec = TABLES[table]
+    root = os.path.join(out_dir, table)
+    version = tennis_db.get_data_version(conn, table)
+    if not full and previous and previous.get('data_version') == version and os.path.isdir(root):
+        print(f"{table}: unchanged (data version {version})")
+        return previous
+
+    start = time.time()
+    fingerprints = partition_fingerprints(conn, table, spec)
+    old = {} if full or not previous else previous.get('partitions', {})
+    changed = {k for k, fp in fingerprints.items() if old.get(k) != fp}
+    for key in set(old) - set(fingerprints):
+        _remove_partition(root, key)
+    if full:
+        _remove_partition(root, '')
+
+    if changed:
+        names, schema = table_schema(conn, table, spec)
+        exprs = [expr for _, expr in spec['partition']]
+        select = ', '.join(exprs + [f'"{n}"' for n in names])
+        sql = f"SELECT {select} FROM {table}"
+        params = []
+        if exprs and len(changed) < len(fingerprints):
+            # Only scan the years that have a changed partition
+            years = sorted({k.split('/')[0].split('=', 1)[1] for k in changed})
+            sql += f" WHERE {exprs[0]} IN ({','.join(['?'] * len(years))})"
+            params = years
+        if spec['order_by']:
+            sql += f" ORDER BY {spec['order_by']}"
+
+        writer = PartitionWriter(root, names, schema)
+        cursor = conn.execute(sql, params)
+        n_keys = len(exprs)
+        current_year = None
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                key = _partition_key(spec, row[:n_keys])
+                if key not in changed:
+                    continue
+                # Date-ordered scans finish a year's partitions as soon as the next year starts
+                # ('unknown' rows - missing or odd dates - can sort at either end, so stay open)
+                if spec['order_by'] and n_keys and row[0] != current_year:
+                    if current_year not in (None, 'unknown'):
+                        writer.close(f"year={current_year}/")
+                    current_year = row[0]
+                writer.add(key, row[n_keys:])
+        writer.close()
+
+    total = sum(fp[0] for fp in fingerprints.values())
+    print(f"{table}: {total} rows in {len(fingerprints)} partitions, rewrote {len(changed)} "
+          f"in {time.time() - start:.1f}s")
+    return {'data_version': version, 'partitions': fingerprints, 'rows': total,
+            'exported_at': datetime.now().isoformat()}
+
+
+RANKINGS_SCHEMA_FIELDS = (
+    ('player_id', 'string'),
+    ('date', 'date32'),
+    ('rank', 'int32'),
+    ('points', 'int32'),
+    ('tours', 'int32'),
+)
+
+
+RANKING_TOUR_EXPR = ("CASE WHEN instr(player_id, '_') > 0 "
+                     "THEN substr(player_id, 1, instr(player_id, '_') - 1) ELSE 'unknown' END")
+
+
+def ranking_fingerprints(conn):
+    """{tour partition key: [series players, series points, last series update, rankings rows, max rowid, rowid sum]}."""
+    result = {}
+    for tour, players, points, updated in conn.execute(f"""
+            SELECT {RANKING_TOUR_EXPR}, COUNT(*), SUM(n), MAX(updated_at)
+            FROM ranking_series GROUP BY 1"""):
+        result[f"tour={tour}"] = [players, points, updated, 0, None, None]
+    for tour, rows, max_rowid, rowid_sum in conn.execute(f"""
+            SELECT {RANKING_TOUR_EXPR}, COUNT(*), MAX(rowid), SUM(rowid)
+            FROM rankings WHERE player_id IS NOT NULL GROUP BY 1"""):
+        result.setdefault(f"tour={tour}", [0, None, None, 0, None, None])[3:] = [rows, max_rowid, rowid_sum]
+    return result
+
+
+def _ranking_ids(conn, tour):
+    params = (tour, tour)
+    return sorted(r[0] for r in conn.execute(f"""
+        SELECT player_id FROM ranking_series WHERE {RANKING_TOUR_EXPR} = ?
+        UNION
+        SELECT player_id FROM rankings WHERE player_id IS NOT NULL AND {RANKING_TOUR_EXPR} = ?
+    """, params))
+
+
+def export_rankings(conn, out_dir, previous, full=False):
+    """Weekly rankings decoded from ranking_series plus unsynced rankings rows, partitioned by tour."""
+    root = os.path.join(out_dir, 'rankings')
+    version = tennis_db.get_data_version(conn, 'rankings', 'ranking_series')
+    if not full and previous and previous.get('data_version') == version and os.path.isdir(root):
+        print(f"rankings: unchanged (data version {version})")
+        return previous
+
+    start = time.time()
+    fingerprints = ranking_fingerprints(conn)
+    old = {} if full or not previous else previous.get('partitions', {})
+    old_rows = {} if full or not previous else previous.get('partition_rows', {})
+    changed = {k for k, fp in fingerprints.items() if old.get(k) != fp}
+    # Drop tours that are gone (with --full: any stray partition directory too)
+    stale = set(old) | (set(os.listdir(root)) if full and os.path.isdir(root) else set())
+    for key in stale - set(fingerprints):
+        _remove_partition(root, key)
+
+    schema = pa.schema([pa.field(name, getattr(pa, type_name)()) for name, type_name in RANKINGS_SCHEMA_FIELDS])
+    names = [name for name, _ in RANKINGS_SCHEMA_FIELDS]
+    # Each changed tour is written next to its current file and moved into place, so readers never see it missing
+    writer = PartitionWriter(root, names, schema)
+    players = 0
+    for key in sorted(changed):
+        ids = _ranking_ids(conn, key.split('=', 1)[1])
+        players += len(ids)
+        for i in range(0, len(ids), RANKING_PLAYERS_PER_CHUNK):
+            for player_id, series in load_series(conn, ids[i:i + RANKING_PLAYERS_PER_CHUNK]).items():
+                columns = series.to_columns()
+                for date, rank, points, tours in zip(columns['date'], columns['rank'], columns['points'], columns['tours']):
+                    writer.add(key, (player_id, date, rank, points, tours))
+        writer.close(key)
+        if not writer.rows.get(key):
+            _remove_partition(root, key)
+
+    partition_rows = {k: writer.rows.get(k, 0) if k in changed else old_rows.get(k, 0) for k in fingerprints}
+    total = sum(partition_rows.values())
+    print(f"rankings: {total} rows in {len(fingerprints)} partitions, rewrote {len(changed)} "
+          f"({players} players) in {time.time() - start:.1f}s")
+    return {'data_version': version, 'partitions': fingerprints, 'partition_rows': partition_rows,
+            'rows': total, 'exported_at': datetime.now().isoformat()}
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def export_columnar(out_dir=DEFAULT_OUTPUT_DIR, tables=None, full=False, conn=None):
+    """Export the given tables (default: all) and return the updated manifest."""
+    tables = tables or list(TABLES) + ['rankings']
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    own_conn = conn is None
+    if own_conn:
+        conn = tennis_db.get_connection()
+    try:
+        for table in tables:
+            previous = manifest.get(table)
+            if table == 'rankings':
+                manifest[table] = export_rankings(conn, out_dir, previous, full)
+            else:
+                manifest[table] = export_table(conn, table, out_dir, previous, full)
+            # Save after every table so an interrupted run keeps the finished ones
+            save_manifest(out_dir, manifest)
+    finally:
+        if own_conn:
+            conn.close()
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the core tables to partitioned Parquet files')
+    parser.add_argument('--out', default=DEFAULT_OUTPUT_DIR, help=f'Output directory (default ./{DEFAULT_OUTPUT_DIR})')
+    parser.add_argument('--tables', nargs='+', choices=list(TABLES) + ['rankings'], help='Tables to export (default: all)')
+    parser.add_argument('--full', action='store_true', help='Rewrite every partition instead of only the changed ones')
+    args = parser.parse_args()
+
+    if not PYARROW_AVAILABLE:
+        print("pyarrow is required for the columnar export: pip install pyarrow")
+        sys.exit(1)
+
+    tennis_db.init_db()
+    start = time.time()
+    export_columnar(args.out, args.tables, args.full)
+    print(f"Columnar export finished in {time.time() - start:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 
 import sqlite3
-import pandas as pd
 import argparse
+import glob
+import hashlib
+import json
 import os
 import re
 import sys
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
+import numpy as np
+from openpyxl import Workbook
 import tennis_db
+from match_frame import MatchFrame
+from batch_loader import PlayerBatch, UTRTrend
 
 # ============================================
 # ARGUMENTS (Moved to main)
@@ -25,173 +32,59 @@ def clean_sheet_name(name):
 def calculate_metrics(player_id, matches, history, current_utr):
     """
     Calculate metrics from match data (offline mode).
-    matches: list of match dicts
-    history: list of history dicts
+    matches: list of match dicts (or a MatchFrame)
+    history: list of history dicts (or a UTRTrend)
     current_utr: float
     """
-    wins = 0
-    losses = 0
-    upsets = 0
-    recent_form = []
+    frame = MatchFrame.of(matches, player_id)
+    is_win = frame.is_win
+    is_loss = frame.is_loss & ~is_win
+    played = is_win | is_loss
     
-    opponent_utrs = []
+    wins = int(is_win.sum())
+    losses = int(is_loss.sum())
     
-    # 3-set stats
-    three_set_wins = 0
-    three_set_losses = 0
+    # Opponent rated higher than me in this match (both UTRs known)
+    higher_rated = frame.opp_utr > frame.own_utr
+    upsets = int((is_win & higher_rated).sum())
+    hr_wins = upsets
+    hr_matches = int((played & higher_rated).sum())
     
-    # Tiebreak stats
-    tb_wins = 0
-    tb_losses = 0
-    
-    # Comeback wins
-    comeback_wins = 0
+    # 3-Set Record
+    is_three_set = frame.set_count >= 3
+    three_set_wins = int((is_win & is_three_set).sum())
+    three_set_losses = int((is_loss & is_three_set).sum())
     
-    # Higher rated stats
-    hr_wins = 0
-    hr_matches = 0
+    # Comeback wins: score is written Winner-Loser, so a won match with
+    # first set "4-6" means I dropped the first set
+    comeback_wins = int((is_win & (frame.set_l[:, 0] > frame.set_w[:, 0])).sum())
     
-    # Tournaments
-    tournaments = set()
+    # Tiebreaks (7-6 / 6-7 sets), oriented to the match winner
+    tb_won_by_winner = ((frame.set_w == 7) & (frame.set_l == 6)).sum(axis=1)
+    tb_won_by_loser = ((frame.set_w == 6) & (frame.set_l == 7)).sum(axis=1)
+    tb_wins = int(np.where(is_win, tb_won_by_winner, tb_won_by_loser).sum())
+    tb_losses = int(np.where(is_win, tb_won_by_loser, tb_won_by_winner).sum())
     
-    # Sort matches by date descending
-    sorted_matches = sorted(matches, key=lambda x: x['date'] if x['date'] else '', reverse=True)
+    # Recent Form (Last 10 played, newest first)
+    newest = frame.newest_first()
+    last_10 = frame.is_win[newest[played[newest]][:10]]
     
-    for m in sorted_matches:
-        is_winner = str(m['winner_id']) == str(player_id)
-        is_loser = str(m['loser_id']) == str(player_id)
-        
-        # Determine opponent UTR
-        opp_utr = m['loser_utr'] if is_winner else m['winner_utr']
-        my_utr_in_match = m['winner_utr'] if is_winner else m['loser_utr']
-        
-        if opp_utr:
-            opponent_utrs.append(opp_utr)
-        
-        if m['tournament']:
-            tournaments.add(m['tournament'])
-            
-        # Analyze Score
-        score = m['score']
-        sets = []
-        if score:
-            # Simple parser for scores like "6-4 3-6 10-8" or "6-4 7-6(4)"
-            # This is complex because score formats vary. simpler check first.
-            try:
-                # Remove brackets for TB score inside like (7)
-                clean_score = re.sub(r'\(\d+\)', '', score) 
-                parts = clean_score.split()
-                sets = parts
-            except: pass
-            
-        # 3-Set Record
-        is_three_set = len(sets) >= 3
-        
-        # Tiebreak Record & Comeback
-        has_tb = False
-        lost_first_set = False
-        
-        if sets:
-            # Parse first set
-            try:
-                s1 = sets[0]
-                if '-' in s1:
-                    g_w, g_l = map(int, s1.split('-')[:2])
-                    if is_winner:
-                        if g_w < g_l: lost_first_set = True
-                    else:
-                        if g_l < g_w: lost_first_set = True # 'g_w' here is set winner (opp) vs set loser (me) ? 
-                        # Actually score string is rarely consistent on who is first.
-                        # Usually score is written Winner-Loser.
-                        # So "6-4" means match-winner won set 6-4.
-                        # If I am match winner, I won 6-4.
-                        # If I am match loser, I lost 6-4.
-                        pass
-                    
-                    # Wait, if I am winner, the score is presented as MY score usually? or Match Winner score?
-                    # TennisAbstract stores as Match Winner score.
-                    # UTR usually stores as Match Winner score too.
-                    # So if result is "6-4 3-6 6-2", Winner won S1, lost S2, won S3.
-                    
-                    if is_winner:
-                        # Winner sets
-                        # S1
-                        w1, l1 = map(int, sets[0].split('-')[:2])
-                        if l1 > w1: lost_first_set = True
-                        
-                    # Comeback only possible if I won
-                    if is_winner and lost_first_set:
-                        comeback_wins += 1
-
-            except: pass
-            
-            # Tiebreaks
-            # Heuristic: 7-6 or 6-7 or 1-0 (super TB) or score-sum=13
-            for s in sets:
-                try:
-                    if '-' in s:
-                        p1, p2 = map(int, s.split('-')[:2])
-                        # Check for TB (7-6 or 6-7)
-                        if (p1 == 7 and p2 == 6) or (p1 == 6 and p2 == 7):
-                            if is_winner:
-                                # If I am winner, did I win this set?
-                                # Usually score is oriented to match winner.
-                                # So "7-6" means Winner won set.
-                                if p1 > p2: tb_wins += 1
-                                else: tb_losses += 1
-                            else:
-                                # I am loser.
-                                # "7-6" means Winner (opponent) won set.
-                                if p1 > p2: tb_losses += 1
-                                else: tb_wins += 1
-                        # Super TB (10-x etc in 3rd set often replaced by 1-0)
-                        # Ignoring for now for simplicity unless UTR verified
-                except: pass
-
-        if is_winner:
-            wins += 1
-            if is_three_set: three_set_wins += 1
-            
-            if opp_utr and my_utr_in_match and opp_utr > my_utr_in_match:
-                upsets += 1
-                
-            # Higher Rated
-            if opp_utr and my_utr_in_match:
-                if opp_utr > my_utr_in_match:
-                    hr_wins += 1
-                    hr_matches += 1
-                else:
-                    # Lower rated win
-                    pass
-
-            recent_form.append('W')
-            
-        elif is_loser:
-            losses += 1
-            if is_three_set: three_set_losses += 1
-            
-            # Higher Rated stats
-            if opp_utr and my_utr_in_match:
-                if opp_utr > my_utr_in_match:
-                    hr_matches += 1
-                    
-            recent_form.append('L')
+    # Tournaments
+    tournaments = set(t for t in frame.tournament if t)
             
     # Win %
     total = wins + losses
     win_pct = f"{(wins/total)*100:.1f}%" if total > 0 else "0.0%"
     
-    # Recent Form (Last 10)
-    last_10 = recent_form[:10]
-    l10_wins = last_10.count('W')
-    l10_losses = last_10.count('L')
+    l10_wins = int(last_10.sum())
+    l10_losses = len(last_10) - l10_wins
     form_str = f"{l10_wins}W-{l10_losses}L"
     
     # Avg Opp UTR
     avg_opp_utr = "N/A"
-    if opponent_utrs:
-        avg_op = sum(opponent_utrs) / len(opponent_utrs)
-        avg_opp_utr = f"{avg_op:.2f}"
+    known_opp = frame.opp_utr[~np.isnan(frame.opp_utr)]
+    if len(known_opp):
+        avg_opp_utr = f"{known_opp.mean():.2f}"
         
     # 3-Set Record
     three_set_total = three_set_wins + three_set_losses
@@ -200,7 +93,7 @@ def calculate_metrics(player_id, matches, history, current_utr):
         three_set_str += f" ({int(three_set_wins/three_set_total*100)}%)"
         
     # Tiebreak Record
-    # Logic above is approximate.
+    # Score orientation is approximate.
     tb_str = f"{tb_wins}W-{tb_losses}L"
     
     # Vs Higher Rated
@@ -209,36 +102,15 @@ def calculate_metrics(player_id, matches, history, current_utr):
         hr_str += f" ({int(hr_wins/hr_matches*100)}%)"
     
     # --- TRENDS ---
-    def get_trend(days_ago):
-        target_date = datetime.now() - timedelta(days=days_ago)
-        closest_diff = float('inf')
-        prior_val = None
-        
-        if history:
-            for h in history:
-                try:
-                    h_date_str = h['date'].replace('Z', '')
-                    if 'T' in h_date_str:
-                        h_date = datetime.fromisoformat(h_date_str)
-                    else:
-                        h_date = datetime.strptime(h_date_str, "%Y-%m-%d")
-                    
-                    diff = abs((h_date - target_date).total_seconds())
-                    if diff < closest_diff:
-                        closest_diff = diff
-                        prior_val = h['rating']
-                except: continue
-        
-        if prior_val and current_utr and closest_diff < (60 * 60 * 24 * 60): # Within 2 months
-             return current_utr - prior_val
-        return None
+    trend = UTRTrend.of(history)
+    now = datetime.now()
 
     # 1-Year Trend
-    delta_1y = get_trend(365)
+    delta_1y = trend.delta(current_utr, 365, now=now)
     trend_1y_str = f"{delta_1y:+.2f}" if delta_1y is not None else "N/A"
     
     # 3-Month Trend
-    delta_3m = get_trend(90)
+    delta_3m = trend.delta(current_utr, 90, now=now)
     trend_3m_str = f"{delta_3m:+.2f}" if delta_3m is not None else "N/A"
 
     return {
@@ -256,12 +128,6 @@ def calculate_metrics(player_id, matches, history, current_utr):
         '1-Year Delta': trend_1y_str
     }
 
-def get_history(conn, player_id):
-    c = conn.cursor()
-    c.execute("SELECT * FROM utr_history WHERE player_id = ? ORDER BY date DESC", (player_id,))
-    cols = [d[0] for d in c.description]
-    return [dict(zip(cols, row)) for row in c.fetchall()]
-
 def get_filtered_players(conn, country, category, gender, count, name_filter, min_utr=0, min_age=None, max_age=None):
     """Fetch players with SQL filtering."""
     c = conn.cursor()
@@ -342,7 +208,89 @@ def get_filtered_players(conn, country, category, gender, count, name_filter, mi
 # ============================================
 # MAIN LOGIC (Refactored for API use)
 # ============================================
-def generate_excel_report(country, category='junior', gender=None, count=100, name_filter=None, min_utr=0, min_age=None, max_age=None, output_dir='output'):
+INFO_METRICS = ['Name', 'Singles UTR', 'Doubles UTR', 'Age', 'Country', 'Gender', 'College', 'Location', 'Pro Rank',
+                'Win Record', 'Win %', 'Upset Ratio', 'Avg Opp UTR', '3-Set Record', 'Tiebreak Record', 'Comeback Wins',
+                'vs Higher Rated', 'Recent Form (L10)', 'Tournaments', '3-Month Trend', '1-Year Delta', 'Profile URL']
+
+MATCH_COLUMNS = ['Date', 'Tournament', 'Round', 'Opponent', 'Opp UTR', 'Result', 'Score']
+
+SUMMARY_COLUMNS = ['Name', 'Singles UTR', 'Doubles UTR', '3-Month Trend', '1-Year Delta', 'Win Record', 'Win %', 'Upset Ratio', 'Avg Opp UTR',
+                   '3-Set Record', 'Recent Form (L10)', 'Tournaments', 'vs Higher Rated', 'Tiebreak Record', 'Comeback Wins',
+                   'Age', 'Country', 'Location', 'Pro Rank', 'College', 'Profile URL']
+
+# Row (0-based) where the match table starts on each player sheet, below the info table
+MATCH_TABLE_ROW = 25
+
+# Players whose matches / history are loaded together
+EXPORT_BATCH_SIZE = 200
+
+# Tables whose changes invalidate cached reports
+EXPORT_TABLES = ('players', 'matches', 'utr_history')
+
+
+def export_cache_key(country, category, gender, count, name_filter, min_utr, min_age, max_age):
+    """Short hash of a filter set (the data version is appended separately)."""
+    filters = json.dumps([country, category, gender or None, count, name_filter or None,
+                          float(min_utr or 0), min_age, max_age])
+    return hashlib.sha256(filters.encode('utf-8')).hexdigest()[:12]
+
+
+def _report_filename(output_dir, country, category, gender, cache_key, version):
+    # The trend columns are relative to today, so a report is also only reused on the day it was built
+    gender_part = f"_{gender}" if gender else ""
+    cat_part = f"_{category}"
+    date_str = datetime.now().strftime("%Y%m%d")
+    return os.path.join(output_dir, f"{country or 'World'}{cat_part}{gender_part}_Detailed_{cache_key}-v{version}-{date_str}.xlsx")
+
+
+def _prune_stale_reports(output_dir, cache_key, keep):
+    """Remove reports of the same filter set built from older data."""
+    for path in glob.glob(os.path.join(output_dir, f"*_Detailed_{cache_key}-v*.xlsx")):
+        if os.path.abspath(path) != os.path.abspath(keep):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _player_sheet_rows(p, metrics, matches, profile_url):
+    """Rows of one player sheet: info table, blank padding, match table."""
+    values = [
+        p['name'], p['utr_singles'], p['utr_doubles'], p.get('age', ''), p.get('country', ''),
+        p.get('gender', ''), p.get('college', ''), p.get('location', ''), p.get('pro_rank', ''),
+        metrics['Record'], metrics['Win %'], metrics['Upset Ratio'], metrics['Avg Opp UTR'],
+        metrics['3-Set Record'], metrics['Tiebreak Record'], metrics['Comeback Wins'],
+        metrics['vs Higher Rated'], metrics['Recent Form'], metrics['Tournaments'],
+        metrics['3-Month Trend'], metrics['1-Year Delta'], profile_url,
+    ]
+    rows = [['Metric', 'Value']] + [[k, v] for k, v in zip(INFO_METRICS, values)]
+    if not matches:
+        return rows
+    rows.extend([] for _ in range(MATCH_TABLE_ROW - len(rows)))
+    rows.append(MATCH_COLUMNS)
+    for m in matches:
+        is_winner = str(m['winner_id']) == str(p['player_id'])
+        rows.append([
+            m['date'][:10] if m['date'] else '',
+            m['tournament'],
+            m['round'],
+            m.get('loser_name') if is_winner else m.get('winner_name'),
+            m.get('loser_utr') if is_winner else m.get('winner_utr'),
+            'Win' if is_winner else 'Loss',
+            m['score'],
+        ])
+    return rows
+
+
+def generate_excel_report(country, category='junior', gender=None, count=100, name_filter=None, min_utr=0, min_age=None, max_age=None,
+                          output_dir='output', progress=None, use_cache=True):
+    """
+    Write the report and return its path (None if no players match).
+    The workbook is streamed (openpyxl write-only mode): rows go to disk as they are produced,
+    so memory stays flat however many players are exported. Reports are cached per filter set,
+    data version and day; use_cache=False forces a rebuild.
+    progress: optional callback(done, total) called as players are processed.
+    """
     print(f"Exporting data...")
     print(f"Filters: Country={country}, Category={category}, Gender={gender or 'Any'}, Name={name_filter or 'Any'}, Count={count}, MinUTR={min_utr}, Age={min_age}-{max_age}")
     
@@ -353,39 +301,41 @@ def generate_excel_report(country, category='junior', gender=None, count=100, na
     
     conn = tennis_db.get_connection()
     conn.row_factory = sqlite3.Row
-    
-    # Get Players
-    players = get_filtered_players(conn, country, category, gender, count, name_filter, min_utr, min_age, max_age)
-    print(f"Found {len(players)} matched players.")
-    
-    if not players:
-        print("No players found.")
-        return None
+    try:
+        # Serve an identical earlier export if the data has not changed since
+        cache_key = export_cache_key(country, category, gender, count, name_filter, min_utr, min_age, max_age)
+        version = tennis_db.get_data_version(conn, *EXPORT_TABLES)
+        filename = _report_filename(output_dir, country, category, gender, cache_key, version)
+        if use_cache and os.path.exists(filename):
+            print(f"Serving cached report {filename}")
+            return filename
 
-    # Prepare Output File
-    date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    gender_part = f"_{gender}" if gender else ""
-    cat_part = f"_{category}"
-    filename = os.path.join(output_dir, f"{country or 'World'}{cat_part}{gender_part}_Detailed_{date_str}.xlsx")
-    
-    print(f"Writing to {filename}...")
-    
-    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        # Create a summary sheet first
-        summary_data = []
+        # Get Players
+        players = get_filtered_players(conn, country, category, gender, count, name_filter, min_utr, min_age, max_age)
+        print(f"Found {len(players)} matched players.")
         
+        if not players:
+            print("No players found.")
+            return None
+
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"Writing to {filename}...")
+        
+        workbook = Workbook(write_only=True)
+        summary_data = []
+        batch = None
         for i, p in enumerate(players):
             if (i+1) % 10 == 0 or i == 0:
                 print(f"Processing {i+1}/{len(players)}: {p['name'][:20]}...")
+            # Matches and history for the next EXPORT_BATCH_SIZE players in a few set-based queries
+            if i % EXPORT_BATCH_SIZE == 0:
+                batch = PlayerBatch.load(conn, [q['player_id'] for q in players[i:i + EXPORT_BATCH_SIZE]])
                 
             p_id = p['player_id']
-            matches = tennis_db.get_player_matches(conn, p_id)
-            history = get_history(conn, p_id)
+            matches = batch.matches(p_id)
             
             # metrics
-            metrics = calculate_metrics(p_id, matches, history, p['utr_singles'])
+            metrics = calculate_metrics(p_id, matches, batch.trend(p_id), p['utr_singles'])
             
             # Profile URL
             profile_url = f"https://app.utrsports.net/profiles/{p_id}"
@@ -417,73 +367,26 @@ def generate_excel_report(country, category='junior', gender=None, count=100, na
             })
             
             # --- INDIVIDUAL PLAYER SHEET ---
-            sheet_name = clean_sheet_name(p['name'])
-            
-            # 1. Info Table
-            info_dict = {
-                'Metric': ['Name', 'Singles UTR', 'Doubles UTR', 'Age', 'Country', 'Gender', 'College', 'Location', 'Pro Rank',
-                           'Win Record', 'Win %', 'Upset Ratio', 'Avg Opp UTR', '3-Set Record', 'Tiebreak Record', 'Comeback Wins',
-                           'vs Higher Rated', 'Recent Form (L10)', 'Tournaments', '3-Month Trend', '1-Year Delta', 'Profile URL'],
-                'Value': [
-                    p['name'], 
-                    p['utr_singles'], 
-                    p['utr_doubles'], 
-                    p.get('age', ''),
-                    p.get('country', ''),
-                    p.get('gender', ''),
-                    p.get('college', ''),
-                    p.get('location', ''),
-                    p.get('pro_rank', ''),
-                    metrics['Record'],
-                    metrics['Win %'],
-                    metrics['Upset Ratio'],
-                    metrics['Avg Opp UTR'],
-                    metrics['3-Set Record'],
-                    metrics['Tiebreak Record'],
-                    metrics['Comeback Wins'],
-                    metrics['vs Higher Rated'],
-                    metrics['Recent Form'],
-                    metrics['Tournaments'],
-                    metrics['3-Month Trend'],
-                    metrics['1-Year Delta'],
-                    profile_url
-                ]
-            }
-            df_info = pd.DataFrame(info_dict)
-            df_info.to_excel(writer, sheet_name=sheet_name, startrow=0, startcol=0, index=False)
-            
-            # 2. Match History Table
-            if matches:
-                match_rows = []
-                for m in matches:
-                    is_winner = str(m['winner_id']) == str(p_id)
-                    result = 'Win' if is_winner else 'Loss'
-                    opp_name = m['loser_name'] if is_winner else m['winner_name']
-                    opp_utr = m['loser_utr'] if is_winner else m['winner_utr']
-                    
-                    match_rows.append({
-                        'Date': m['date'][:10] if m['date'] else '',
-                        'Tournament': m['tournament'],
-                        'Round': m['round'],
-                        'Opponent': opp_name,
-                        'Opp UTR': opp_utr,
-                        'Result': result,
-                        'Score': m['score']
-                    })
-                
-                df_matches = pd.DataFrame(match_rows)
-                df_matches.to_excel(writer, sheet_name=sheet_name, startrow=25, startcol=0, index=False) # Moved down to accommodate longer info table
+            sheet = workbook.create_sheet(clean_sheet_name(p['name']))
+            for row in _player_sheet_rows(p, metrics, matches, profile_url):
+                sheet.append(row)
+            if progress:
+                progress(i + 1, len(players))
         
-        # Write Summary Sheet
-        df_summary = pd.DataFrame(summary_data)
-        # Reorder columns to match request
-        cols_order = ['Name', 'Singles UTR', 'Doubles UTR', '3-Month Trend', '1-Year Delta', 'Win Record', 'Win %', 'Upset Ratio', 'Avg Opp UTR',
-                      '3-Set Record', 'Recent Form (L10)', 'Tournaments', 'vs Higher Rated', 'Tiebreak Record', 'Comeback Wins',
-                      'Age', 'Country', 'Location', 'Pro Rank', 'College', 'Profile URL']
-        # Filter to only existing columns
-        cols_order = [c for c in cols_order if c in df_summary.columns]
-        df_summary = df_summary[cols_order].sort_values(by='Singles UTR', ascending=False)
-        df_summary.to_excel(writer, sheet_name='Overview', index=False)
+        # Write Summary Sheet, highest UTR first (unrated last)
+        summary_data.sort(key=lambda s: (s['Singles UTR'] is None, -(s['Singles UTR'] or 0)))
+        overview = workbook.create_sheet('Overview')
+        overview.append(SUMMARY_COLUMNS)
+        for s in summary_data:
+            overview.append([s[c] for c in SUMMARY_COLUMNS])
+
+        # Write to a temp file first so a concurrent request never serves a half-written report
+        tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        workbook.save(tmp_filename)
+        os.replace(tmp_filename, filename)
+        _prune_stale_reports(output_dir, cache_key, filename)
+    finally:
+        conn.close()
     
     print("\nReport Generation Complete!")
     return filename
@@ -501,6 +404,7 @@ def main():
     parser.add_argument('--min-age', type=int, help='Minimum Age')
     parser.add_argument('--max-age', type=int, help='Maximum Age')
     parser.add_argument('--age', type=int, help='Exact Age (sets min and max)')
+    parser.add_argument('--no-cache', action='store_true', help='Rebuild even if an identical report exists for the current data')
 
     args = parser.parse_args()
     
@@ -508,7 +412,8 @@ def main():
         args.min_age = args.age
         args.max_age = args.age
 
-    generate_excel_report(args.country, args.category, args.gender, args.count, args.name, args.min_utr, args.min_age, args.max_age)
+    generate_excel_report(args.country, args.category, args.gender, args.count, args.name, args.min_utr, args.min_age, args.max_age,
+                          use_cache=not args.no_cache)
 
 if __name__ == "__main__":
     main()
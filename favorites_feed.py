@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Favorites Feed - Materialized per-user feed of favorite players' matches and news.
+
+The user_feed table holds one row per (user, item, favorite player) with the
+ready-to-serve feed entry as JSON. Writers fan new items out to every user
+following one of the players involved (fan-out-on-write), and each user's feed
+is trimmed to the newest FEED_CAP entries, so loading a feed is a single
+indexed range read instead of joining matches and news against favorites.
+
+Writers that add matches or news call fan_out_matches / fan_out_news with the
+new ids; adding or removing a favorite rebuilds that user's feed.
+
+Usage:
+    python favorites_feed.py --rebuild       # Rebuild every user's feed
+    python favorites_feed.py --user 42       # Rebuild one user's feed
+"""
+
+import argparse
+import json
+import os
+
+# Entries kept per user (a feed request never returns more than this)
+FEED_CAP = int(os.getenv("FEED_CAP", "500"))
+
+# Ids per IN (...) query, well under SQLite's variable limit
+CHUNK_SIZE = 500
+
+
+def _chunks(ids):
+    ids = list(dict.fromkeys(str(i) for i in ids if i is not None))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def _rows_to_dicts(cursor):
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _match_entry(m):
+    """Feed entry for a match, seen from the favorite player's side."""
+    m['type'] = 'match'
+    m['timestamp'] = m.get('date')
+    if str(m.get('favorite_id')) == str(m.get('winner_id')):
+        m['player_id'] = m['winner_id']
+        m['player_name'] = m.get('winner_name')
+        m['opponent_id'] = m.get('loser_id')
+        m['opponent_name'] = m.get('loser_name')
+        m['result'] = 'W'
+    else:
+        m['player_id'] = m['loser_id']
+        m['player_name'] = m.get('loser_name')
+        m['opponent_id'] = m.get('winner_id')
+        m['opponent_name'] = m.get('winner_name')
+        m['result'] = 'L'
+    return m
+
+
+def _news_entry(n):
+    n['type'] = 'news'
+    n['timestamp'] = n.get('published_at')
+    return n
+
+
+def _insert_entries(conn, kind, ref_key, player_key, entries):
+    """INSERT OR IGNORE the entries (dicts carrying a feed_user_id) and return the users touched."""
+    rows = []
+    for e in entries:
+        user_id = e.pop('feed_user_id')
+        rows.append((user_id, str(e[player_key]), kind, str(e[ref_key]), e.get('timestamp'), json.dumps(e)))
+    conn.executemany("""
+        INSERT OR IGNORE INTO user_feed (user_id, player_id, kind, ref_id, timestamp, payload)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    return {r[0] for r in rows}
+
+
+def _fan_out_matches(conn, match_ids, user_id=None):
+    user_sql = "AND f.user_id = ?" if user_id is not None else ""
+    users = set()
+    for chunk in _chunks(match_ids):
+        c = conn.execute(f"""
+            SELECT m.*, w.name AS winner_name, l.name AS loser_name,
+                   f.player_id AS favorite_id, f.user_id AS feed_user_id
+            FROM matches m
+            JOIN user_favorites f ON f.player_id IN (m.winner_id, m.loser_id)
+            JOIN players w ON m.winner_id = w.player_id
+            JOIN players l ON m.loser_id = l.player_id
+            WHERE m.match_id IN ({', '.join('?' * len(chunk))}) {user_sql}
+        """, chunk + ([user_id] if user_id is not None else []))
+        users |= _insert_entries(conn, 'match', 'match_id', 'player_id', [_match_entry(m) for m in _rows_to_dicts(c)])
+    return users
+
+
+def _fan_out_news(conn, news_ids, user_id=None):
+    user_sql = "AND f.user_id = ?" if user_id is not None else ""
+    users = set()
+    for chunk in _chunks(news_ids):
+        c = conn.execute(f"""
+            SELECT n.*, p.name AS player_name, f.user_id AS feed_user_id
+            FROM news_items n
+            JOIN user_favorites f ON n.player_id_ref = f.player_id
+            JOIN players p ON n.player_id_ref = p.player_id
+            WHERE n.id IN ({', '.join('?' * len(chunk))}) {user_sql}
+        """, chunk + ([user_id] if user_id is not None else []))
+        users |= _insert_entries(conn, 'news', 'id', 'player_id_ref', [_news_entry(n) for n in _rows_to_dicts(c)])
+    return users
+
+
+def trim(conn, user_ids, cap=FEED_CAP):
+    """Drop everything but the newest `cap` entries of each user's feed."""
+    for user_id in user_ids:
+        conn.execute("""
+            DELETE FROM user_feed WHERE rowid IN (
+                SELECT rowid FROM user_feed WHERE user_id = ?
+                ORDER BY timestamp DESC LIMIT -1 OFFSET ?
+            )
+        """, (user_id, cap))
+
+
+def fan_out_matches(conn, match_ids):
+    """
+    Append newly stored matches to the feed of every user following either player.
+    Idempotent (already fanned-out entries are ignored); the caller commits.
+    """
+    trim(conn, _fan_out_matches(conn, match_ids))
+
+
+def fan_out_news(conn, news_ids):
+    """Append newly stored news items (news_items.id) to their player's followers' feeds."""
+    trim(conn, _fan_out_news(conn, news_ids))
+
+
+def rebuild_user(conn, user_id, cap=FEED_CAP):
+    """Recompute one user's feed from their current favorites (after a favorite is added or removed)."""
+    conn.execute("DELETE FROM user_feed WHERE user_id = ?", (user_id,))
+    favorites = [r[0] for r in conn.execute("SELECT player_id FROM user_favorites WHERE user_id = ?", (user_id,))]
+    match_ids, news_ids = [], []
+    for player_id in favorites:
+        # Only each player's newest `cap` items can survive the trim
+        match_ids += [r[0] for r in conn.execute("""
+            SELECT match_id FROM (
+                SELECT match_id, date FROM matches WHERE winner_id = ?
+                UNION ALL
+                SELECT match_id, date FROM matches WHERE loser_id = ?
+            ) ORDER BY date DESC LIMIT ?
+        """, (player_id, player_id, cap))]
+        news_ids += [r[0] for r in conn.execute(
+            "SELECT id FROM news_items WHERE player_id_ref = ? ORDER BY published_at DESC LIMIT ?",
+            (player_id, cap)
+        )]
+    _fan_out_matches(conn, match_ids, user_id)
+    _fan_out_news(conn, news_ids, user_id)
+    trim(conn, [user_id], cap)
+
+
+def rebuild_all(conn):
+    """Rebuild the feed of every user with favorites. Returns the number of users rebuilt."""
+    conn.execute("DELETE FROM user_feed")
+    user_ids = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM user_favorites")]
+    for user_id in user_ids:
+        rebuild_user(conn, user_id)
+    conn.commit()
+    return len(user_ids)
+
+
+def get_feed(conn, user_id, limit=50):
+    """The newest `limit` feed entries of a user (at most FEED_CAP)."""
+    rows = conn.execute(
+        "SELECT payload FROM user_feed WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+        (user_id, limit)
+    ).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+
+def main():
+    import tennis_db
+
+    parser = argparse.ArgumentParser(description='Maintain the materialized favorites feed')
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild every user's feed")
+    parser.add_argument('--user', type=int, action='append', help="Rebuild one user's feed (repeatable)")
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.rebuild:
+            print(f"Rebuilt feeds for {rebuild_all(conn)} users")
+        for user_id in args.user or []:
+            rebuild_user(conn, user_id)
+            conn.commit()
+            print(f"Rebuilt feed for user {user_id}")
+        if not args.rebuild and not args.user:
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Head-to-Head - Maintained per-opponent records.
+
+The head_to_head table holds one row per (player, opponent) direction with
+wins, losses, first/last meeting, surface splits and the latest match ids,
+so opponent lookups are indexed reads instead of full career scans.
+
+Writers go through tennis_db.on_matches_stored: brand-new matches are applied
+incrementally (apply_matches); when a stored match changed winner, loser,
+date or surface, both players' rows are recomputed (rebuild_player).
+
+Usage:
+    python head_to_head.py --rebuild        # One-off backfill from matches
+    python head_to_head.py --player 12345   # Recompute a single player's rows
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+# Number of most recent meetings kept per pair
+RECENT_MATCH_LIMIT = 10
+
+SURFACES = ['Hard', 'Clay', 'Grass', 'Carpet']
+
+H2H_COLUMNS = [
+    'player_id', 'opponent_id', 'wins', 'losses', 'total', 'first_match', 'last_match',
+    'hard_wins', 'hard_losses', 'clay_wins', 'clay_losses',
+    'grass_wins', 'grass_losses', 'carpet_wins', 'carpet_losses',
+    'recent_matches', 'updated_at'
+]
+
+
+def _surface_prefix(surface):
+    """Map a match surface to its column prefix (None if not tracked)."""
+    if not surface:
+        return None
+    surface = surface.strip().capitalize()
+    return surface.lower() if surface in SURFACES else None
+
+
+def _directed_matches_sql():
+    """Both directions of every match: (player_id, opponent_id, won, date, surface, match_id)."""
+    return """
+        SELECT winner_id AS player_id, loser_id AS opponent_id, 1 AS won, date, surface, match_id
+        FROM matches WHERE winner_id IS NOT NULL AND loser_id IS NOT NULL
+        UNION ALL
+        SELECT loser_id AS player_id, winner_id AS opponent_id, 0 AS won, date, surface, match_id
+        FROM matches WHERE winner_id IS NOT NULL AND loser_id IS NOT NULL
+    """
+
+
+# SQL counterpart of _surface_prefix: 'hard', 'Clay ' etc. count like the canonical names
+SURFACE_KEY_SQL = "lower(trim(surface, ' ' || char(9, 10, 11, 12, 13)))"
+
+
+def _aggregate_sql(directed_sql):
+    surface_cols = []
+    for s in SURFACES:
+        surface_cols.append(f"SUM(CASE WHEN {SURFACE_KEY_SQL} = '{s.lower()}' THEN won ELSE 0 END)")
+        surface_cols.append(f"SUM(CASE WHEN {SURFACE_KEY_SQL} = '{s.lower()}' THEN 1 - won ELSE 0 END)")
+
+    return f"""
+        INSERT OR REPLACE INTO head_to_head ({', '.join(H2H_COLUMNS)})
+        SELECT player_id, opponent_id,
+               SUM(won), SUM(1 - won), COUNT(*), MIN(date), MAX(date),
+               {', '.join(surface_cols)},
+               json_group_array(json_array(date, match_id)) FILTER (WHERE rn <= {RECENT_MATCH_LIMIT}),
+               :updated_at
+        FROM (
+            SELECT d.*, ROW_NUMBER() OVER (
+                PARTITION BY player_id, opponent_id ORDER BY date DESC, match_id DESC
+            ) AS rn
+            FROM ({directed_sql}) d
+        )
+        GROUP BY player_id, opponent_id
+    """
+
+
+def rebuild_head_to_head(conn):
+    """Rebuild the whole head_to_head table from matches (one-off backfill)."""
+    start = time.time()
+    conn.execute("DELETE FROM head_to_head")
+    conn.execute(_aggregate_sql(_directed_matches_sql()), {'updated_at': datetime.now().isoformat()})
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM head_to_head").fetchone()[0]
+    print(f"Rebuilt head_to_head: {count} rows in {time.time() - start:.2f}s")
+    return count
+
+
+def rebuild_player(conn, player_id):
+    """Recompute every head_to_head row involving a player (both directions)."""
+    player_id = str(player_id)
+    # Rows are symmetric, so the player's own rows name every mirrored row (PK lookups)
+    conn.execute("""
+        DELETE FROM head_to_head
+        WHERE opponent_id = ? AND player_id IN (SELECT opponent_id FROM head_to_head WHERE player_id = ?)
+    """, (player_id, player_id))
+    conn.execute("DELETE FROM head_to_head WHERE player_id = ?", (player_id,))
+
+    # Restrict each half of the union to matches involving the player
+    directed = """
+        SELECT winner_id AS player_id, loser_id AS opponent_id, 1 AS won, date, surface, match_id
+        FROM matches WHERE winner_id = :pid AND loser_id IS NOT NULL
+        UNION ALL
+        SELECT winner_id, loser_id, 1, date, surface, match_id
+        FROM matches WHERE loser_id = :pid AND winner_id IS NOT NULL
+        UNION ALL
+        SELECT loser_id, winner_id, 0, date, surface, match_id
+        FROM matches WHERE winner_id = :pid AND loser_id IS NOT NULL
+        UNION ALL
+        SELECT loser_id, winner_id, 0, date, surface, match_id
+        FROM matches WHERE loser_id = :pid AND winner_id IS NOT NULL
+    """
+    conn.execute(_aggregate_sql(directed), {'pid': player_id, 'updated_at': datetime.now().isoformat()})
+
+
+def record_match(conn, match_data):
+    """
+    Incrementally apply a newly inserted match to both directions of its pair.
+    Callers must only pass matches that were not already counted.
+    """
+    winner_id = match_data.get('winner_id')
+    loser_id = match_data.get('loser_id')
+    if not winner_id or not loser_id:
+        return
+
+    date = match_data.get('date')
+    match_id = str(match_data.get('match_id'))
+    prefix = _surface_prefix(match_data.get('surface'))
+    now = datetime.now().isoformat()
+
+    for player_id, opponent_id, won in ((str(winner_id), str(loser_id), 1), (str(loser_id), str(winner_id), 0)):
+        row = conn.execute(
+            "SELECT recent_matches FROM head_to_head WHERE player_id = ? AND opponent_id = ?",
+            (player_id, opponent_id)
+        ).fetchone()
+
+        recent = _merge_recent(row[0] if row else None, date, match_id)
+
+        surface_sql = ""
+        if prefix:
+            col = f"{prefix}_wins" if won else f"{prefix}_losses"
+            surface_sql = f", {col} = {col} + 1"
+
+        if row:
+            conn.execute(f"""
+                UPDATE head_to_head
+                SET wins = wins + ?, losses = losses + ?, total = total + 1,
+                    first_match = CASE WHEN first_match IS NULL OR ? < first_match THEN ? ELSE first_match END,
+                    last_match = CASE WHEN last_match IS NULL OR ? > last_match THEN ? ELSE last_match END,
+                    recent_matches = ?, updated_at = ?{surface_sql}
+                WHERE player_id = ? AND opponent_id = ?
+            """, (won, 1 - won, date, date, date, date, recent, now, player_id, opponent_id))
+        else:
+            values = {c: 0 for c in H2H_COLUMNS}
+            values.update({
+                'player_id': player_id,
+                'opponent_id': opponent_id,
+                'wins': won,
+                'losses': 1 - won,
+                'total': 1,
+                'first_match': date,
+                'last_match': date,
+                'recent_matches': recent,
+                'updated_at': now,
+            })
+            if prefix:
+                values[f"{prefix}_wins" if won else f"{prefix}_losses"] = 1
+            conn.execute(
+                f"INSERT INTO head_to_head ({', '.join(H2H_COLUMNS)}) VALUES ({', '.join(['?'] * len(H2H_COLUMNS))})",
+                [values[c] for c in H2H_COLUMNS]
+            )
+
+
+def apply_matches(conn, match_ids):
+    """record_match for stored matches by id (brand-new ones only; the caller commits)."""
+    match_ids = list(dict.fromkeys(str(m) for m in match_ids))
+    for i in range(0, len(match_ids), 500):
+        chunk = match_ids[i:i + 500]
+        c = conn.execute(f"""
+            SELECT match_id, winner_id, loser_id, date, surface
+            FROM matches WHERE match_id IN ({','.join(['?'] * len(chunk))})
+        """, chunk)
+        for m in _rows_to_dicts(c):
+            record_match(conn, m)
+
+
+def match_keys(conn, match_ids):
+    """{match_id: (winner_id, loser_id, date, surface)} of stored matches - what their head_to_head rows depend on."""
+    match_ids = list(dict.fromkeys(str(m) for m in match_ids))
+    keys = {}
+    for i in range(0, len(match_ids), 500):
+        chunk = match_ids[i:i + 500]
+        for row in conn.execute(f"""
+            SELECT match_id, winner_id, loser_id, date, surface
+            FROM matches WHERE match_id IN ({','.join(['?'] * len(chunk))})
+        """, chunk):
+            keys[str(row[0])] = tuple(row[1:])
+    return keys
+
+
+def changed_players(before, after):
+    """Players of matches whose winner / loser / date / surface differ between two match_keys snapshots."""
+    players = set()
+    for match_id, old in before.items():
+        new = after.get(match_id)
+        if new is not None and new != old:
+            players.update(str(p) for p in (old[0], old[1], new[0], new[1]) if p is not None)
+    return players
+
+
+def _load_recent(recent_json):
+    """Decode a recent_matches column into [(date, match_id), ...] newest first."""
+    if not recent_json:
+        return []
+    try:
+        pairs = [tuple(p) for p in json.loads(recent_json) if p]
+    except (ValueError, TypeError):
+        return []
+    pairs.sort(key=lambda p: (p[0] or '', str(p[1])), reverse=True)
+    return pairs
+
+
+def _merge_recent(recent_json, date, match_id):
+    pairs = [p for p in _load_recent(recent_json) if str(p[1]) != match_id]
+    pairs.append((date, match_id))
+    pairs.sort(key=lambda p: (p[0] or '', str(p[1])), reverse=True)
+    return json.dumps(pairs[:RECENT_MATCH_LIMIT])
+
+
+def _rows_to_dicts(cursor):
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _fetch_match_details(conn, match_ids):
+    """Batch-load display fields for a set of match ids (primary key lookups)."""
+    match_ids = list(set(match_ids))
+    if not match_ids:
+        return {}
+    details = {}
+    # Stay well under SQLite's bound-variable limit
+    for i in range(0, len(match_ids), 500):
+        chunk = match_ids[i:i + 500]
+        placeholders = ','.join(['?'] * len(chunk))
+        c = conn.execute(f"""
+            SELECT match_id, date, score, tournament, round, surface, winner_id, loser_id
+            FROM matches WHERE match_id IN ({placeholders})
+        """, chunk)
+        for m in _rows_to_dicts(c):
+            details[str(m['match_id'])] = m
+    return details
+
+
+def _surface_splits(row):
+    return {
+        s: {'wins': row.get(f"{s.lower()}_wins") or 0, 'losses': row.get(f"{s.lower()}_losses") or 0}
+        for s in SURFACES
+    }
+
+
+def get_head_to_head(conn, player1_id, player2_id, limit=RECENT_MATCH_LIMIT):
+    """Head-to-head record of player1 against player2, with recent meetings."""
+    player1_id, player2_id = str(player1_id), str(player2_id)
+
+    c = conn.execute(f"""
+        SELECT {', '.join(H2H_COLUMNS)} FROM head_to_head
+        WHERE player_id = ? AND opponent_id = ?
+    """, (player1_id, player2_id))
+    rows = _rows_to_dicts(c)
+    row = rows[0] if rows else None
+
+    c = conn.execute(
+        "SELECT player_id, name, utr_singles, country FROM players WHERE player_id IN (?, ?)",
+        (player1_id, player2_id)
+    )
+    players = {str(p['player_id']): p for p in _rows_to_dicts(c)}
+
+    recent = _load_recent(row['recent_matches'])[:limit] if row else []
+    details = _fetch_match_details(conn, [str(mid) for _, mid in recent])
+
+    matches = []
+    for _, mid in recent:
+        m = details.get(str(mid))
+        if not m:
+            continue
+        m['won'] = str(m['winner_id']) == player1_id
+        matches.append(m)
+
+    return {
+        'player1': players.get(player1_id, {'player_id': player1_id}),
+        'player2': players.get(player2_id, {'player_id': player2_id}),
+        'wins': row['wins'] if row else 0,
+        'losses': row['losses'] if row else 0,
+        'total': row['total'] if row else 0,
+        'first_meeting': row['first_match'] if row else None,
+        'last_meeting': row['last_match'] if row else None,
+        'surfaces': _surface_splits(row) if row else _surface_splits({}),
+        'matches': matches
+    }
+
+
+def get_opponent_summary(conn, player_id, limit=5, matches_per_opponent=5):
+    """
+    Opponent analysis for a player from head_to_head:
+    most encountered, always lose to, always win against, closest matchups.
+    Ties are broken by the most recent meeting.
+    """
+    player_id = str(player_id)
+    cols = ', '.join(H2H_COLUMNS)
+
+    sections = {
+        'most_encountered': f"""
+            SELECT {cols} FROM head_to_head WHERE player_id = ?
+            ORDER BY total DESC, last_match DESC LIMIT ?
+        """,
+        'always_lose': f"""
+            SELECT {cols} FROM head_to_head WHERE player_id = ? AND wins = 0 AND losses >= 3
+            ORDER BY total DESC, last_match DESC LIMIT ?
+        """,
+        'always_win': f"""
+            SELECT {cols} FROM head_to_head WHERE player_id = ? AND losses = 0 AND wins >= 3
+            ORDER BY total DESC, last_match DESC LIMIT ?
+        """,
+        'closest_matchups': f"""
+            SELECT {cols} FROM head_to_head WHERE player_id = ? AND total >= 4
+            ORDER BY ABS(0.5 - CAST(wins AS REAL) / total) ASC, last_match DESC LIMIT ?
+        """,
+    }
+
+    results = {}
+    for key, sql in sections.items():
+        results[key] = _rows_to_dicts(conn.execute(sql, (player_id, limit)))
+
+    all_rows = [r for rows in results.values() for r in rows]
+    if not all_rows:
+        return {key: [] for key in sections}
+
+    # One lookup for opponent profiles, one for the recent match details
+    opp_ids = list({r['opponent_id'] for r in all_rows})
+    placeholders = ','.join(['?'] * len(opp_ids))
+    c = conn.execute(
+        f"SELECT player_id, name, utr_singles, country FROM players WHERE player_id IN ({placeholders})",
+        opp_ids
+    )
+    profiles = {str(p['player_id']): p for p in _rows_to_dicts(c)}
+
+    recent_ids = {}
+    for r in all_rows:
+        recent_ids[r['opponent_id']] = [str(mid) for _, mid in _load_recent(r['recent_matches'])[:matches_per_opponent]]
+    details = _fetch_match_details(conn, [mid for ids in recent_ids.values() for mid in ids])
+
+    def to_opponent(r):
+        opp_id = r['opponent_id']
+        profile = profiles.get(str(opp_id), {})
+        matches = []
+        for mid in recent_ids.get(opp_id, []):
+            m = details.get(mid)
+            if m:
+                matches.append({
+                    "date": m['date'],
+                    "score": m['score'],
+                    "tournament": m['tournament'],
+                    "won": str(m['winner_id']) == player_id
+                })
+        return {
+            "player_id": opp_id,
+            "name": profile.get('name') or "Unknown",
+            "utr_singles": profile.get('utr_singles'),
+            "country": profile.get('country'),
+            "wins": r['wins'],
+            "losses": r['losses'],
+            "total": r['total'],
+            "last_match": r['last_match'],
+            "matches": matches
+        }
+
+    return {key: [to_opponent(r) for r in rows] for key, rows in results.items()}
+
+
+def main():
+    import tennis_db
+
+    parser = argparse.ArgumentParser(description='Maintain the head_to_head table')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the full table from matches')
+    parser.add_argument('--player', action='append', help='Recompute rows for a player (repeatable)')
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.rebuild:
+            rebuild_head_to_head(conn)
+        for pid in args.player or []:
+            rebuild_player(conn, pid)
+            conn.commit()
+            print(f"Recomputed head_to_head for {pid}")
+        if not args.rebuild and not args.player:
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
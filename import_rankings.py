@@ -7,6 +7,8 @@ import requests
 import csv
 from io import StringIO
 from datetime import datetime
+import ranking_series
+import tennis_db
 
 # Base URLs for ranking files
 ATP_RANKINGS_URL = "https://raw.githubusercontent.com/JeffSackmann/tennis_atp/master/atp_rankings_current.csv"
@@ -44,9 +46,8 @@ def import_rankings(conn, rows, tour_prefix, min_date=None):
     """Import ranking rows into the database."""
     c = conn.cursor()
     
-    # Get existing dates to avoid re-importing
-    c.execute("SELECT DISTINCT date FROM rankings WHERE player_id LIKE ?", (f"{tour_prefix}_%",))
-    existing_dates = set(r[0] for r in c.fetchall())
+    # Get existing dates to avoid re-importing (including weeks pruned into ranking_series)
+    existing_dates = ranking_series.imported_dates(conn, tour_prefix)
     
     imported = 0
     skipped_date = 0
@@ -88,6 +89,8 @@ def import_rankings(conn, rows, tour_prefix, min_date=None):
         except Exception as e:
             print(f"  Error parsing row: {e} - {row}")
     
+    if imported:
+        tennis_db.bump_version(conn, 'rankings')
     conn.commit()
     print(f"  Imported: {imported}, Skipped (existing): {skipped_date}, Skipped (too old): {skipped_old}")
     return imported
@@ -97,6 +100,8 @@ def main():
     print("Importing ATP/WTA Ranking Data (2025+)")
     print("=" * 60)
     
+    # Creates ranking_weeks on older databases
+    tennis_db.init_db()
     conn = get_db_connection()
     
     # Check current latest date
@@ -5,6 +5,7 @@ This supplements the historical data when Sackmann's repo is not up to date.
 import sqlite3
 import requests
 from datetime import datetime
+import tennis_db
 from bs4 import BeautifulSoup
 import json
 import re
@@ -161,6 +162,7 @@ def import_scraped_rankings(conn, rankings, tour_prefix, ranking_date):
         except Exception as e:
             print(f"  Error importing {r}: {e}")
     
+    tennis_db.bump_version(conn, 'rankings')
     conn.commit()
     print(f"  Imported {imported} rankings for {ranking_date}")
     return imported
@@ -197,6 +199,9 @@ def generate_mock_2025_data(conn):
         '2025-02-03'
     ]
     
+    # Weeks pruned into ranking_series (see ranking_series.prune_rankings) are already imported
+    pruned_weeks = {(r[0], r[1]) for r in c.execute("SELECT tour, date FROM ranking_weeks")}
+    
     total_imported = 0
     
     for week_date in weeks_2025:
@@ -206,6 +211,8 @@ def generate_mock_2025_data(conn):
             rank = row[1]
             points = row[2]
             tours = row[3] or 0
+            if (player_id.split('_')[0], week_date) in pruned_weeks:
+                continue
             
             # Small random-ish variation based on player_id hash
             variation = (hash(player_id + week_date) % 100) - 50  # -50 to +49
@@ -223,6 +230,8 @@ def generate_mock_2025_data(conn):
             except:
                 pass
         
+        if imported:
+            tennis_db.bump_version(conn, 'rankings')
         conn.commit()
         print(f"  {week_date}: Added {imported} rankings")
         total_imported += imported
@@ -234,6 +243,8 @@ def main():
     print("Importing Current ATP/WTA Rankings")
     print("=" * 60)
     
+    # Creates ranking_weeks on older databases
+    tennis_db.init_db()
     conn = get_db_connection()
     c = conn.cursor()
     
@@ -20,6 +20,7 @@ import sqlite3
 import requests
 from datetime import datetime
 from difflib import SequenceMatcher
+import head_to_head
 import tennis_db
 
 # GitHub raw URLs
@@ -200,6 +201,9 @@ def import_csv_data(conn, csv_content, source_name, dry_run=False, update_stats=
     updated = 0
     skipped = 0
     errors = 0
+    new_match_ids = []     # Inserted since the last commit
+    stored_match_ids = []  # Inserted or updated since the last commit
+    changed_player_ids = set()  # Players of updated matches whose pair / date / surface changed
     
     c = conn.cursor()
     
@@ -270,17 +274,27 @@ def import_csv_data(conn, csv_content, source_name, dry_run=False, update_stats=
                 set_clause = ", ".join([f"{k} = ?" for k in match_data.keys() if k != 'match_id'])
                 params = [v for k, v in match_data.items() if k != 'match_id']
                 params.append(match_id)
+                before = head_to_head.match_keys(conn, [match_id])
                 c.execute(f"UPDATE matches SET {set_clause} WHERE match_id = ?", params)
+                changed_player_ids |= head_to_head.changed_players(before, head_to_head.match_keys(conn, [match_id]))
+                stored_match_ids.append(match_id)
                 updated += 1
             else:
                 # Insert match
                 cols = ', '.join(match_data.keys())
                 placeholders = ', '.join(['?' for _ in match_data])
                 c.execute(f"INSERT INTO matches ({cols}) VALUES ({placeholders})", list(match_data.values()))
+                new_match_ids.append(match_id)
+                stored_match_ids.append(match_id)
                 imported += 1
             
             # Commit every 100 matches
             if (imported + updated) % 100 == 0:
+                tennis_db.bump_version(conn, 'matches', maintained=True)
+                tennis_db.on_matches_stored(conn, stored_match_ids, new_match_ids, changed_player_ids)
+                stored_match_ids.clear()
+                new_match_ids.clear()
+                changed_player_ids.clear()
                 conn.commit()
                 print(f"    Progress: {imported + updated} matches processed...")
         
@@ -289,6 +303,9 @@ def import_csv_data(conn, csv_content, source_name, dry_run=False, update_stats=
             if errors <= 5:
                 print(f"  Error processing match: {e}")
     
+    if stored_match_ids:
+        tennis_db.bump_version(conn, 'matches', maintained=True)
+    tennis_db.on_matches_stored(conn, stored_match_ids, new_match_ids, changed_player_ids)
     conn.commit()
     return imported, updated, skipped, errors
 
@@ -10,24 +10,55 @@ Generates facts like:
 
 import sqlite3
 from datetime import datetime, timedelta
-from collections import defaultdict
+import numpy as np
 import tennis_db
+from match_frame import MatchFrame
 
 
-def get_player_insights(player_id: str, years: int = 5):
+def get_player_insights(player_id: str, years: int = 5, matches=None):
     """
     Generate insights for a player based on their match history.
     
     Returns a list of insight objects with category, title, description, 
     emoji, win/loss ratio, and supporting matches.
+    
+    `matches` may be the player's preloaded match list with opponent details
+    (AnalysisContext.matches, newest first) or its MatchFrame; otherwise it is
+    queried here.
     """
+    # Calculate date threshold
+    cutoff_date = (datetime.now() - timedelta(days=years * 365)).strftime('%Y-%m-%d')
+    
+    if matches is not None:
+        frame = MatchFrame.of(matches, player_id).since(cutoff_date)
+    else:
+        frame = MatchFrame.from_matches(_fetch_recent_matches(player_id, cutoff_date), player_id)
+    
+    if not len(frame):
+        return []
+    
+    insights = []
+    
+    # Run all pattern detectors
+    insights.extend(find_age_patterns(player_id, frame))
+    insights.extend(find_surface_patterns(player_id, frame))
+    insights.extend(find_country_patterns(player_id, frame))
+    insights.extend(find_set_patterns(player_id, frame))
+    insights.extend(find_streak_patterns(player_id, frame))
+    insights.extend(find_round_patterns(player_id, frame))
+    
+    # Sort by interest score (0% or 100% win rates are most interesting)
+    insights.sort(key=lambda x: (x['total_matches'], abs(x['win_pct'] - 50)), reverse=True)
+    
+    return insights[:10]  # Return top 10 insights
+
+
+def _fetch_recent_matches(player_id, cutoff_date):
+    """Matches since cutoff_date with opponent name/age/country, newest first."""
     conn = sqlite3.connect(tennis_db.DB_FILE)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
-    # Calculate date threshold
-    cutoff_date = (datetime.now() - timedelta(days=years * 365)).strftime('%Y-%m-%d')
-    
     # Fetch recent matches with opponent details
     c.execute("""
         SELECT m.*, 
@@ -43,24 +74,7 @@ def get_player_insights(player_id: str, years: int = 5):
     
     matches = [dict(row) for row in c.fetchall()]
     conn.close()
-    
-    if not matches:
-        return []
-    
-    insights = []
-    
-    # Run all pattern detectors
-    insights.extend(find_age_patterns(player_id, matches))
-    insights.extend(find_surface_patterns(player_id, matches))
-    insights.extend(find_country_patterns(player_id, matches))
-    insights.extend(find_set_patterns(player_id, matches))
-    insights.extend(find_streak_patterns(player_id, matches))
-    insights.extend(find_round_patterns(player_id, matches))
-    
-    # Sort by interest score (0% or 100% win rates are most interesting)
-    insights.sort(key=lambda x: (x['total_matches'], abs(x['win_pct'] - 50)), reverse=True)
-    
-    return insights[:10]  # Return top 10 insights
+    return matches
 
 
 def is_interesting(wins, losses, min_matches=3):
@@ -99,7 +113,13 @@ def format_match_list(matches, player_id):
     return result
 
 
-def find_age_patterns(player_id, matches):
+def _record(frame, mask):
+    """(wins, losses) among the matches selected by mask."""
+    wins = int((frame.is_win & mask).sum())
+    return wins, int(mask.sum()) - wins
+
+
+def find_age_patterns(player_id, frame):
     """Find patterns against different age groups."""
     insights = []
     
@@ -109,20 +129,9 @@ def find_age_patterns(player_id, matches):
     }
     
     for bucket_key, bucket_info in age_buckets.items():
-        bucket_matches = []
-        wins = 0
-        losses = 0
-        
-        for m in matches:
-            is_win = str(m.get('winner_id')) == str(player_id)
-            opponent_age = m.get('loser_age') if is_win else m.get('winner_age')
-            
-            if opponent_age and bucket_info['min'] <= opponent_age <= bucket_info['max']:
-                bucket_matches.append(m)
-                if is_win:
-                    wins += 1
-                else:
-                    losses += 1
+        # Unknown ages are NaN and fall outside every bucket
+        mask = (frame.opp_age >= bucket_info['min']) & (frame.opp_age <= bucket_info['max'])
+        wins, losses = _record(frame, mask)
         
         if is_interesting(wins, losses):
             insights.append({
@@ -134,13 +143,13 @@ def find_age_patterns(player_id, matches):
                 'losses': losses,
                 'total_matches': wins + losses,
                 'win_pct': round(100 * wins / (wins + losses), 1) if (wins + losses) > 0 else 0,
-                'matches': format_match_list(bucket_matches, player_id),
+                'matches': format_match_list(frame.row_list(mask), player_id),
             })
     
     return insights
 
 
-def find_surface_patterns(player_id, matches):
+def find_surface_patterns(player_id, frame):
     """Find patterns on different surfaces."""
     insights = []
     
@@ -151,9 +160,8 @@ def find_surface_patterns(player_id, matches):
     }
     
     for surface, info in surfaces.items():
-        surface_matches = [m for m in matches if m.get('surface') == surface]
-        wins = sum(1 for m in surface_matches if str(m.get('winner_id')) == str(player_id))
-        losses = len(surface_matches) - wins
+        mask = frame.surface_mask(surface)
+        wins, losses = _record(frame, mask)
         
         if is_interesting(wins, losses, min_matches=5):
             insights.append({
@@ -165,83 +173,57 @@ def find_surface_patterns(player_id, matches):
                 'losses': losses,
                 'total_matches': wins + losses,
                 'win_pct': round(100 * wins / (wins + losses), 1) if (wins + losses) > 0 else 0,
-                'matches': format_match_list(surface_matches, player_id),
+                'matches': format_match_list(frame.row_list(mask), player_id),
             })
     
     return insights
 
 
-def find_country_patterns(player_id, matches):
+def find_country_patterns(player_id, frame):
     """Find patterns against players from specific countries."""
     insights = []
     
-    country_stats = defaultdict(lambda: {'wins': 0, 'losses': 0, 'matches': []})
+    known = np.flatnonzero(np.not_equal(frame.opp_country, None))
+    if not len(known):
+        return insights
     
-    for m in matches:
-        is_win = str(m.get('winner_id')) == str(player_id)
-        opponent_country = m.get('loser_country') if is_win else m.get('winner_country')
-        
-        if opponent_country:
-            country_stats[opponent_country]['matches'].append(m)
-            if is_win:
-                country_stats[opponent_country]['wins'] += 1
-            else:
-                country_stats[opponent_country]['losses'] += 1
-    
-    for country, stats in country_stats.items():
-        if is_interesting(stats['wins'], stats['losses'], min_matches=4):
+    # Group by opponent country, in order of first appearance
+    countries, first_seen, group = np.unique(frame.opp_country[known].astype(str), return_index=True, return_inverse=True)
+    totals = np.bincount(group, minlength=len(countries))
+    wins_by_country = np.bincount(group, weights=frame.is_win[known], minlength=len(countries)).astype(int)
+    
+    for g in np.argsort(first_seen, kind='stable'):
+        country = str(countries[g])
+        wins = int(wins_by_country[g])
+        losses = int(totals[g]) - wins
+        if is_interesting(wins, losses, min_matches=4):
+            mask = np.zeros(len(frame), dtype=bool)
+            mask[known[group == g]] = True
             insights.append({
                 'category': 'country',
                 'emoji': '🌍',
                 'title': f"vs {country} Players",
-                'description': f"{stats['wins']}-{stats['losses']} against {country} opponents",
-                'wins': stats['wins'],
-                'losses': stats['losses'],
-                'total_matches': stats['wins'] + stats['losses'],
-                'win_pct': round(100 * stats['wins'] / (stats['wins'] + stats['losses']), 1),
-                'matches': format_match_list(stats['matches'], player_id),
+                'description': f"{wins}-{losses} against {country} opponents",
+                'wins': wins,
+                'losses': losses,
+                'total_matches': wins + losses,
+                'win_pct': round(100 * wins / (wins + losses), 1),
+                'matches': format_match_list(frame.row_list(mask), player_id),
             })
     
     return insights
 
 
-def find_set_patterns(player_id, matches):
+def find_set_patterns(player_id, frame):
     """Find patterns based on set scores (e.g., losing first set)."""
     insights = []
     
-    lost_first_set = {'wins': 0, 'losses': 0, 'matches': []}
+    # First set games are in match-winner orientation; NaN if unparseable (incl. W/O)
+    s1, s2 = frame.set_w[:, 0], frame.set_l[:, 0]
+    mask = (frame.is_win & (s1 < s2)) | (~frame.is_win & (s1 > s2))
+    wins, losses = _record(frame, mask)
     
-    for m in matches:
-        score = m.get('score', '')
-        if not score or score == 'W/O':
-            continue
-        
-        is_win = str(m.get('winner_id')) == str(player_id)
-        
-        # Parse first set
-        sets = score.split()
-        if not sets:
-            continue
-            
-        first_set = sets[0]
-        # Check if player lost first set
-        try:
-            parts = first_set.replace('(', '-').replace(')', '').split('-')
-            if len(parts) >= 2:
-                s1, s2 = int(parts[0]), int(parts[1])
-                player_lost_first = (is_win and s1 < s2) or (not is_win and s1 > s2)
-                
-                if player_lost_first:
-                    lost_first_set['matches'].append(m)
-                    if is_win:
-                        lost_first_set['wins'] += 1
-                    else:
-                        lost_first_set['losses'] += 1
-        except (ValueError, IndexError):
-            continue
-    
-    if is_interesting(lost_first_set['wins'], lost_first_set['losses'], min_matches=5):
-        wins, losses = lost_first_set['wins'], lost_first_set['losses']
+    if is_interesting(wins, losses, min_matches=5):
         insights.append({
             'category': 'set',
             'emoji': '🎯',
@@ -251,36 +233,24 @@ def find_set_patterns(player_id, matches):
             'losses': losses,
             'total_matches': wins + losses,
             'win_pct': round(100 * wins / (wins + losses), 1) if (wins + losses) > 0 else 0,
-            'matches': format_match_list(lost_first_set['matches'], player_id),
+            'matches': format_match_list(frame.row_list(mask), player_id),
         })
     
     return insights
 
 
-def find_streak_patterns(player_id, matches):
+def find_streak_patterns(player_id, frame):
     """Find current winning/losing streaks."""
     insights = []
     
-    if not matches:
+    if not len(frame):
         return insights
     
-    # Check current streak (matches are already sorted by date DESC)
-    streak = 0
-    streak_type = None
-    streak_matches = []
-    
-    for m in matches:
-        is_win = str(m.get('winner_id')) == str(player_id)
-        
-        if streak_type is None:
-            streak_type = 'W' if is_win else 'L'
-            streak = 1
-            streak_matches = [m]
-        elif (is_win and streak_type == 'W') or (not is_win and streak_type == 'L'):
-            streak += 1
-            streak_matches.append(m)
-        else:
-            break
+    # Current streak: leading run of equal results (matches are already sorted by date DESC)
+    changes = np.flatnonzero(frame.is_win != frame.is_win[0])
+    streak = int(changes[0]) if len(changes) else len(frame)
+    streak_type = 'W' if frame.is_win[0] else 'L'
+    streak_matches = frame.rows[:streak]
     
     if streak >= 5:
         if streak_type == 'W':
@@ -311,7 +281,7 @@ def find_streak_patterns(player_id, matches):
     return insights
 
 
-def find_round_patterns(player_id, matches):
+def find_round_patterns(player_id, frame):
     """Find patterns in specific tournament rounds."""
     insights = []
     
@@ -322,9 +292,8 @@ def find_round_patterns(player_id, matches):
     }
     
     for round_code, info in rounds.items():
-        round_matches = [m for m in matches if m.get('round') == round_code]
-        wins = sum(1 for m in round_matches if str(m.get('winner_id')) == str(player_id))
-        losses = len(round_matches) - wins
+        mask = frame.round_mask(round_code)
+        wins, losses = _record(frame, mask)
         
         if is_interesting(wins, losses, min_matches=3):
             insights.append({
@@ -336,7 +305,7 @@ def find_round_patterns(player_id, matches):
                 'losses': losses,
                 'total_matches': wins + losses,
                 'win_pct': round(100 * wins / (wins + losses), 1) if (wins + losses) > 0 else 0,
-                'matches': format_match_list(round_matches, player_id),
+                'matches': format_match_list(frame.row_list(mask), player_id),
             })
     
     return insights
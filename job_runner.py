@@ -0,0 +1,156 @@
+"""
+Job Runner - Bounded background executors for slow request work.
+
+Each JobRunner owns a small thread pool (its concurrency cap) and a
+registry of jobs. API handlers either await a job (async handlers, so no
+request thread is held while the work runs) or return its id straight away
+and let the client poll GET /jobs/{id}. Cheap endpoints keep the server's
+request threadpool to themselves even when many slow jobs are queued.
+
+Jobs live in memory only: finished jobs are dropped JOB_TTL seconds after
+they complete, and submit() refuses new work once max_pending jobs are
+queued or running (the API turns that into a 503).
+
+Usage:
+    from job_runner import JobRunner, get_job
+    ai_jobs = JobRunner('ai', max_workers=4)
+    job = ai_jobs.submit('game_plan', analysis_ai.generate_game_plan_real, player_id)
+    result = await job.wait()
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Seconds a finished job stays pollable
+JOB_TTL = 3600
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_runners = []
+
+
+class QueueFull(Exception):
+    """Raised by submit() when a runner already has max_pending unfinished jobs."""
+
+
+class Job:
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.progress = None    # (done, total) for jobs that report progress
+
+    def set_progress(self, done, total):
+        self.progress = (done, total)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    async def wait(self):
+        """Await the job's result from an async handler (re-raises the job's exception)."""
+        return await asyncio.wrap_future(self.future)
+
+    def to_dict(self):
+        now = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'created_at': self.created_at,
+            'elapsed_seconds': round(now - (self.started_at or self.created_at), 2),
+            'queue_seconds': round((self.started_at or now) - self.created_at, 2),
+            'progress': {'done': self.progress[0], 'total': self.progress[1]} if self.progress else None,
+            'result': self.result if self.status == DONE else None,
+            'error': self.error,
+        }
+
+
+class JobRunner:
+    def __init__(self, name, max_workers=4, max_pending=100):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        _runners.append(self)
+
+    def submit(self, kind, fn, *args, params=None, progress=False, **kwargs):
+        """
+        Queue fn(*args, **kwargs) and return its Job. Raises QueueFull when the runner is saturated.
+        progress=True also passes fn a progress=callback(done, total) keyword that updates the job.
+        """
+        job = Job(kind, params)
+        if progress:
+            kwargs['progress'] = job.set_progress
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if not j.finished)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{self.name} queue is full ({pending} jobs pending)")
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+            return job.result
+        except Exception as e:
+            logger.warning(f"{self.name} job {job.kind} {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'runner': self.name,
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'queued': sum(1 for j in jobs if j.status == QUEUED),
+            'running': sum(1 for j in jobs if j.status == RUNNING),
+            'finished': sum(1 for j in jobs if j.finished),
+        }
+
+
+def get_job(job_id):
+    """Look a job up across all runners (None if unknown or expired)."""
+    for runner in _runners:
+        job = runner.get(job_id)
+        if job is not None:
+            return job
+    return None
+
+
+def runner_stats():
+    return [runner.stats() for runner in _runners]
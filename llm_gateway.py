@@ -0,0 +1,227 @@
+"""
+LLM Gateway - Single entry point for the AI report generators in analysis_ai.
+
+- Reused client: Gemini is configured once and one GenerativeModel is kept per model name.
+- Persistent cache (llm_cache table) keyed by (template, template version, model, prompt hash).
+  The prompts embed the player's stats and any user context, so the prompt hash changes
+  whenever the player's data or the context changes.
+- Request coalescing: concurrent identical calls wait for the first one instead of
+  each calling the API.
+- Metrics: every call's latency, token counts and cache / coalesce outcome is logged to
+  llm_calls; summary() aggregates them for /ai/metrics.
+- Stub provider (LLM_PROVIDER=stub): deterministic offline responses for development
+  and testing without an API key.
+
+Usage:
+    from llm_gateway import llm_gateway
+    text = llm_gateway.generate('game_plan', prompt)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+import tennis_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'models/gemini-2.5-flash'
+
+# Bump a template's version when its prompt or output format changes to drop its cached responses
+TEMPLATE_VERSIONS = {
+    'game_plan': 1,
+    'quarterly_review': 1,
+    'match_simulation': 1,
+    'recruiting_email': 1,
+    'training_focus': 1,
+    'trajectory': 1,
+    'scholarship': 1,
+    'mental_coach': 1,
+}
+
+# Cached responses older than this are regenerated
+CACHE_TTL = timedelta(days=int(os.getenv("LLM_CACHE_TTL_DAYS", "7")))
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class GeminiProvider:
+    name = 'gemini'
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        self._genai = genai
+        self._api_key = api_key
+        self._models = {}
+        self._lock = threading.Lock()
+        genai.configure(api_key=api_key)
+
+    def _model(self, model_name):
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+            return model
+
+    def generate(self, prompt, model_name):
+        """-> (text, prompt_tokens, output_tokens)"""
+        response = self._model(model_name).generate_content(prompt)
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) if usage else None
+        output_tokens = getattr(usage, 'candidates_token_count', None) if usage else None
+        return response.text, prompt_tokens, output_tokens
+
+
+class StubProvider:
+    """Offline provider: echoes the prompt's headings with a deterministic placeholder body."""
+    name = 'stub'
+
+    def generate(self, prompt, model_name):
+        headings = [line.strip() for line in prompt.splitlines() if line.strip().startswith('###')]
+        body = '\n\n'.join(f"{h}\n[stub response {_hash(prompt + h)[:8]}]" for h in headings)
+        text = body or f"[stub response {_hash(prompt)[:8]}]"
+        # Rough token estimate (~4 characters per token)
+        return text, len(prompt) // 4, len(text) // 4
+
+
+class LLMGateway:
+    def __init__(self):
+        self._provider = None
+        self._provider_key = None
+        self._lock = threading.Lock()
+        self._inflight = {}     # cache key -> Future
+
+    def _get_provider(self):
+        """Provider for the current environment (rebuilt only if LLM_PROVIDER / the key changes)."""
+        choice = os.getenv("LLM_PROVIDER", "gemini").lower()
+        api_key = os.getenv("GEMINI_API_KEY")
+        key = (choice, api_key)
+        with self._lock:
+            if self._provider_key != key:
+                if choice == 'stub':
+                    self._provider = StubProvider()
+                elif api_key:
+                    self._provider = GeminiProvider(api_key)
+                else:
+                    self._provider = None
+                self._provider_key = key
+            return self._provider
+
+    def available(self):
+        """True if a provider is configured (a Gemini key, or LLM_PROVIDER=stub)."""
+        return self._get_provider() is not None
+
+    def generate(self, template, prompt, model=DEFAULT_MODEL, use_cache=True):
+        """
+        Text for `prompt`. Serves the persistent cache when possible and coalesces concurrent
+        identical requests. Raises the provider's exception on failure (nothing is cached).
+        """
+        provider = self._get_provider()
+        if provider is None:
+            raise RuntimeError("No LLM provider configured (set GEMINI_API_KEY or LLM_PROVIDER=stub)")
+        version = TEMPLATE_VERSIONS.get(template, 1)
+        cache_key = _hash(f"{provider.name}|{model}|{template}|v{version}|{prompt}")
+        start = time.time()
+
+        if use_cache:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                self._record(template, provider.name, model, 'hit', start, None, None)
+                return cached
+
+        # Coalesce: the first caller generates, identical concurrent callers wait for its result
+        with self._lock:
+            future = self._inflight.get(cache_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[cache_key] = future
+        if not leader:
+            text = future.result()
+            self._record(template, provider.name, model, 'coalesced', start, None, None)
+            return text
+
+        try:
+            text, prompt_tokens, output_tokens = provider.generate(prompt, model)
+            # Cache before releasing the in-flight slot so no later caller regenerates in between
+            self._cache_put(cache_key, template, version, model, provider.name, text)
+            future.set_result(text)
+        except Exception as e:
+            self._record(template, provider.name, model, 'error', start, None, None)
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+
+        self._record(template, provider.name, model, 'miss', start, prompt_tokens, output_tokens)
+        return text
+
+    def _cache_get(self, cache_key):
+        conn = tennis_db.get_pooled_connection()
+        try:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        except Exception:
+            return None
+        if not row or not row[1] or datetime.fromisoformat(row[1]) < datetime.now() - CACHE_TTL:
+            return None
+        return row[0]
+
+    def _cache_put(self, cache_key, template, version, model, provider, text):
+        conn = tennis_db.get_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO llm_cache (cache_key, template, template_version, model, provider, response, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (cache_key, template, version, model, provider, text, datetime.now().isoformat()))
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+        finally:
+            conn.close()
+
+    def _record(self, template, provider, model, outcome, start, prompt_tokens, output_tokens):
+        latency_ms = int((time.time() - start) * 1000)
+        logger.info(f"LLM {template} [{provider}] {outcome} in {latency_ms}ms "
+                    f"(tokens in={prompt_tokens}, out={output_tokens})")
+        conn = tennis_db.get_connection()
+        try:
+            conn.execute("""
+                INSERT INTO llm_calls (template, provider, model, outcome, latency_ms, prompt_tokens, output_tokens, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (template, provider, model, outcome, latency_ms, prompt_tokens, output_tokens, datetime.now().isoformat()))
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"LLM metrics write failed: {e}")
+        finally:
+            conn.close()
+
+    def summary(self, days=7):
+        """Per template / outcome call counts, latency and token totals over the last `days` days."""
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        conn = tennis_db.get_pooled_connection()
+        rows = conn.execute("""
+            SELECT template, outcome, COUNT(*), AVG(latency_ms), MAX(latency_ms),
+                   SUM(prompt_tokens), SUM(output_tokens)
+            FROM llm_calls WHERE created_at >= ?
+            GROUP BY template, outcome
+            ORDER BY template, outcome
+        """, (since,)).fetchall()
+        return [
+            {'template': r[0], 'outcome': r[1], 'calls': r[2],
+             'avg_latency_ms': round(r[3] or 0), 'max_latency_ms': r[4],
+             'prompt_tokens': r[5] or 0, 'output_tokens': r[6] or 0}
+            for r in rows
+        ]
+
+
+# Singleton instance
+llm_gateway = LLMGateway()
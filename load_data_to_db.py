@@ -101,6 +101,7 @@ def bulk_load_players(filepath, batch_size=200): # Reduced batch size due to mor
                 
                 if len(batch) >= batch_size:
                     conn.executemany(sql, batch)
+                    tennis_db.bump_version(conn, 'players')
                     conn.commit()
                     inserted += len(batch)
                     batch.clear()
@@ -112,6 +113,7 @@ def bulk_load_players(filepath, batch_size=200): # Reduced batch size due to mor
     # Final batch
     if batch:
         conn.executemany(sql, batch)
+        tennis_db.bump_version(conn, 'players')
         conn.commit()
         inserted += len(batch)
     
@@ -198,7 +200,13 @@ def bulk_load_matches(filepath, batch_size=2000):
                         new_players.clear()
                     
                     # Then insert matches
+                    match_ids = [m[0] for m in match_batch]
+                    # INSERT OR IGNORE: only ids not stored yet are new
+                    existing = tennis_db.existing_match_ids(conn, match_ids)
                     conn.executemany(match_sql, match_batch)
+                    new_ids = [mid for mid in match_ids if mid not in existing]
+                    tennis_db.bump_version(conn, 'matches', 'players', maintained=True)
+                    tennis_db.on_matches_stored(conn, new_ids, new_ids)
                     conn.commit()
                     inserted += len(match_batch)
                     match_batch.clear()
@@ -216,7 +224,12 @@ def bulk_load_matches(filepath, batch_size=2000):
         players_created += len(player_data)
     
     if match_batch:
+        match_ids = [m[0] for m in match_batch]
+        existing = tennis_db.existing_match_ids(conn, match_ids)
         conn.executemany(match_sql, match_batch)
+        new_ids = [mid for mid in match_ids if mid not in existing]
+        tennis_db.bump_version(conn, 'matches', 'players', maintained=True)
+        tennis_db.on_matches_stored(conn, new_ids, new_ids)
         conn.commit()
         inserted += len(match_batch)
     
@@ -262,6 +275,7 @@ def bulk_load_history(filepath, batch_size=5000):
                 
                 if len(batch) >= batch_size:
                     conn.executemany(sql, batch)
+                    tennis_db.bump_version(conn, 'utr_history')
                     conn.commit()
                     inserted += len(batch)
                     batch.clear()
@@ -274,6 +288,7 @@ def bulk_load_history(filepath, batch_size=5000):
     # Final batch
     if batch:
         conn.executemany(sql, batch)
+        tennis_db.bump_version(conn, 'utr_history')
         conn.commit()
         inserted += len(batch)
     
@@ -0,0 +1,177 @@
+"""
+Match Frame - Columnar view of one player's matches.
+
+Turns a list of match dicts (as returned by the matches queries / AnalysisContext)
+into NumPy columns from the player's point of view, so per-player metrics
+(form, bounce back, upsets, insights, export stats) are array operations
+instead of per-match loops with repeated id comparisons and date parsing.
+
+Columns keep the input order; `chronological()` / `newest_first()` give
+stable sort orders equivalent to sorting the dicts by their date string.
+"""
+
+import re
+from functools import lru_cache
+import numpy as np
+
+SURFACES = ['Hard', 'Clay', 'Grass', 'Carpet']
+ROUNDS = ['R128', 'R64', 'R32', 'R16', 'QF', 'SF', 'F', 'RR', 'Q1', 'Q2', 'Q3']
+
+# Per-set games are stored for at most this many sets
+MAX_SETS = 5
+
+_SURFACE_CODES = {s: i for i, s in enumerate(SURFACES)}
+_ROUND_CODES = {r: i for i, r in enumerate(ROUNDS)}
+_TB_SCORE = re.compile(r'\(\d+\)')
+
+
+@lru_cache(maxsize=4096)
+def _parse_score(score):
+    """
+    ("6-4 6-7(5) 7-5") -> (((6, 4), (6, 7), (7, 5)), 3)
+    Games per set in match-winner orientation (None for unparseable sets)
+    and the number of set tokens.
+    """
+    if not score:
+        return (), 0
+    tokens = _TB_SCORE.sub('', score).split()
+    sets = []
+    for token in tokens[:MAX_SETS]:
+        parsed = None
+        if '-' in token:
+            try:
+                w, l = map(int, token.split('-')[:2])
+                parsed = (w, l)
+            except ValueError:
+                pass
+        sets.append(parsed)
+    return tuple(sets), len(tokens)
+
+
+def _float_column(values):
+    """Floats with None / 0 / '' mapped to NaN (the loops treated them as 'missing')."""
+    return np.array([v if v else np.nan for v in values], dtype=np.float64)
+
+
+class MatchFrame:
+    """
+    Columns (length n, input order):
+      day        datetime64[D] (NaT if unknown)
+      is_win     player won
+      is_loss    player lost
+      own_utr    player's UTR in the match (NaN if unknown)
+      opp_utr    opponent's UTR in the match (NaN if unknown)
+      opp_age    opponent age (NaN if unknown)
+      opp_country opponent country (object, None if unknown)
+      surface    index into SURFACES, -1 if unknown
+      round      index into ROUNDS, -1 if unknown
+      set_w/set_l games per set (n, MAX_SETS), match-winner orientation, NaN padded
+      set_count  number of set tokens in the score
+      tournament tournament name (object)
+    """
+
+    def __init__(self, player_id, rows, columns):
+        self.player_id = str(player_id)
+        self.rows = rows
+        self.n = len(rows)
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self._columns = list(columns)
+
+    @classmethod
+    def of(cls, matches, player_id):
+        """Accept an existing MatchFrame or build one from match dicts."""
+        if isinstance(matches, MatchFrame):
+            return matches
+        return cls.from_matches(matches, player_id)
+
+    @classmethod
+    def from_matches(cls, matches, player_id):
+        pid = str(player_id)
+        rows = list(matches)
+        n = len(rows)
+
+        date_key = np.array([m.get('date') or '' for m in rows], dtype=str)
+        try:
+            day = np.array([d[:10] for d in date_key], dtype='datetime64[D]')
+        except ValueError:
+            day = np.array([_safe_day(d) for d in date_key], dtype='datetime64[D]')
+
+        is_win = np.array([str(m.get('winner_id')) for m in rows], dtype=str) == pid
+        is_loss = np.array([str(m.get('loser_id')) for m in rows], dtype=str) == pid
+
+        w_utr = _float_column(m.get('winner_utr') for m in rows)
+        l_utr = _float_column(m.get('loser_utr') for m in rows)
+        w_age = _float_column(m.get('winner_age') for m in rows)
+        l_age = _float_column(m.get('loser_age') for m in rows)
+        w_country = np.array([m.get('winner_country') or None for m in rows], dtype=object)
+        l_country = np.array([m.get('loser_country') or None for m in rows], dtype=object)
+
+        set_w = np.full((n, MAX_SETS), np.nan)
+        set_l = np.full((n, MAX_SETS), np.nan)
+        set_count = np.zeros(n, dtype=np.int16)
+        for i, m in enumerate(rows):
+            sets, count = _parse_score(m.get('score'))
+            set_count[i] = count
+            for j, games in enumerate(sets):
+                if games:
+                    set_w[i, j], set_l[i, j] = games
+
+        columns = {
+            'date_key': date_key,
+            'day': day,
+            'is_win': is_win,
+            'is_loss': is_loss,
+            'own_utr': np.where(is_win, w_utr, l_utr),
+            'opp_utr': np.where(is_win, l_utr, w_utr),
+            'opp_age': np.where(is_win, l_age, w_age),
+            'opp_country': np.where(is_win, l_country, w_country),
+            'surface': np.array([_SURFACE_CODES.get(m.get('surface'), -1) for m in rows], dtype=np.int8),
+            'round': np.array([_ROUND_CODES.get(m.get('round'), -1) for m in rows], dtype=np.int8),
+            'set_w': set_w,
+            'set_l': set_l,
+            'set_count': set_count,
+            'tournament': np.array([m.get('tournament') for m in rows], dtype=object),
+        }
+        return cls(pid, rows, columns)
+
+    def __len__(self):
+        return self.n
+
+    def take(self, index):
+        """Sub-frame for a boolean mask or index array (rows keep their order)."""
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        columns = {name: getattr(self, name)[index] for name in self._columns}
+        return MatchFrame(self.player_id, [self.rows[i] for i in index], columns)
+
+    def since(self, date_str):
+        """Matches dated on or after date_str (string compare, like the SQL filter)."""
+        return self.take((self.date_key != '') & (self.date_key >= date_str))
+
+    def chronological(self):
+        """Oldest-first order; ties keep input order (same as sorted(key=date))."""
+        return np.argsort(self.date_key, kind='stable')
+
+    def newest_first(self):
+        """Newest-first order; ties keep input order (same as sorted(key=date, reverse=True))."""
+        rev = np.argsort(self.date_key[::-1], kind='stable')[::-1]
+        return self.n - 1 - rev
+
+    def row_list(self, mask):
+        """Original match dicts selected by mask, in input order."""
+        return [self.rows[i] for i in np.flatnonzero(mask)]
+
+    def surface_mask(self, surface):
+        return self.surface == _SURFACE_CODES.get(surface, -2)
+
+    def round_mask(self, round_code):
+        return self.round == _ROUND_CODES.get(round_code, -2)
+
+
+def _safe_day(date_str):
+    try:
+        return np.datetime64(date_str[:10], 'D')
+    except ValueError:
+        return np.datetime64('NaT')
@@ -1,7 +1,13 @@
 import sqlite3
 import tennis_db
+import favorites_feed
 import feedparser
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import quote
+import hashlib
+import os
+import threading
 import time
 import requests
 import re
@@ -100,97 +106,281 @@ TOPICS = [
     {'query': 'ITF J200', 'category': 'ITF Junior'}
 ]
 
+# Feeds fetched at once
+NEWS_FETCH_WORKERS = int(os.getenv("NEWS_FETCH_WORKERS", "6"))
+
+# Seconds before a feed request is abandoned
+NEWS_FETCH_TIMEOUT = 15
+
+# Seconds between scheduled ingestion runs (0 disables the schedule)
+NEWS_REFRESH_INTERVAL = int(os.getenv("NEWS_REFRESH_INTERVAL", "1800"))
+
+USER_AGENT = 'CourtSideAnalytics/1.0 (+news ingestion)'
+
+
+def google_news_url(query):
+    return f"https://news.google.com/rss/search?q={quote(query)}&hl=en-US&gl=US&ceid=US:en"
+
+
+def external_feeds():
+    """Legacy feeds and Google News topic feeds as feed specs."""
+    feeds = [
+        {'url': f['url'], 'source': f['source'], 'category': f['category'], 'limit': 3}
+        for f in LEGACY_RSS_FEEDS
+    ]
+    for topic in TOPICS:
+        # Append when:7d to force recent news
+        feeds.append({
+            'url': google_news_url(topic['query'] + " when:7d"),
+            'source': 'Google News',
+            'category': topic['category'],
+            'limit': 10,             # Top 10 per topic
+            'split_source': True,    # Source often inside title "Title - Source"
+            'min_title': 10,         # Dedupe: skip if title is too short or weird
+        })
+    return feeds
+
+
+def favorites_feeds(conn):
+    """One Google News search feed per player favorited by any user."""
+    c = conn.cursor()
+    c.execute("""
+        SELECT DISTINCT p.player_id, p.name 
+        FROM user_favorites f
+        JOIN players p ON f.player_id = p.player_id
+    """)
+    return [{
+        'url': google_news_url(f'"{name}" tennis'),
+        'source': 'Google News',
+        'category': 'Player News',
+        'limit': 3,                  # Limit to top 3 per player to avoid clutter
+        'summary_length': 200,
+        'player_id_ref': pid,
+    } for pid, name in c.fetchall()]
+
+
+def local_feed(path, source, category, limit=None):
+    """Feed spec for a local RSS/Atom file (testing, replaying captured feeds)."""
+    return {'path': path, 'url': f"file://{os.path.abspath(path)}", 'source': source,
+            'category': category, 'limit': limit}
+
+
+def title_hash(title):
+    """Hash of the normalized title, so the same story from several feeds is stored once."""
+    normalized = re.sub(r'[^a-z0-9]+', ' ', (title or '').lower()).strip()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def fetch_feed(feed, state=None):
+    """
+    Download and parse one feed, sending the stored ETag / Last-Modified.
+    Returns {'status', 'parsed' (None when unchanged), 'etag', 'last_modified', 'error'}.
+    """
+    if feed.get('path'):
+        with open(feed['path'], 'rb') as f:
+            return {'status': 200, 'parsed': feedparser.parse(f.read()), 'etag': None, 'last_modified': None, 'error': None}
+
+    headers = {'User-Agent': USER_AGENT}
+    if state and state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state and state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    try:
+        response = requests.get(feed['url'], headers=headers, timeout=NEWS_FETCH_TIMEOUT)
+    except requests.RequestException as e:
+        return {'status': None, 'parsed': None, 'etag': None, 'last_modified': None, 'error': str(e)}
+
+    result = {
+        'status': response.status_code,
+        'parsed': None,
+        # A 304 may omit the validators: keep the ones we sent
+        'etag': response.headers.get('ETag') or (state or {}).get('etag'),
+        'last_modified': response.headers.get('Last-Modified') or (state or {}).get('last_modified'),
+        'error': None,
+    }
+    if response.status_code == 304:
+        return result
+    if response.status_code != 200:
+        result['error'] = f"HTTP {response.status_code}"
+        return result
+    result['parsed'] = feedparser.parse(response.content)
+    return result
+
+
+def _entry_items(feed, entries):
+    """News item dicts for a feed's entries (newest first as the feed lists them)."""
+    items = []
+    for entry in entries[:feed.get('limit')]:
+        title = entry.get('title') or ''
+        source = feed['source']
+        if feed.get('split_source') and " - " in title:
+            title, source = title.rsplit(" - ", 1)
+        if len(title) < feed.get('min_title', 1) or not entry.get('link'):
+            continue
+        
+        if entry.get('published_parsed'):
+            pub_date = datetime.fromtimestamp(time.mktime(entry.published_parsed)).isoformat()
+        else:
+            pub_date = datetime.now().isoformat()
+        
+        summary = entry.get('summary', '') or entry.get('description', '')
+        # Clean summary
+        length = feed.get('summary_length', 250)
+        clean_summary = re.sub('<[^<]+?>', '', summary)[:length]
+        if clean_summary and (len(clean_summary) == length or feed.get('player_id_ref')):
+            clean_summary += "..."
+        
+        # Image extraction attempt
+        image_url = None
+        if entry.get('media_content'):
+            image_url = entry.media_content[0].get('url')
+        elif entry.get('media_thumbnail'):
+            image_url = entry.media_thumbnail[0].get('url')
+        
+        items.append({
+            'title': title,
+            'summary': clean_summary,
+            'url': entry.link,
+            'source': source,
+            'image_url': image_url,
+            'published_at': pub_date,
+            'category': feed['category'],
+            'is_internal': 0,
+            'player_id_ref': feed.get('player_id_ref')
+        })
+    return items
+
+
+def _backfill_title_hashes(conn):
+    rows = conn.execute("SELECT id, title FROM news_items WHERE title_hash IS NULL").fetchall()
+    if rows:
+        conn.executemany("UPDATE news_items SET title_hash = ? WHERE id = ?",
+                         [(title_hash(title), news_id) for news_id, title in rows])
+
+
+def ingest_feeds(feeds, conn=None, max_workers=NEWS_FETCH_WORKERS):
+    """
+    Fetch feeds concurrently (bounded pool), skip unchanged ones via conditional GET,
+    and store entries whose URL and normalized title are both new. Titles are deduplicated
+    per player: a player feed's copy of a story first stored untagged tags the stored row
+    instead of being dropped. Returns run stats.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    start = time.time()
+    stats = {'feeds': len(feeds), 'not_modified': 0, 'errors': 0, 'new_items': 0, 'duplicates': 0}
+    try:
+        _backfill_title_hashes(conn)
+        states = {}
+        for row in conn.execute("SELECT url, etag, last_modified FROM news_feed_state"):
+            states[row[0]] = {'etag': row[1], 'last_modified': row[2]}
+        # title_hash -> player refs it is stored with (None for untagged copies)
+        known = {}
+        for h, player_ref in conn.execute("SELECT title_hash, player_id_ref FROM news_items WHERE title_hash IS NOT NULL"):
+            known.setdefault(h, set()).add(player_ref)
+
+        # Network and parsing in the pool; all database writes stay on this thread
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(fetch_feed, feed, states.get(feed['url'])): feed for feed in feeds}
+            for future in as_completed(futures):
+                feed = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': None, 'parsed': None, 'etag': None, 'last_modified': None, 'error': str(e)}
+                now = datetime.now().isoformat()
+                entries = result['parsed'].entries if result['parsed'] is not None else []
+                if result['error']:
+                    stats['errors'] += 1
+                    print(f"Failed to fetch {feed['url']}: {result['error']}")
+                elif result['status'] == 304:
+                    stats['not_modified'] += 1
+
+                try:
+                    for item in _entry_items(feed, entries):
+                        h = title_hash(item['title'])
+                        player_ref = item['player_id_ref']
+                        refs = known.setdefault(h, set())
+                        if (refs and player_ref is None) or player_ref in refs:
+                            stats['duplicates'] += 1
+                            continue
+                        if None in refs:
+                            # Seen untagged (e.g. a topic feed came first): tag that copy with the player
+                            tag_news_player(conn, h, player_ref)
+                            refs.discard(None)
+                            refs.add(player_ref)
+                            stats['duplicates'] += 1
+                            continue
+                        refs.add(player_ref)
+                        if save_news_item(conn, item):
+                            stats['new_items'] += 1
+                except Exception as e:
+                    # Keep the previous validators so the next run fetches this feed in full again
+                    stats['errors'] += 1
+                    print(f"Failed to process {feed['url']}: {e}")
+                    previous = states.get(feed['url']) or {}
+                    result = dict(result, etag=previous.get('etag'), last_modified=previous.get('last_modified'),
+                                  error=f"processing: {e}", parsed=None)
+
+                conn.execute("""
+                    INSERT INTO news_feed_state (url, etag, last_modified, last_status, last_error, last_fetched_at, last_changed_at, entries_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        etag = excluded.etag,
+                        last_modified = excluded.last_modified,
+                        last_status = excluded.last_status,
+                        last_error = excluded.last_error,
+                        last_fetched_at = excluded.last_fetched_at,
+                        last_changed_at = COALESCE(excluded.last_changed_at, news_feed_state.last_changed_at),
+                        entries_seen = excluded.entries_seen
+                """, (feed['url'], result['etag'], result['last_modified'], result['status'], result['error'],
+                      now, now if result['parsed'] is not None else None, len(entries)))
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    stats['seconds'] = round(time.time() - start, 2)
+    print(f"News: {stats['feeds']} feeds, {stats['not_modified']} unchanged, {stats['errors']} failed, "
+          f"{stats['new_items']} new items, {stats['duplicates']} duplicates in {stats['seconds']}s")
+    return stats
+
+
 def fetch_external_news():
     """Fetch and parse RSS feeds from Google News Topics and legacy sources."""
-    conn = get_connection()
-    from urllib.parse import quote
-    
     print("Fetching external news...")
-    
-    # 1. Fetch Legacy Feeds
-    for feed_info in LEGACY_RSS_FEEDS:
-        try:
-            print(f"Polling {feed_info['source']}...")
-            feed = feedparser.parse(feed_info['url'])
-            for entry in feed.entries[:3]:
-                save_rss_entry(conn, entry, feed_info['source'], feed_info['category'])
-        except Exception as e:
-            print(f"Failed to fetch {feed_info['source']}: {e}")
-
-    # 2. Fetch Google News Topics
-    for topic in TOPICS:
-        try:
-            print(f"Polling Topic: {topic['query']}...")
-            # Append when:7d to force recent news
-            search_query = topic['query'] + " when:7d"
-            encoded_query = quote(search_query)
-            rss_url = f"https://news.google.com/rss/search?q={encoded_query}&hl=en-US&gl=US&ceid=US:en"
-            
-            feed = feedparser.parse(rss_url)
-            for entry in feed.entries[:10]: # Top 10 per topic
-                # Source often inside title "Title - Source"
-                source = "Google News"
-                title = entry.title
-                if " - " in title:
-                    parts = title.rsplit(" - ", 1)
-                    title = parts[0]
-                    source = parts[1]
-                
-                # Dedupe: skip if title is too short or weird
-                if len(title) < 10: continue
-
-                save_rss_entry(conn, entry, source, topic['category'], title_override=title)
-                
-        except Exception as e:
-             print(f"Failed to fetch topic {topic['query']}: {e}")
+    return ingest_feeds(external_feeds())
 
-    conn.commit()
-    conn.close()
 
 def save_rss_entry(conn, entry, source_name, category, title_override=None):
     """Helper to parse and save a single RSS entry."""
-    title = title_override or entry.title
-    link = entry.link
-    
-    if hasattr(entry, 'published_parsed') and entry.published_parsed:
-        pub_date = datetime.fromtimestamp(time.mktime(entry.published_parsed)).isoformat()
-    else:
-        pub_date = datetime.now().isoformat()
-    
-    summary = entry.get('summary', '') or entry.get('description', '')
-    # Clean summary
-    clean_summary = re.sub('<[^<]+?>', '', summary)[:250]
-    if len(clean_summary) == 250: clean_summary += "..."
-    
-    # Image extraction attempt
-    image_url = None
-    if 'media_content' in entry:
-        image_url = entry.media_content[0]['url']
-    elif 'media_thumbnail' in entry:
-        image_url = entry.media_thumbnail[0]['url']
-        
-    save_news_item(conn, {
-        'title': title,
-        'summary': clean_summary,
-        'url': link,
-        'source': source_name,
-        'image_url': image_url,
-        'published_at': pub_date,
-        'category': category,
-        'is_internal': 0,
-        'player_id_ref': None
-    })
+    feed = {'source': source_name, 'category': category}
+    for item in _entry_items(feed, [entry]):
+        if title_override:
+            item['title'] = title_override
+        save_news_item(conn, item)
+
+
+def tag_news_player(conn, title_hash_value, player_id):
+    """Attach a player to untagged stored copies of a story and fan them out to the player's followers."""
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM news_items WHERE title_hash = ? AND player_id_ref IS NULL", (title_hash_value,)
+    )]
+    if ids:
+        conn.executemany("UPDATE news_items SET player_id_ref = ? WHERE id = ?", [(player_id, i) for i in ids])
+        favorites_feed.fan_out_news(conn, ids)
+    return len(ids)
 
 
 def save_news_item(conn, item):
-    """Insert news item if URL doesn't exist."""
+    """Insert news item if URL doesn't exist. Returns True if a row was added."""
     sql = """
     INSERT OR IGNORE INTO news_items 
-    (title, summary, url, source, image_url, published_at, category, is_internal, player_id_ref)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    (title, summary, url, source, image_url, published_at, category, is_internal, player_id_ref, title_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
     try:
-        conn.execute(sql, (
+        cursor = conn.execute(sql, (
             item['title'],
             item['summary'],
             item['url'],
@@ -199,83 +389,94 @@ def save_news_item(conn, item):
             item['published_at'], 
             item['category'],
             item['is_internal'],
-            item['player_id_ref']
+            item['player_id_ref'],
+            title_hash(item['title'])
         ))
+        if cursor.rowcount == 0:
+            return False
+        if item['player_id_ref']:
+            favorites_feed.fan_out_news(conn, [cursor.lastrowid])
+        return True
     except Exception as e:
         print(f"Error saving news: {e}")
+        return False
 
 
 def fetch_favorites_news():
     """Fetch news for all players that are marked as favorites by any user using Google News RSS."""
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Get all unique favorited players
     print("Fetching news for favorite players...")
-    query = """
-        SELECT DISTINCT p.player_id, p.name 
-        FROM user_favorites f
-        JOIN players p ON f.player_id = p.player_id
-    """
-    c.execute(query)
-    favorites = c.fetchall()
-    
-    conn.close() # Close and reopen inside loop or helper to manage scope if needed, but here simple is fine.
-    # actually better to keep open or pass to save_news_item. save_news_item opens its own execution/helper? 
-    # Current save_news_item takes `conn`. So let's keep `conn` open.
-    
-    # Re-open for writing
     conn = get_connection()
-    
-    from urllib.parse import quote
-    
-    for pid, name in favorites:
-        try:
-            # Construct Google News RSS Search Query
-            search_query = f'"{name}" tennis'
-            encoded_query = quote(search_query)
-            rss_url = f"https://news.google.com/rss/search?q={encoded_query}&hl=en-US&gl=US&ceid=US:en"
-            
-            print(f"Searching news for {name}...")
-            feed = feedparser.parse(rss_url)
-            
-            count = 0
-            for entry in feed.entries[:3]: # Limit to top 3 per player to avoid clutter
-                title = entry.title
-                link = entry.link
-                
-                # Google News RSS dates are standard RFC822, feedparser handles them well usually
-                if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                    pub_date = datetime.fromtimestamp(time.mktime(entry.published_parsed)).isoformat()
-                else:
-                    pub_date = datetime.now().isoformat()
-                
-                summary = entry.get('summary', '') or entry.get('description', '')
-                clean_summary = re.sub('<[^<]+?>', '', summary)[:200]
-                if clean_summary: clean_summary += "..."
-                
-                # Image: Google RSS often doesn't give good images, maybe try to match source or leave generic
-                image_url = None 
-                
-                save_news_item(conn, {
-                    'title': title,
-                    'summary': clean_summary,
-                    'url': link,
-                    'source': 'Google News', # Or split title "Title - Source"
-                    'image_url': image_url,
-                    'published_at': pub_date,
-                    'category': 'Player News',
-                    'is_internal': 0,
-                    'player_id_ref': pid
-                })
-                count += 1
-            print(f"  Found {count} items.")
-            
-        except Exception as e:
-            print(f"Error fetching news for {name}: {e}")
-            
-    conn.commit()
-    conn.close()
+    try:
+        return ingest_feeds(favorites_feeds(conn), conn)
+    finally:
+        conn.close()
+
+
+def run_news_ingest():
+    """One full ingestion pass: internal news, then every external and favorites feed."""
+    generate_internal_news()
+    conn = get_connection()
+    try:
+        return ingest_feeds(external_feeds() + favorites_feeds(conn), conn)
+    finally:
+        conn.close()
+
+
+class NewsIngestWorker:
+    """Runs run_news_ingest on a schedule in a daemon thread; trigger() requests an extra run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pending = None        # Future resolved by the next run
+        self.last_run = None        # stats of the last finished run
+        self.last_run_at = None
+
+    def start(self, interval=NEWS_REFRESH_INTERVAL):
+        """Start the worker thread (runs every `interval` seconds; 0 = only on trigger())."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                self._wake.wait(interval or None)
+                if self._stop.is_set():
+                    break
+                with self._lock:
+                    self._wake.clear()
+                    future, self._pending = self._pending, None
+                try:
+                    stats = run_news_ingest()
+                    self.last_run, self.last_run_at = stats, datetime.now().isoformat()
+                    if future:
+                        future.set_result(stats)
+                except Exception as e:
+                    print(f"News ingestion failed: {e}")
+                    if future:
+                        future.set_exception(e)
+
+        self._thread = threading.Thread(target=loop, name="news-ingest", daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """Ask for a run as soon as possible; concurrent triggers share one run. Returns a Future of its stats."""
+        self.start()
+        with self._lock:
+            if self._pending is None:
+                self._pending = Future()
+            future = self._pending
+            self._wake.set()
+        return future
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+# Singleton instance
+news_worker = NewsIngestWorker()
 
 if __name__ == "__main__":
     generate_internal_news()
@@ -0,0 +1,152 @@
+"""
+Ongoing Tournaments - Tournaments with matches in the last few days, with their latest results.
+
+The snapshot comes from one query: the most recently active tournaments in
+the window, and a ROW_NUMBER() per tournament to keep each one's newest
+matches. It is cached for CACHE_TTL seconds and dropped early when the
+matches / players data version changes (i.e. once a refresh writer commits),
+so repeated views and stream subscribers share one computation.
+
+stream() yields Server-Sent Events: the current snapshot on connect, then
+a new one whenever it changes, with keep-alive comments in between.
+
+Usage:
+    from ongoing_tournaments import ongoing_tournaments
+    data = ongoing_tournaments.get()['data']
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import tennis_db
+
+# A tournament is ongoing if it has matches in the last WINDOW_DAYS days
+WINDOW_DAYS = 7
+MAX_TOURNAMENTS = 20
+MATCHES_PER_TOURNAMENT = 50
+
+# Seconds a snapshot is served without recomputing (data changes invalidate it sooner)
+CACHE_TTL = float(os.getenv("ONGOING_CACHE_TTL", "60"))
+
+# Seconds between stream checks for a new snapshot (a keep-alive is sent when nothing changed)
+STREAM_INTERVAL = float(os.getenv("ONGOING_STREAM_INTERVAL", "15"))
+
+ONGOING_QUERY = """
+    WITH top AS (
+        SELECT tournament, MIN(date) AS start_date, MAX(date) AS end_date, COUNT(*) AS count
+        FROM matches
+        WHERE date >= :cutoff AND tournament IS NOT NULL
+        GROUP BY tournament
+        ORDER BY end_date DESC, count DESC
+        LIMIT :max_tournaments
+    ), ranked AS (
+        SELECT m.tournament, m.match_id, m.date, m.score,
+               m.winner_id, w.name AS winner, w.utr_singles AS winner_utr,
+               m.loser_id, l.name AS loser, l.utr_singles AS loser_utr,
+               ROW_NUMBER() OVER (PARTITION BY m.tournament ORDER BY m.date DESC, m.match_id DESC) AS rn
+        FROM top t
+        JOIN matches m ON m.tournament = t.tournament AND m.date >= :cutoff
+        JOIN players w ON m.winner_id = w.player_id
+        JOIN players l ON m.loser_id = l.player_id
+    )
+    SELECT t.tournament, t.start_date, t.end_date, t.count,
+           r.match_id, r.date, r.score, r.winner_id, r.winner, r.winner_utr,
+           r.loser_id, r.loser, r.loser_utr
+    FROM top t
+    LEFT JOIN ranked r ON r.tournament = t.tournament AND r.rn <= :max_matches
+    ORDER BY t.end_date DESC, t.count DESC, t.tournament, r.rn
+"""
+
+MATCH_FIELDS = ('match_id', 'date', 'score', 'winner_id', 'winner', 'winner_utr', 'loser_id', 'loser', 'loser_utr')
+
+
+def tournament_priority(name):
+    """0 WTA/ATP/Grand Slam, 1 ITF, 2 ITF Junior, 3 College, 4 other."""
+    name_lower = name.lower() if name else ""
+    if 'wta' in name_lower or 'atp' in name_lower or 'grand slam' in name_lower:
+        return 0
+    if 'itf' in name_lower and 'junior' not in name_lower and 'jr' not in name_lower:
+        return 1
+    if 'itf' in name_lower and ('junior' in name_lower or 'jr' in name_lower):
+        return 2
+    if 'college' in name_lower or 'ncaa' in name_lower or 'university' in name_lower or 'collegiate' in name_lower:
+        return 3
+    return 4
+
+
+def compute(conn, now=None):
+    """Ongoing tournaments, WTA/ATP first then ITF, ITF Junior, College, other; newest activity first within each."""
+    cutoff = ((now or datetime.now()) - timedelta(days=WINDOW_DAYS)).strftime("%Y-%m-%d")
+    rows = conn.execute(ONGOING_QUERY, {
+        'cutoff': cutoff, 'max_tournaments': MAX_TOURNAMENTS, 'max_matches': MATCHES_PER_TOURNAMENT
+    }).fetchall()
+
+    results = []
+    by_name = {}
+    for row in rows:
+        t = by_name.get(row[0])
+        if t is None:
+            t = by_name[row[0]] = {
+                "name": row[0],
+                "start_date": row[1],
+                "last_activity": row[2],
+                "match_count": row[3],
+                "matches": [],
+                "priority": tournament_priority(row[0])
+            }
+            results.append(t)
+        if row[4] is not None:
+            t["matches"].append(dict(zip(MATCH_FIELDS, row[4:])))
+
+    # Stable sorts: last activity descending, then priority
+    results.sort(key=lambda t: t['last_activity'] or '', reverse=True)
+    results.sort(key=lambda t: t['priority'])
+    return results
+
+
+class OngoingTournaments:
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None       # {'count', 'data', 'etag'}
+        self._version = None
+        self._expires_at = 0.0
+
+    def get(self):
+        """Current snapshot {'count', 'data', 'etag'}; recomputed when expired or the data changed."""
+        conn = tennis_db.get_pooled_connection()
+        version = tennis_db.get_data_version(conn, 'matches', 'players')
+        with self._lock:
+            if self._snapshot is not None and version == self._version and time.time() < self._expires_at:
+                return self._snapshot
+            start = time.time()
+            data = compute(conn)
+            etag = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+            self._snapshot = {"count": len(data), "data": data, "etag": etag}
+            self._version = version
+            self._expires_at = time.time() + self.ttl
+            print(f"OngoingTournaments: {len(data)} tournaments in {time.time() - start:.3f}s")
+            return self._snapshot
+
+    async def stream(self, is_disconnected=None, interval=STREAM_INTERVAL):
+        """SSE messages: a 'tournaments' event per new snapshot, keep-alive comments otherwise."""
+        last_etag = None
+        while True:
+            if is_disconnected is not None and await is_disconnected():
+                return
+            snapshot = await asyncio.to_thread(self.get)
+            if snapshot['etag'] != last_etag:
+                last_etag = snapshot['etag']
+                payload = json.dumps({"count": snapshot['count'], "data": snapshot['data']}, default=str)
+                yield f"event: tournaments\nid: {last_etag}\ndata: {payload}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(interval)
+
+
+# Singleton instance
+ongoing_tournaments = OngoingTournaments()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Player Identity - Cross-source ID map (UTR ids, sackmann ids, atp_/wta_ ranking ids).
+
+An offline job links every known ID of a person and writes one player_identity
+row per alias with the ID used in the matches table (utr_id), the ID used in
+the rankings table (ranking_id) and a confidence score. Request-time ID
+translation is then a single primary-key lookup, cached in-process (LRU).
+
+Link sources, strongest first:
+  - id format          sackmann-atp-N / sackmann-wta-N / sackmann_N player rows
+  - sackmann_player_map  matches imported by import_sackmann.py
+  - name               players.name == sackmann_profiles.full_name (NOCASE),
+                       adjusted by country / date of birth agreement
+
+Usage:
+    python player_identity.py --rebuild
+    python player_identity.py --lookup sackmann-atp-104925
+"""
+
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import tennis_db
+from ranking_series import series_player_ids
+
+# Links below this confidence are not written
+MIN_CONFIDENCE = 0.6
+
+# In-process LRU size (aliases)
+CACHE_SIZE = 100000
+
+# How often (seconds) to poll data_versions and drop the cache after a rebuild
+VERSION_CHECK_INTERVAL = 30.0
+
+IDENTITY_COLUMNS = ['alias_id', 'canonical_id', 'utr_id', 'ranking_id', 'confidence', 'method', 'updated_at']
+
+
+def format_ranking_ids(player_id):
+    """Ranking ids implied by the id format alone (no lookups), most likely first."""
+    pid = str(player_id)
+    if pid.startswith('atp_') or pid.startswith('wta_'):
+        return [pid]
+    if pid.startswith('sackmann-atp-'):
+        return [pid.replace('sackmann-atp-', 'atp_')]
+    if pid.startswith('sackmann-wta-'):
+        return [pid.replace('sackmann-wta-', 'wta_')]
+    if pid.startswith('sackmann_'):
+        suffix = pid.replace('sackmann_', '')
+        return [f"atp_{suffix}", f"wta_{suffix}"]
+    return [f"atp_{pid}", f"wta_{pid}"]
+
+
+def _pick_tour(candidates, ranking_ids, gender):
+    """Among atp_/wta_ candidates, keep the ones that exist; break ties by gender."""
+    existing = [r for r in candidates if r in ranking_ids]
+    if len(existing) > 1 and gender in ('M', 'F'):
+        preferred = 'atp_' if gender == 'M' else 'wta_'
+        existing.sort(key=lambda r: not r.startswith(preferred))
+    return existing[0] if existing else None
+
+
+def _normalize_dob(value):
+    digits = ''.join(ch for ch in str(value or '') if ch.isdigit())
+    return digits[:8] if len(digits) >= 8 else None
+
+
+def _name_variants(name):
+    """(variant, base confidence): exact name, then 'Last, First' swapped."""
+    variants = [(name.strip().lower(), 0.8)]
+    if ',' in name:
+        parts = name.split(',')
+        if len(parts) == 2:
+            variants.append((f"{parts[1].strip()} {parts[0].strip()}".lower(), 0.7))
+    return variants
+
+
+def build_links(conn):
+    """
+    Best ranking-id link per players row.
+    Returns {player_id: (ranking_id, confidence, method)} and the set of ranking ids.
+    """
+    c = conn.cursor()
+    ranking_ids = {str(r[0]) for r in c.execute("SELECT DISTINCT player_id FROM rankings WHERE player_id IS NOT NULL")}
+    ranking_ids |= series_player_ids(conn)
+
+    # Profiles keyed by lowercase name; profile ids may be 'atp_N' or a bare number + tour
+    profiles_by_name = {}
+    for sackmann_id, full_name, country, dob, tour in c.execute(
+            "SELECT sackmann_id, full_name, country, dob, tour FROM sackmann_profiles"):
+        sid = str(sackmann_id)
+        if sid in ranking_ids or sid.startswith('atp_') or sid.startswith('wta_'):
+            ranking_id = sid
+        elif tour:
+            ranking_id = f"{tour.lower()}_{sid}"
+        else:
+            ranking_id = _pick_tour([f"atp_{sid}", f"wta_{sid}"], ranking_ids, None)
+        if ranking_id and full_name:
+            profiles_by_name.setdefault(full_name.strip().lower(), []).append((ranking_id, country, _normalize_dob(dob)))
+
+    links = {}
+
+    def offer(player_id, ranking_id, confidence, method):
+        if ranking_id and confidence >= MIN_CONFIDENCE:
+            current = links.get(player_id)
+            if current is None or confidence > current[1]:
+                links[player_id] = (ranking_id, round(confidence, 3), method)
+
+    genders = {}
+    for player_id, name, country, birth_date, gender in c.execute(
+            "SELECT player_id, name, country, birth_date, gender FROM players"):
+        player_id = str(player_id)
+        genders[player_id] = gender
+
+        # 1. ID format
+        if player_id.startswith('sackmann-atp-') or player_id.startswith('sackmann-wta-'):
+            offer(player_id, format_ranking_ids(player_id)[0], 1.0, 'id_format')
+        elif player_id.startswith('sackmann_'):
+            offer(player_id, _pick_tour(format_ranking_ids(player_id), ranking_ids, gender), 0.95, 'id_format')
+
+        # 3. Name (+ country / date of birth)
+        if not name:
+            continue
+        dob = _normalize_dob(birth_date)
+        best = None
+        tied = False
+        for variant, base in _name_variants(name):
+            for ranking_id, p_country, p_dob in profiles_by_name.get(variant, []):
+                if dob and p_dob and dob != p_dob:
+                    continue
+                score = base
+                if dob and p_dob:
+                    score = 1.0
+                elif country and p_country:
+                    score += 0.1 if country == p_country else -0.2
+                if best is None or score > best[1]:
+                    best, tied = (ranking_id, score), False
+                elif score == best[1] and ranking_id != best[0]:
+                    tied = True
+            if best:
+                break
+        if best and not tied:
+            offer(player_id, best[0], best[1], 'name')
+
+    # 2. Mappings recorded by import_sackmann.py (bare Sackmann numbers)
+    try:
+        mapped = c.execute("SELECT sackmann_id, player_id, matched_by FROM sackmann_player_map").fetchall()
+    except Exception:
+        mapped = []
+    for sackmann_id, player_id, matched_by in mapped:
+        if not player_id:
+            continue
+        player_id = str(player_id)
+        ranking_id = _pick_tour(format_ranking_ids(f"sackmann_{sackmann_id}"), ranking_ids, genders.get(player_id))
+        offer(player_id, ranking_id, 0.75 if matched_by == 'fuzzy' else 0.95, f"map_{matched_by or 'import'}")
+
+    return links, ranking_ids
+
+
+def _ranking_aliases(ranking_id):
+    """Ids that name a ranked player directly: atp_N and sackmann-atp-N.
+    Bare profile numbers are not aliased - they would collide with numeric UTR ids."""
+    aliases = [ranking_id]
+    tour, _, number = ranking_id.partition('_')
+    if tour in ('atp', 'wta') and number:
+        aliases.append(f"sackmann-{tour}-{number}")
+    return aliases
+
+
+def rebuild_identity_map(conn):
+    """Recompute all links and replace the player_identity table."""
+    start = time.time()
+    links, ranking_ids = build_links(conn)
+    now = datetime.now().isoformat()
+
+    # Group players by the person (ranking id) they link to; the canonical matches id
+    # is the most confident numeric UTR id, else the most confident member
+    groups = {}
+    for player_id, (ranking_id, confidence, method) in links.items():
+        groups.setdefault(ranking_id, []).append((player_id, confidence, method))
+
+    rows = {}
+
+    def add(alias, canonical, utr_id, ranking_id, confidence, method):
+        if alias not in rows:
+            rows[alias] = (alias, canonical, utr_id, ranking_id, confidence, method, now)
+
+    for ranking_id, members in groups.items():
+        members.sort(key=lambda m: (not m[0].isdigit(), -m[1]))
+        canonical = members[0][0]
+        best_confidence = max(m[1] for m in members)
+        for player_id, confidence, method in members:
+            # Numeric ids key their own matches; sackmann-style rows resolve to the UTR id
+            utr_id = player_id if player_id.isdigit() else canonical
+            add(player_id, canonical, utr_id, ranking_id, confidence, method)
+        for alias in _ranking_aliases(ranking_id):
+            add(alias, canonical, canonical, ranking_id, best_confidence, 'ranking')
+
+    # Ranked players without any players row
+    for ranking_id in ranking_ids:
+        for alias in _ranking_aliases(ranking_id):
+            add(alias, ranking_id, None, ranking_id, 1.0, 'ranking')
+
+    c = conn.cursor()
+    c.execute("DELETE FROM player_identity")
+    c.executemany(
+        f"INSERT INTO player_identity ({', '.join(IDENTITY_COLUMNS)}) VALUES ({', '.join(['?'] * len(IDENTITY_COLUMNS))})",
+        list(rows.values())
+    )
+    tennis_db.bump_version(conn, 'player_identity')
+    conn.commit()
+    identity_resolver.clear()
+    print(f"Player identity: {len(rows)} aliases, {len(links)} linked players, "
+          f"{len(groups)} ranked people in {time.time() - start:.1f}s")
+    return len(rows)
+
+
+class IdentityResolver:
+    """alias -> identity row, with an LRU in front of the player_identity PK lookups."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self._maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def _check_version(self, conn):
+        now = time.time()
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        version = tennis_db.get_data_version(conn, 'player_identity')
+        if version != self._version:
+            with self._lock:
+                self._cache.clear()
+                self._version = version
+
+    def lookup_many(self, ids, conn=None):
+        """{alias: identity dict} for the ids that are known (one query for cache misses)."""
+        conn = conn or tennis_db.get_pooled_connection()
+        self._check_version(conn)
+        ids = [str(i) for i in ids if i]
+        found = {}
+        missing = []
+        with self._lock:
+            for alias in ids:
+                if alias in self._cache:
+                    self._cache.move_to_end(alias)
+                    if self._cache[alias] is not None:
+                        found[alias] = self._cache[alias]
+                else:
+                    missing.append(alias)
+        if not missing:
+            return found
+
+        fetched = {}
+        missing = list(dict.fromkeys(missing))
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            try:
+                rows = conn.execute(
+                    f"SELECT {', '.join(IDENTITY_COLUMNS)} FROM player_identity WHERE alias_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+            except Exception:
+                # Table not created yet
+                rows = []
+            for row in rows:
+                fetched[row[0]] = dict(zip(IDENTITY_COLUMNS, row))
+
+        with self._lock:
+            for alias in missing:
+                self._cache[alias] = fetched.get(alias)
+                self._cache.move_to_end(alias)
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        found.update(fetched)
+        return found
+
+    def lookup(self, alias, conn=None):
+        return self.lookup_many([alias], conn).get(str(alias))
+
+    def utr_id(self, player_id, conn=None):
+        """ID used in the matches table for any known alias (the input itself if unknown)."""
+        identity = self.lookup(player_id, conn)
+        return identity['utr_id'] if identity and identity['utr_id'] else player_id
+
+    def ranking_ids(self, player_ids, conn=None):
+        """{player_id: [ranking ids to try]} - the linked id if known, else the id-format guesses."""
+        identities = self.lookup_many(player_ids, conn)
+        result = {}
+        for pid in player_ids:
+            pid = str(pid)
+            identity = identities.get(pid)
+            result[pid] = [identity['ranking_id']] if identity and identity['ranking_id'] else format_ranking_ids(pid)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+# Singleton instance
+identity_resolver = IdentityResolver()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build / query the cross-source player identity map')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute all links from players, profiles and rankings')
+    parser.add_argument('--lookup', help='Show the identity row for an ID')
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.rebuild:
+            rebuild_identity_map(conn)
+        if args.lookup:
+            row = identity_resolver.lookup(args.lookup, conn)
+            print(row if row else f"No identity for {args.lookup} (format guess: {format_ranking_ids(args.lookup)})")
+        if not args.rebuild and not args.lookup:
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from datetime import datetime
 import argparse
 import sys
 import sqlite3
+import tennis_db
 from config import UTR_CONFIG
 
 # Configuration
@@ -293,6 +294,7 @@ def main():
         # 1b. Reset active status for this college to prevent stale data
         # Only reset if we actually found the college
         cursor.execute("UPDATE players SET is_active_college = 0 WHERE college_id = ?", (col_info['id'],))
+        tennis_db.bump_version(conn, 'players')
         conn.commit()
 
         # 2. Get Roster
@@ -339,6 +341,7 @@ def main():
                 """, (p['id'], p['name'], col_info['name'], col_info['id'], p['gradYear'], args.division.upper(), args.gender, p['utr'], p['doublesUtr'], now))
                 new_count += 1
                 
+        tennis_db.bump_version(conn, 'players')
         conn.commit()
         print(f" -> Updated: {updated_count}, New: {new_count}")
         total_updated += updated_count
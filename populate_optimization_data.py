@@ -1,5 +1,6 @@
 import sqlite3
 import time
+import tennis_db
 
 def populate():
     conn = sqlite3.connect('tennis_data.db')
@@ -19,10 +20,12 @@ def populate():
         ))
     ) AND (college IS NULL OR college = '-' OR college LIKE '%Recruiting%')"""
     c.execute(f"UPDATE players SET scout_category = 'junior' WHERE {junior_where}")
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
     
     print("  Categorizing players (College)...")
     c.execute("UPDATE players SET scout_category = 'college' WHERE is_active_college = 1")
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
     
     print("  Categorizing players (Adult)...")
@@ -37,6 +40,7 @@ def populate():
         ))
     ) AND (is_active_college = 0 OR is_active_college IS NULL) AND scout_category IS NULL"""
     c.execute(f"UPDATE players SET scout_category = 'adult' WHERE {adult_where}")
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
 
     # 2. Update match statistics
@@ -65,6 +69,7 @@ def populate():
         SET match_count = COALESCE((SELECT cnt FROM temp_match_stats WHERE temp_match_stats.player_id = players.player_id), 0),
             latest_match_date = (SELECT last_date FROM temp_match_stats WHERE temp_match_stats.player_id = players.player_id)
     """)
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
     
     print(f"  Population complete in {time.time() - start_time:.2f}s.")
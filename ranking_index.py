@@ -0,0 +1,220 @@
+"""
+Ranking Index - As-of ATP/WTA ranking lookups.
+
+Holds every ranking week (ranking_series plus rankings rows not yet synced)
+as two flat NumPy arrays (day number, rank) sorted by (player_id, date),
+with per-player offsets, so "rank of X on date D" is a
+binary search instead of scanning and re-parsing ranking dates. Matches use
+UTR ids while rankings use Sackmann ids; ranking_candidates() bridges the
+two through the precomputed player_identity map (see player_identity.py).
+The index is rebuilt whenever the rankings data version changes.
+"""
+
+import threading
+import time
+import numpy as np
+import tennis_db
+from player_identity import identity_resolver
+from ranking_series import iter_series
+
+# How often (seconds) to poll data_versions for changes
+VERSION_CHECK_INTERVAL = 30.0
+
+# A ranking only counts for a match if it was published less than this many days before
+MAX_RANK_AGE_DAYS = 60
+
+_NAT = np.iinfo(np.int32).min
+
+
+def to_day(date_str):
+    """'YYYY-MM-DD[...]' -> day number (days since 1970-01-01), None if unparseable."""
+    try:
+        return int(np.datetime64(date_str[:10], 'D').astype(np.int64))
+    except (TypeError, ValueError):
+        return None
+
+
+def _days(dates):
+    """Vectorized to_day; unparseable dates become _NAT."""
+    try:
+        return np.array([d[:10] if d else 'NaT' for d in dates], dtype='datetime64[D]').astype(np.int64).clip(_NAT).astype(np.int32)
+    except ValueError:
+        days = [to_day(d or '') for d in dates]
+        return np.array([_NAT if d is None else d for d in days], dtype=np.int32)
+
+
+def day_to_str(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+class RankingIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._days = np.empty(0, dtype=np.int32)
+        self._ranks = np.empty(0, dtype=np.int32)
+        self._offsets = {}      # ranking player_id -> (start, end)
+
+    def build(self, conn):
+        """Load all rankings (encoded series plus rankings rows not yet synced) into the flat arrays."""
+        start = time.time()
+        version = tennis_db.get_data_version(conn, 'rankings', 'ranking_series')
+
+        id_parts, day_parts, rank_parts = [], [], []
+        for player_id, series in iter_series(conn):
+            ranked = series.ranks >= 0
+            id_parts.append(np.full(int(ranked.sum()), player_id, dtype=object))
+            day_parts.append(series.days[ranked])
+            rank_parts.append(series.ranks[ranked])
+
+        rows = conn.execute("""
+            SELECT r.player_id, r.date, r.rank FROM rankings r
+            LEFT JOIN ranking_series s ON s.player_id = r.player_id
+            WHERE r.rank IS NOT NULL AND r.date IS NOT NULL
+              AND (s.last_date IS NULL OR r.date > s.last_date)
+        """).fetchall()
+        if rows:
+            id_parts.append(np.array([str(r[0]) for r in rows], dtype=object))
+            day_parts.append(_days([r[1] for r in rows]))
+            rank_parts.append(np.array([r[2] for r in rows], dtype=np.int32))
+
+        ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=object)
+        days = np.concatenate(day_parts).astype(np.int32) if day_parts else np.empty(0, dtype=np.int32)
+        ranks = np.concatenate(rank_parts).astype(np.int32) if rank_parts else np.empty(0, dtype=np.int32)
+        # Sort by (player_id, day)
+        order = np.lexsort((days, ids.astype(str)))
+        ids, days, ranks = ids[order], days[order], ranks[order]
+
+        offsets = {}
+        i = 0
+        n = len(ids)
+        while i < n:
+            j = i
+            pid = ids[i]
+            while j < n and ids[j] == pid:
+                j += 1
+            offsets[str(pid)] = (i, j)
+            i = j
+
+        with self._lock:
+            self._days = days
+            self._ranks = ranks
+            self._offsets = offsets
+            self._version = version
+            self._checked_at = time.time()
+
+        print(f"RankingIndex: indexed {n} rankings for {len(offsets)} players in {time.time() - start:.2f}s")
+
+    def ensure_fresh(self, conn=None):
+        """Rebuild if the rankings data changed since the last build (polled at most every VERSION_CHECK_INTERVAL)."""
+        now = time.time()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+
+        # Only the first build blocks; later rebuilds serve the old arrays meanwhile
+        if not self._build_lock.acquire(blocking=self._version is None):
+            return
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = tennis_db.get_connection()
+            version = tennis_db.get_data_version(conn, 'rankings', 'ranking_series')
+            self._checked_at = now
+            if version != self._version:
+                self.build(conn)
+        finally:
+            if own_conn and conn is not None:
+                conn.close()
+            self._build_lock.release()
+
+    def has_rankings(self, ranking_id):
+        return str(ranking_id) in self._offsets
+
+    def rank_on(self, ranking_id, day, max_age_days=MAX_RANK_AGE_DAYS):
+        """
+        Latest (rank, day) for a ranking player id published on or before `day`
+        and less than max_age_days old, else None.
+        """
+        span = self._offsets.get(str(ranking_id))
+        if span is None or day is None:
+            return None
+        start, end = span
+        days = self._days
+        i = int(np.searchsorted(days[start:end], day, side='right')) - 1
+        if i < 0:
+            return None
+        rank_day = int(days[start + i])
+        if day - rank_day >= max_age_days:
+            return None
+        return int(self._ranks[start + i]), rank_day
+
+    def ranks_on(self, ranking_id, days, max_age_days=MAX_RANK_AGE_DAYS):
+        """Vectorized rank_on over an array of days -> (ranks, rank_days) with -1 where unranked."""
+        days = np.asarray(days, dtype=np.int64)
+        ranks = np.full(len(days), -1, dtype=np.int64)
+        rank_days = np.full(len(days), -1, dtype=np.int64)
+        span = self._offsets.get(str(ranking_id))
+        if span is None or not len(days):
+            return ranks, rank_days
+        start, end = span
+        player_days = self._days[start:end]
+        idx = np.searchsorted(player_days, days, side='right') - 1
+        found = idx >= 0
+        candidate_days = np.where(found, player_days[np.maximum(idx, 0)], 0)
+        valid = found & (days != _NAT) & (days - candidate_days < max_age_days)
+        ranks[valid] = self._ranks[start + idx[valid]]
+        rank_days[valid] = candidate_days[valid]
+        return ranks, rank_days
+
+    def first_rank_on(self, candidates, day, max_age_days=MAX_RANK_AGE_DAYS):
+        """rank_on for the first candidate id that has an applicable ranking."""
+        for cid in candidates:
+            hit = self.rank_on(cid, day, max_age_days)
+            if hit:
+                return hit
+        return None
+
+    def annotate_matches(self, conn, matches, max_age_days=MAX_RANK_AGE_DAYS):
+        """Add winner_rank / loser_rank (ATP/WTA rank at match time, or None) to each match dict."""
+        if not matches:
+            return matches
+        self.ensure_fresh(conn)
+
+        player_ids = {str(m.get(f'{side}_id')) for m in matches for side in ('winner', 'loser') if m.get(f'{side}_id')}
+        candidates = ranking_candidates(conn, player_ids)
+
+        days = _days([m.get('date') for m in matches])
+        for side in ('winner', 'loser'):
+            # Group matches by player so each player's ranks are one vectorized search
+            by_player = {}
+            for i, m in enumerate(matches):
+                pid = m.get(f'{side}_id')
+                m[f'{side}_rank'] = None
+                if pid:
+                    by_player.setdefault(str(pid), []).append(i)
+            for pid, rows in by_player.items():
+                rows = np.array(rows)
+                pending = rows
+                for cid in candidates.get(pid, []):
+                    if not len(pending):
+                        break
+                    ranks, _ = self.ranks_on(cid, days[pending], max_age_days)
+                    hit = ranks >= 0
+                    for i, rank in zip(pending[hit], ranks[hit]):
+                        matches[i][f'{side}_rank'] = int(rank)
+                    pending = pending[~hit]
+        return matches
+
+
+def ranking_candidates(conn, player_ids):
+    """
+    {player_id: [ranking ids to try, in order]} for UTR / Sackmann style ids.
+    One player_identity lookup for ids not already cached; unlinked ids fall back to id-format guesses.
+    """
+    return identity_resolver.ranking_ids([str(pid) for pid in player_ids if pid], conn)
+
+
+# Singleton instance
+ranking_index = RankingIndex()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Ranking Series - Compact per-player store for weekly ATP/WTA rankings.
+
+The rankings table keeps one row per player per week, which is what the
+importers write. This module folds those rows into one ranking_series row
+per player: day number, rank, points and tours as int32 columns, delta-encoded
+along time (weekly dates and slowly moving ranks become small repeating
+numbers) and zlib-compressed into a single BLOB. A ranking chart is then a
+single-row read plus a decode.
+
+Missing values (NULL rank / points / tours) are stored as -1.
+
+Once players are synced, their older rankings rows can be pruned (--prune),
+keeping only the latest week per tour for the importers' MAX(date) checks.
+Pruned weeks are recorded in ranking_weeks; importers check imported_dates()
+so they do not re-insert them.
+Readers (api, RankingIndex, player_identity) combine the series with any
+rankings rows newer than the series' last_date, so unsynced imports still show up.
+
+Usage:
+    python ranking_series.py --sync
+    python ranking_series.py --sync --full
+    python ranking_series.py --prune
+    python ranking_series.py --show atp_104925
+"""
+
+import argparse
+import time
+import zlib
+from datetime import datetime
+import numpy as np
+import tennis_db
+from downsample import downsample_indices
+
+# BLOB layout version (first byte)
+FORMAT_VERSION = 1
+
+# Columns stored per ranking week, in BLOB order
+COLUMNS = ('day', 'rank', 'points', 'tours')
+
+MISSING = -1
+
+# Players encoded per batch while syncing
+SYNC_BATCH = 500
+
+
+def _to_int(value):
+    return MISSING if value is None else int(value)
+
+
+def encode(days, ranks, points, tours):
+    """Columns (sorted by day) -> BLOB."""
+    table = np.vstack([np.asarray(col, dtype=np.int64) for col in (days, ranks, points, tours)])
+    deltas = np.diff(table, axis=1, prepend=0).astype('<i4')
+    return bytes([FORMAT_VERSION]) + zlib.compress(deltas.tobytes(), 6)
+
+
+def decode(blob, n):
+    """BLOB -> (4, n) int32 array of day, rank, points, tours."""
+    if not blob or blob[0] != FORMAT_VERSION:
+        raise ValueError("Unknown ranking series format")
+    deltas = np.frombuffer(zlib.decompress(blob[1:]), dtype='<i4').reshape(len(COLUMNS), n)
+    return np.cumsum(deltas, axis=1, dtype=np.int64).astype(np.int32)
+
+
+def _day_strings(days):
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype(str)
+
+
+def _as_day(date):
+    """'YYYY-MM-DD' or a day number -> day number."""
+    if isinstance(date, str):
+        return int(np.datetime64(date[:10], 'D').astype(np.int64))
+    return int(date)
+
+
+class RankingSeries:
+    """One player's rankings as parallel int32 arrays, oldest first (-1 = missing)."""
+
+    def __init__(self, player_id, days, ranks, points, tours):
+        self.player_id = player_id
+        self.days = days
+        self.ranks = ranks
+        self.points = points
+        self.tours = tours
+
+    @classmethod
+    def from_blob(cls, player_id, blob, n):
+        days, ranks, points, tours = decode(blob, n)
+        return cls(player_id, days, ranks, points, tours)
+
+    @classmethod
+    def from_rows(cls, player_id, rows):
+        """(date, rank, points, tours) rows; rows without a date are skipped, later duplicates of a day win."""
+        rows = [r for r in rows if r[0]]
+        series = cls(player_id, *(np.empty(0, dtype=np.int32) for _ in COLUMNS))
+        if not rows:
+            return series
+        days = np.array([r[0][:10] for r in rows], dtype='datetime64[D]').astype(np.int64)
+        return series.merge(days, *(np.array([_to_int(r[i]) for r in rows]) for i in (1, 2, 3)))
+
+    def merge(self, days, ranks, points, tours):
+        """New series with extra weeks added; on the same day the new values win."""
+        all_days = np.concatenate([self.days, days]).astype(np.int64)
+        columns = [np.concatenate([old, new]) for old, new in
+                   ((self.ranks, ranks), (self.points, points), (self.tours, tours))]
+        # Last occurrence of each day, in day order
+        order = np.argsort(all_days[::-1], kind='stable')
+        reversed_days = all_days[::-1][order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = reversed_days[1:] != reversed_days[:-1]
+        index = (len(all_days) - 1 - order)[keep]
+        return RankingSeries(self.player_id, all_days[index].astype(np.int32),
+                             *(col[index].astype(np.int32) for col in columns))
+
+    def encode(self):
+        return encode(self.days, self.ranks, self.points, self.tours)
+
+    def __len__(self):
+        return len(self.days)
+
+    def take(self, index):
+        return RankingSeries(self.player_id, self.days[index], self.ranks[index],
+                             self.points[index], self.tours[index])
+
+    def between(self, start=None, end=None):
+        """Weeks with start <= date <= end (dates or day numbers, either bound optional)."""
+        lo = 0 if start is None else int(np.searchsorted(self.days, _as_day(start), side='left'))
+        hi = len(self.days) if end is None else int(np.searchsorted(self.days, _as_day(end), side='right'))
+        return self.take(slice(lo, hi))
+
+    def every(self, step):
+        """Every step-th week (e.g. 4 for roughly monthly), always keeping the latest week."""
+        if step <= 1 or len(self.days) <= 1:
+            return self
+        index = np.arange(0, len(self.days), step)
+        if index[-1] != len(self.days) - 1:
+            index = np.append(index, len(self.days) - 1)
+        return self.take(index)
+
+    def downsample(self, max_points, method='lttb'):
+        """At most max_points ranked weeks chosen to keep the chart shape (see downsample.py)."""
+        if not max_points or len(self.days) <= max_points:
+            return self
+        ranked = np.flatnonzero(self.ranks != MISSING)
+        keep = downsample_indices(self.days[ranked], self.ranks[ranked], max_points, method)
+        return self.take(ranked[keep])
+
+    def dates(self):
+        return _day_strings(self.days).tolist()
+
+    def to_rows(self):
+        """[{'date', 'rank', 'points', 'tours'}] like the rankings table rows, oldest first."""
+        def value(v):
+            return None if v == MISSING else int(v)
+        return [
+            {'date': date, 'rank': value(rank), 'points': value(points), 'tours': value(tours)}
+            for date, rank, points, tours in zip(self.dates(), self.ranks, self.points, self.tours)
+        ]
+
+    def to_columns(self):
+        """{'date': [...], 'rank': [...], 'points': [...], 'tours': [...]} with None for missing values."""
+        def values(col):
+            return [None if v == MISSING else v for v in col.tolist()]
+        return {'date': self.dates(), 'rank': values(self.ranks), 'points': values(self.points), 'tours': values(self.tours)}
+
+
+def _pending_rows(conn, player_ids):
+    """rankings rows newer than each player's encoded series (all rows if unsynced) -> {player_id: [rows]}."""
+    pending = {}
+    placeholders = ','.join(['?'] * len(player_ids))
+    rows = conn.execute(f"""
+        SELECT r.player_id, r.date, r.rank, r.points, r.tours
+        FROM rankings r
+        LEFT JOIN ranking_series s ON s.player_id = r.player_id
+        WHERE r.player_id IN ({placeholders})
+          AND (s.last_date IS NULL OR r.date > s.last_date)
+        ORDER BY r.player_id, r.date
+    """, list(player_ids)).fetchall()
+    for player_id, date, rank, points, tours in rows:
+        pending.setdefault(player_id, []).append((date, rank, points, tours))
+    return pending
+
+
+def load_series(conn, player_ids):
+    """
+    {player_id: RankingSeries} for the given ranking ids (one series query, one rankings query).
+    Includes rankings rows imported since the last sync.
+    """
+    player_ids = [str(p) for p in player_ids]
+    if not player_ids:
+        return {}
+    placeholders = ','.join(['?'] * len(player_ids))
+    result = {}
+    for player_id, n, data in conn.execute(
+            f"SELECT player_id, n, data FROM ranking_series WHERE player_id IN ({placeholders})", player_ids):
+        result[player_id] = RankingSeries.from_blob(player_id, data, n)
+    for player_id, rows in _pending_rows(conn, player_ids).items():
+        extra = RankingSeries.from_rows(player_id, rows)
+        base = result.get(player_id)
+        result[player_id] = base.merge(extra.days, extra.ranks, extra.points, extra.tours) if base else extra
+    return result
+
+
+def iter_series(conn):
+    """Yield (player_id, RankingSeries) for every encoded player (without pending rankings rows)."""
+    for player_id, n, data in conn.execute("SELECT player_id, n, data FROM ranking_series"):
+        yield player_id, RankingSeries.from_blob(player_id, data, n)
+
+
+def series_player_ids(conn):
+    return {r[0] for r in conn.execute("SELECT player_id FROM ranking_series")}
+
+
+def _stale_players(conn, full):
+    """Ranking ids whose rankings rows are not fully encoded yet (every ranked id with full=True)."""
+    if full:
+        sql = "SELECT DISTINCT player_id FROM rankings WHERE player_id IS NOT NULL"
+    else:
+        sql = """
+            SELECT DISTINCT r.player_id
+            FROM rankings r
+            LEFT JOIN ranking_series s ON s.player_id = r.player_id
+            WHERE r.player_id IS NOT NULL
+              AND (s.player_id IS NULL OR r.date > s.last_date)
+        """
+    return [r[0] for r in conn.execute(sql)]
+
+
+def sync_series(conn, full=False):
+    """
+    Fold rankings rows into ranking_series. Incremental by default (players with
+    weeks after their last encoded date); full=True re-merges every ranked player,
+    e.g. after historical weeks were re-imported or corrected.
+    """
+    start = time.time()
+    player_ids = _stale_players(conn, full)
+    now = datetime.now().isoformat()
+    c = conn.cursor()
+    weeks = 0
+    for i in range(0, len(player_ids), SYNC_BATCH):
+        chunk = player_ids[i:i + SYNC_BATCH]
+        placeholders = ','.join(['?'] * len(chunk))
+        existing = {
+            player_id: RankingSeries.from_blob(player_id, data, n)
+            for player_id, n, data in c.execute(
+                f"SELECT player_id, n, data FROM ranking_series WHERE player_id IN ({placeholders})", chunk)
+        }
+        rows_by_player = {}
+        for player_id, date, rank, points, tours in c.execute(f"""
+                SELECT player_id, date, rank, points, tours FROM rankings
+                WHERE player_id IN ({placeholders})
+                ORDER BY player_id, date
+            """, chunk):
+            rows_by_player.setdefault(player_id, []).append((date, rank, points, tours))
+
+        records = []
+        for player_id, rows in rows_by_player.items():
+            series = RankingSeries.from_rows(player_id, rows)
+            base = existing.get(player_id)
+            if base is not None:
+                series = base.merge(series.days, series.ranks, series.points, series.tours)
+            if not len(series):
+                continue
+            dates = series.dates()
+            records.append((player_id, len(series), dates[0], dates[-1], series.encode(), now))
+            weeks += len(series)
+        c.executemany("""
+            INSERT OR REPLACE INTO ranking_series (player_id, n, first_date, last_date, data, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, records)
+        tennis_db.bump_version(conn, 'ranking_series')
+        conn.commit()
+    print(f"Ranking series: synced {len(player_ids)} players ({weeks} weeks) in {time.time() - start:.1f}s")
+    return len(player_ids)
+
+
+def imported_dates(conn, tour):
+    """Ranking dates already imported for a tour ('atp' / 'wta'), including weeks pruned from rankings."""
+    return {r[0] for r in conn.execute("""
+        SELECT DISTINCT date FROM rankings WHERE player_id LIKE ?
+        UNION
+        SELECT date FROM ranking_weeks WHERE tour = ?
+    """, (f"{tour}_%", tour))}
+
+
+def prune_rankings(conn, vacuum=True):
+    """
+    Delete rankings rows already encoded in ranking_series, except each tour's latest week
+    (import_rankings_current / track_finalists read the current snapshot from the rankings table).
+    The pruned weeks are recorded in ranking_weeks first.
+    """
+    c = conn.cursor()
+    latest = dict(c.execute("""
+        SELECT substr(player_id, 1, 4) as tour, MAX(date) FROM rankings
+        WHERE player_id IS NOT NULL GROUP BY tour
+    """).fetchall())
+    now = datetime.now().isoformat()
+    deleted = 0
+    for tour, latest_date in latest.items():
+        prunable = """
+            FROM rankings
+            WHERE substr(player_id, 1, 4) = ? AND date < ?
+              AND date <= (SELECT s.last_date FROM ranking_series s WHERE s.player_id = rankings.player_id)
+        """
+        c.execute(f"""
+            INSERT OR IGNORE INTO ranking_weeks (tour, date, pruned_at)
+            SELECT DISTINCT substr(player_id, 1, instr(player_id, '_') - 1), date, ? {prunable}
+        """, (now, tour, latest_date))
+        c.execute(f"DELETE {prunable}", (tour, latest_date))
+        deleted += c.rowcount
+    tennis_db.bump_version(conn, 'rankings')
+    conn.commit()
+    print(f"Ranking series: pruned {deleted} encoded rankings rows")
+    if vacuum and deleted:
+        conn.execute("VACUUM")
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build / inspect the compact rankings time series')
+    parser.add_argument('--sync', action='store_true', help='Encode new rankings rows into ranking_series')
+    parser.add_argument('--full', action='store_true', help='With --sync: re-merge every ranked player')
+    parser.add_argument('--prune', action='store_true', help='Delete encoded rankings rows (keeps the latest week) and VACUUM')
+    parser.add_argument('--show', help='Print the decoded series of a ranking id (e.g. atp_104925)')
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.sync or args.prune:
+            sync_series(conn, full=args.full)
+        if args.prune:
+            prune_rankings(conn)
+        if args.show:
+            series = load_series(conn, [args.show]).get(args.show)
+            if series is None:
+                print(f"No rankings for {args.show}")
+            else:
+                for row in series.to_rows():
+                    print(f"  {row['date']}  #{row['rank']}  {row['points']} pts")
+        if not (args.sync or args.prune or args.show):
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
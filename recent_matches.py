@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Recent Matches - Rolling materialized window behind /matches/recent.
+
+The recent_matches table holds the last WINDOW_DAYS days of matches already
+joined with both players' attributes, once per side (W / L). Each row also
+carries the "focus" player's UTR, gender, country and a precomputed junior
+flag, so the feed filters are plain parameterized, indexed predicates instead
+of two 4-way joins with a dozen age_group LIKEs per side.
+
+Match writers call add_matches() and save_player calls refresh_players();
+they bump data versions with maintained=True, which also advances the
+HOOKED_VERSION marker. The maintenance thread prunes rows that left the window
+and rebuilds it only when the players / matches versions moved by more than
+that marker, i.e. when writers that bypass the hooks changed them.
+
+Usage:
+    python recent_matches.py --rebuild    # Rebuild the window now
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Days of matches kept (the longest look-back /matches/recent serves)
+WINDOW_DAYS = int(os.getenv("RECENT_MATCHES_WINDOW_DAYS", "31"))
+
+# Seconds between maintenance passes (prune, rebuild on data changes)
+MAINTENANCE_INTERVAL = float(os.getenv("RECENT_MATCHES_MAINTENANCE_INTERVAL", "900"))
+
+# Only sides whose player is rated above this show up in the feed
+MIN_UTR = 8
+
+MAX_RESULTS = 500
+
+# data_versions row counting the players / matches bumps made by writers that ran the hooks
+HOOKED_VERSION = 'recent_matches_hooked'
+
+# Ids per IN (...) query, well under SQLite's variable limit
+CHUNK_SIZE = 500
+
+PLAYER_FIELDS = [
+    ('name', 'name'), ('country', 'country'), ('utr_singles', 'utr'), ('age', 'age'), ('age_group', 'age_group'),
+    ('gender', 'gender'), ('comeback_wins', 'comeback_wins'), ('tiebreak_wins', 'tiebreak_wins'),
+    ('tiebreak_losses', 'tiebreak_losses'), ('three_set_wins', 'three_set_wins'), ('three_set_losses', 'three_set_losses'),
+]
+
+MATCH_FIELDS = ['match_id', 'date', 'tournament', 'round', 'score', 'winner_id', 'loser_id']
+
+# Columns served by /matches/recent, in order
+RECENT_COLUMNS = MATCH_FIELDS + [f"{side}_{alias}" for side in ('winner', 'loser') for _, alias in PLAYER_FIELDS]
+
+FOCUS_COLUMNS = ['side', 'focus_id', 'focus_utr', 'focus_gender', 'focus_country', 'focus_junior']
+
+
+def _junior_sql(p):
+    """SQL flag (0/1): the player is a junior by age or age group."""
+    return f"""
+        CASE WHEN ({p}.age IS NOT NULL AND {p}.age <= 18)
+              OR ({p}.age_group IS NOT NULL AND (
+                  {p}.age_group LIKE '%U%' OR {p}.age_group LIKE '%Junior%' OR
+                  {p}.age_group LIKE '%12%' OR {p}.age_group LIKE '%14%' OR
+                  {p}.age_group LIKE '%16%' OR {p}.age_group LIKE '%18%'
+              ))
+        THEN 1 ELSE 0 END
+    """
+
+
+def _insert_sql(where_sql):
+    """INSERT OR REPLACE both sides of the matches selected by where_sql (over matches m)."""
+    select_cols = [f"m.{c}" for c in MATCH_FIELDS]
+    select_cols += [f"{p}.{col}" for p in ('w', 'l') for col, _ in PLAYER_FIELDS]
+    parts = []
+    for side, p in (('W', 'w'), ('L', 'l')):
+        focus = [f"'{side}'", f"{p}.player_id", f"{p}.utr_singles", f"{p}.gender", f"{p}.country", _junior_sql(p)]
+        parts.append(f"""
+            SELECT {', '.join(select_cols + focus)}
+            FROM matches m
+            JOIN players w ON m.winner_id = w.player_id
+            JOIN players l ON m.loser_id = l.player_id
+            WHERE {where_sql}
+        """)
+    return f"""
+        INSERT OR REPLACE INTO recent_matches ({', '.join(RECENT_COLUMNS + FOCUS_COLUMNS)})
+        {' UNION ALL '.join(parts)}
+    """
+
+
+def window_cutoff(now=None, days=WINDOW_DAYS):
+    return ((now or datetime.now()) - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _chunks(ids):
+    ids = list(dict.fromkeys(str(i) for i in ids if i is not None))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def add_matches(conn, match_ids):
+    """Add / refresh stored matches that fall inside the window. The caller commits."""
+    cutoff = window_cutoff()
+    for chunk in _chunks(match_ids):
+        # Two params per side: the match ids and the cutoff
+        where = f"m.match_id IN ({', '.join('?' * len(chunk))}) AND m.date >= ?"
+        conn.execute(_insert_sql(where), (chunk + [cutoff]) * 2)
+
+
+def refresh_players(conn, player_ids):
+    """Re-join the window rows of players whose attributes changed."""
+    for chunk in _chunks(player_ids):
+        placeholders = ', '.join('?' * len(chunk))
+        match_ids = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT match_id FROM recent_matches WHERE winner_id IN ({placeholders}) OR loser_id IN ({placeholders})",
+            chunk * 2
+        )]
+        add_matches(conn, match_ids)
+
+
+def prune(conn):
+    """Drop rows that left the window. Returns the number of rows removed."""
+    return conn.execute("DELETE FROM recent_matches WHERE date < ?", (window_cutoff(),)).rowcount
+
+
+def rebuild(conn):
+    """Recompute the whole window from matches and players."""
+    start = time.time()
+    conn.execute("DELETE FROM recent_matches")
+    conn.execute(_insert_sql("m.date >= ?"), (window_cutoff(),) * 2)
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM recent_matches").fetchone()[0]
+    logger.info("recent_matches rebuilt rows=%d window_days=%d elapsed_ms=%d",
+                count, WINDOW_DAYS, (time.time() - start) * 1000)
+    return count
+
+
+def query(conn, days=10, country=None, category=None, gender=None):
+    """Recent matches whose winner or loser (one row per qualifying side) matches the filters."""
+    start = time.time()
+    sql = f"SELECT {', '.join(RECENT_COLUMNS)} FROM recent_matches WHERE date >= ? AND focus_utr > ?"
+    params = [window_cutoff(days=days), MIN_UTR]
+    if gender and gender != 'ALL':
+        sql += " AND focus_gender = ?"
+        params.append(gender)
+    if category in ('junior', 'adult'):
+        sql += " AND focus_junior = ?"
+        params.append(1 if category == 'junior' else 0)
+    if country and country != 'ALL':
+        sql += " AND focus_country = ?"
+        params.append(country)
+    sql += " ORDER BY winner_three_set_wins DESC, date DESC LIMIT ?"
+    params.append(MAX_RESULTS)
+
+    rows = [dict(zip(RECENT_COLUMNS, row)) for row in conn.execute(sql, params).fetchall()]
+    logger.info("recent_matches query country=%s category=%s gender=%s days=%d rows=%d elapsed_ms=%.1f",
+                country, category, gender, days, len(rows), (time.time() - start) * 1000)
+    return rows
+
+
+class RecentMatchesMaintainer:
+    """Daemon thread: prune every interval, rebuild when players / matches changed outside the hooks."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self._version = None
+
+    def run_once(self):
+        import tennis_db
+
+        conn = tennis_db.get_connection()
+        try:
+            # Bumps from hooked writers cancel out against the marker
+            version = tennis_db.get_data_version(conn, 'players', 'matches') - tennis_db.get_data_version(conn, HOOKED_VERSION)
+            if version != self._version:
+                rebuild(conn)
+                # The rebuild itself does not touch the versioned tables
+                self._version = version
+            else:
+                removed = prune(conn)
+                conn.commit()
+                if removed:
+                    logger.info("recent_matches pruned rows=%d", removed)
+        finally:
+            conn.close()
+
+    def start(self, interval=MAINTENANCE_INTERVAL):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.warning("recent_matches maintenance failed: %s", e)
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="recent-matches", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Singleton instance
+recent_matches_maintainer = RecentMatchesMaintainer()
+
+
+def main():
+    import tennis_db
+
+    parser = argparse.ArgumentParser(description='Maintain the recent_matches window')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the window from matches and players')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.rebuild:
+            print(f"Rebuilt recent_matches: {rebuild(conn)} rows")
+        else:
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
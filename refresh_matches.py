@@ -5,6 +5,7 @@ import requests
 import sys
 import concurrent.futures
 import tennis_db
+import elo_engine
 from config import UTR_CONFIG
 from datetime import datetime
 
@@ -209,5 +210,13 @@ def main():
 
     print(f"\nMatch Refresh Complete. Added {total_added} matches across {processed_count} players.")
 
+    if total_added:
+        # Overwritten matches get new rowids, so only a full replay counts them once
+        conn = tennis_db.get_connection()
+        try:
+            elo_engine.update_ratings(conn, full=args.overwrite)
+        finally:
+            conn.close()
+
 if __name__ == "__main__":
     main()
@@ -7,6 +7,9 @@ def main():
     parser = argparse.ArgumentParser(description='Refresh Tennis News (Delta Update)')
     parser.add_argument('--internal-only', action='store_true', help='Only generate internal news (Tournament Winners)')
     parser.add_argument('--external-only', action='store_true', help='Only fetch external RSS news')
+    parser.add_argument('--feed-file', action='append', default=[], metavar='PATH',
+                        help='Ingest a local RSS/Atom file instead of the live feeds (repeatable)')
+    parser.add_argument('--category', default='ATP Tour', help='Category for --feed-file entries')
     
     args = parser.parse_args()
     
@@ -22,8 +25,13 @@ def main():
         except Exception as e:
             print(f"Error generating internal news: {e}")
             
+    # Local feed files (testing / replaying captured feeds)
+    if args.feed_file:
+        feeds = [news_service.local_feed(path, 'Local Feed', args.category) for path in args.feed_file]
+        news_service.ingest_feeds(feeds)
+    
     # External
-    if not args.internal_only:
+    elif not args.internal_only:
         try:
             print("\nFetcing External News...")
             news_service.fetch_external_news()
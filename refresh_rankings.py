@@ -1,6 +1,8 @@
 
 import argparse
 import import_rankings_current
+import player_identity
+import ranking_series
 import tennis_db
 import sys
 
@@ -47,6 +49,12 @@ def main():
         except Exception as e:
             print(f"Error scraping real data: {e}")
 
+    # Fold the new weeks into the compact per-player series
+    ranking_series.sync_series(conn)
+    
+    # New ranking ids need linking to players
+    player_identity.rebuild_identity_map(conn)
+
     conn.close()
     print("\nRefresh Complete.")
 
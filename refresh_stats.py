@@ -3,6 +3,9 @@ import sqlite3
 import re
 from datetime import datetime, timedelta
 import tennis_db
+from batch_loader import PlayerBatch
+
+BATCH_SIZE = 500
 
 def get_db_connection():
     return sqlite3.connect('tennis_data.db')
@@ -20,17 +23,18 @@ def refresh_stats():
     
     updated_count = 0
     
-    # Pre-fetch all history to minimize queries? No, memory usage.
-    # Just do per-player queries, it's sqlite local file, fast enough for 1000 players.
-    
+    # Matches and history are loaded BATCH_SIZE players at a time (set-based queries, bounded memory)
+    batch = None
     for i, p in enumerate(players):
         pid = p['player_id']
         name = p['name']
         current_utr = p['utr_singles'] or 0
+        if i % BATCH_SIZE == 0:
+            batch = PlayerBatch.load(conn, [q['player_id'] for q in players[i:i + BATCH_SIZE]])
         
         # 1. Calculate Match Stats
         # Get matches where this player played
-        matches = tennis_db.get_player_matches(conn, pid)
+        matches = batch.matches(pid)
         
         comeback_wins = 0
         tiebreak_wins = 0
@@ -119,45 +123,10 @@ def refresh_stats():
                         if w_games < l_games:
                             comeback_wins += 1
                             
-        # 2. Calculate Year Delta
+        # 2. Calculate Year Delta (rating closest to a year ago, if within 2 months of it)
         year_delta = 0.0
-        try:
-            c.execute("SELECT date, rating FROM utr_history WHERE player_id = ? ORDER BY date ASC", (pid,))
-            history = c.fetchall()
-            
-            if history and current_utr > 0:
-                one_year_ago = datetime.now() - timedelta(days=365)
-                prior_rating = None
-                closest_diff_seconds = float('inf')
-                
-                for h in history:
-                    # Date format varies: "2023-01-01T00:00:00Z" or similar
-                    d_str = h['date']
-                    try:
-                        # Handle potential Z or no Z
-                        d_str_clean = d_str.replace('Z', '')
-                        # Truncate fractional seconds if present
-                        d_str_clean = d_str_clean.split('.')[0]
-                        
-                        h_date = datetime.fromisoformat(d_str_clean)
-                        
-                        # Find entry roughly 1 year ago
-                        diff = abs((h_date - one_year_ago).total_seconds())
-                        
-                        # Allow window? Just pick closest to 1 year ago
-                        if diff < closest_diff_seconds:
-                            closest_diff_seconds = diff
-                            prior_rating = h['rating']
-                    except:
-                        continue
-                
-                # Check if "closest" is actually reasonable (e.g. within a month of 1 year ago)
-                # 30 days = 2592000 seconds
-                if prior_rating and closest_diff_seconds < (60 * 60 * 24 * 60): # Relaxed to 2 months for better hits
-                    year_delta = current_utr - prior_rating
-        except Exception as e:
-            # print(f"Error delta for {pid}: {e}")
-            pass
+        if current_utr > 0:
+            year_delta = batch.trend(pid).delta(current_utr, 365) or 0.0
             
         # 3. Update DB
         try:
@@ -177,8 +146,10 @@ def refresh_stats():
             
         if i % 100 == 0:
             print(f"  Processed {i}...")
+            tennis_db.bump_version(conn, 'players')
             conn.commit()
             
+    tennis_db.bump_version(conn, 'players')
     conn.commit()
     conn.close()
     print(f"Done. Updated {updated_count} players.")
@@ -9,6 +9,10 @@ This creates more realistic ranking charts where ranks change over time.
 import sqlite3
 from datetime import datetime, timedelta
 import random
+import tennis_db
+
+# Last real ranking week; the mock weeks continue from its points
+BASE_WEEK = '2024-12-30'
 
 def get_db_connection():
     conn = sqlite3.connect('tennis_data.db')
@@ -20,24 +24,34 @@ def main():
     print("Regenerating 2025-2026 Rankings with Realistic Variations")
     print("=" * 60)
     
+    tennis_db.init_db()
     conn = get_db_connection()
     c = conn.cursor()
     
+    # The base week is read from the rankings table; once ranking_series.py --prune moved it out there is nothing to start from
+    pruned = c.execute("SELECT tour FROM ranking_weeks WHERE date = ?", (BASE_WEEK,)).fetchall()
+    if pruned:
+        print(f"\nThe {BASE_WEEK} base week was pruned from rankings ({', '.join(r[0] for r in pruned)}); "
+              "nothing regenerated. Run this script before ranking_series.py --prune.")
+        conn.close()
+        return
+    
     # Step 1: Delete existing 2025+ data
     print("\n[1] Deleting existing 2025+ mock data...")
     c.execute("DELETE FROM rankings WHERE date >= '2025-01-01'")
     deleted = c.rowcount
+    tennis_db.bump_version(conn, 'rankings')
     conn.commit()
     print(f"    Deleted {deleted} rows")
     
     # Step 2: Get base data from end of 2024
-    print("\n[2] Loading base data from 2024-12-30...")
+    print(f"\n[2] Loading base data from {BASE_WEEK}...")
     c.execute("""
         SELECT player_id, rank, points, tours 
         FROM rankings 
-        WHERE date = '2024-12-30'
+        WHERE date = ?
         ORDER BY rank ASC
-    """)
+    """, (BASE_WEEK,))
     base_data = [dict(r) for r in c.fetchall()]
     print(f"    Found {len(base_data)} players")
     
@@ -95,6 +109,7 @@ def main():
                 total_imported += 1
             
             # Commit every week
+            tennis_db.bump_version(conn, 'rankings')
             conn.commit()
             
             if week_idx % 10 == 0:
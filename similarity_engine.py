@@ -0,0 +1,259 @@
+"""
+Similarity Engine - Nearest-neighbour search over player profiles.
+
+Builds a normalized feature matrix per rated player (UTR, age, UTR slope,
+win rate, upset rate, clutch) and answers top-k "similar player" queries.
+Unfiltered and gender-filtered queries use a KD-tree per gender partition;
+country/category filters run a vectorized distance scan over the matching
+subset. The matrix is rebuilt in a background thread when data changes.
+"""
+
+import threading
+import time
+import numpy as np
+import tennis_db
+
+# Try importing scipy gracefully (KD-tree); fall back to a NumPy scan
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+    print("Warning: scipy not found. Similarity search will use a brute-force NumPy scan.")
+
+FEATURES = ['utr', 'age', 'utr_slope', 'win_rate', 'upset_rate', 'clutch']
+
+# Relative importance of each (z-scored) feature in the distance
+FEATURE_WEIGHTS = np.array([2.0, 1.0, 1.0, 0.75, 0.5, 0.5])
+
+# UTR slope is fitted over this much history (days)
+SLOPE_WINDOW_DAYS = 730
+
+# Background refresh: how often (seconds) to check data versions
+REFRESH_INTERVAL = 600
+
+# 2000-01-01 as a Julian day, keeps the slope sums numerically small
+_EPOCH_JD = 2451545.0
+
+
+def _fetch_player_rows(conn):
+    c = conn.execute("""
+        SELECT player_id, gender, country, scout_category, utr_singles, age,
+               tiebreak_wins, tiebreak_losses, three_set_wins, three_set_losses
+        FROM players
+        WHERE utr_singles > 0
+    """)
+    return c.fetchall()
+
+
+def _fetch_match_aggregates(conn):
+    """Per-player wins, losses, upset wins and upset opportunities in one pass over matches."""
+    c = conn.execute("""
+        SELECT player_id, SUM(won), SUM(1 - won), SUM(upset_win), SUM(upset_chance)
+        FROM (
+            SELECT winner_id AS player_id, 1 AS won,
+                   CASE WHEN loser_utr > winner_utr + 0.5 THEN 1 ELSE 0 END AS upset_win,
+                   CASE WHEN loser_utr > winner_utr + 0.5 THEN 1 ELSE 0 END AS upset_chance
+            FROM matches
+            UNION ALL
+            SELECT loser_id, 0, 0,
+                   CASE WHEN winner_utr > loser_utr + 0.5 THEN 1 ELSE 0 END
+            FROM matches
+        )
+        GROUP BY player_id
+    """)
+    return {row[0]: row[1:] for row in c.fetchall()}
+
+
+def _fetch_utr_slopes(conn):
+    """Least-squares UTR slope (points per year) from recent utr_history."""
+    c = conn.execute(f"""
+        SELECT player_id, COUNT(*), SUM(x), SUM(y), SUM(x * x), SUM(x * y)
+        FROM (
+            SELECT player_id, (julianday(date) - {_EPOCH_JD}) / 365.25 AS x, rating AS y
+            FROM utr_history
+            WHERE rating > 0 AND date >= date('now', ?)
+        )
+        WHERE x IS NOT NULL
+        GROUP BY player_id
+    """, (f'-{SLOPE_WINDOW_DAYS} days',))
+    slopes = {}
+    for pid, n, sx, sy, sxx, sxy in c.fetchall():
+        denom = n * sxx - sx * sx
+        if n >= 2 and denom > 1e-9:
+            slopes[pid] = (n * sxy - sx * sy) / denom
+    return slopes
+
+
+def _ratio(num, den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / np.maximum(den, 1), np.nan)
+
+
+class _Snapshot:
+    """Immutable feature matrix + metadata, swapped in atomically after each build."""
+
+    def __init__(self, player_ids, genders, countries, categories, matrix, version):
+        self.player_ids = player_ids
+        self.genders = genders
+        self.countries = countries
+        self.categories = categories
+        self.matrix = matrix
+        self.version = version
+        self.row_of = {pid: i for i, pid in enumerate(player_ids)}
+
+        # One KD-tree per gender partition plus one over everyone
+        self.partitions = {None: np.arange(len(player_ids))}
+        for g in set(genders):
+            if g:
+                self.partitions[g] = np.flatnonzero(genders == g)
+        self.trees = {}
+        if SCIPY_AVAILABLE:
+            for key, rows in self.partitions.items():
+                if len(rows):
+                    self.trees[key] = cKDTree(matrix[rows])
+
+
+class SimilarityEngine:
+    def __init__(self):
+        self._snapshot = None
+        self._build_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def build(self, conn=None):
+        """Build the normalized feature matrix and search trees from the database."""
+        own_conn = conn is None
+        if own_conn:
+            conn = tennis_db.get_connection()
+        try:
+            with self._build_lock:
+                start = time.time()
+                version = tennis_db.get_data_version(conn, 'players', 'matches', 'utr_history')
+                rows = _fetch_player_rows(conn)
+                agg = _fetch_match_aggregates(conn)
+                slopes = _fetch_utr_slopes(conn)
+
+                n = len(rows)
+                player_ids = np.array([str(r[0]) for r in rows], dtype=object)
+                genders = np.array([r[1] for r in rows], dtype=object)
+                countries = np.array([r[2] for r in rows], dtype=object)
+                categories = np.array([r[3] for r in rows], dtype=object)
+
+                raw = np.array([
+                    [r[4], r[5] if r[5] is not None else np.nan] + [v or 0 for v in r[6:10]]
+                    for r in rows
+                ], dtype=np.float64).reshape(n, 6)
+                stats = np.array([agg.get(r[0], (0, 0, 0, 0)) for r in rows], dtype=np.float64).reshape(n, 4)
+                wins, losses, upset_wins, upset_chances = stats.T
+
+                tb = _ratio(raw[:, 2], raw[:, 2] + raw[:, 3])
+                ts = _ratio(raw[:, 4], raw[:, 4] + raw[:, 5])
+                # Same weighting as analysis.calculate_clutch_score
+                clutch = np.where(np.isnan(tb), ts, np.where(np.isnan(ts), tb, (tb + ts) / 2)) * 100
+
+                features = np.column_stack([
+                    raw[:, 0],
+                    raw[:, 1],
+                    np.array([slopes.get(r[0], np.nan) for r in rows], dtype=np.float64),
+                    _ratio(wins, wins + losses),
+                    _ratio(upset_wins, upset_chances),
+                    clutch,
+                ]) if n else np.empty((0, len(FEATURES)))
+
+                # z-score each column, missing values sit at the mean (0)
+                mean = np.nanmean(features, axis=0) if n else np.zeros(len(FEATURES))
+                std = np.nanstd(features, axis=0) if n else np.ones(len(FEATURES))
+                mean = np.nan_to_num(mean)
+                std = np.where(np.nan_to_num(std) > 1e-9, std, 1.0)
+                matrix = np.nan_to_num((features - mean) / std) * FEATURE_WEIGHTS
+
+                self._snapshot = _Snapshot(player_ids, genders, countries, categories, matrix, version)
+                print(f"SimilarityEngine: indexed {n} players in {time.time() - start:.2f}s")
+        finally:
+            if own_conn:
+                conn.close()
+
+    def refresh_if_changed(self):
+        """Rebuild when players, matches or utr_history changed since the last build."""
+        conn = tennis_db.get_connection()
+        try:
+            version = tennis_db.get_data_version(conn, 'players', 'matches', 'utr_history')
+            if self._snapshot is None or version != self._snapshot.version:
+                self.build(conn)
+        finally:
+            conn.close()
+
+    def start_background_refresh(self, interval=REFRESH_INTERVAL):
+        """Build in a daemon thread, then keep rebuilding on data changes."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    print(f"SimilarityEngine refresh failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="similarity-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def query(self, player_id, k=10, gender=None, country=None, category=None):
+        """
+        Top-k most similar players to player_id.
+        Returns [(player_id, distance), ...] nearest first, or None if the
+        player is not indexed (unrated or index not built yet).
+        """
+        snap = self._snapshot
+        if snap is None:
+            return None
+        row = snap.row_of.get(str(player_id))
+        if row is None:
+            return None
+
+        target = snap.matrix[row]
+
+        if country or category or not SCIPY_AVAILABLE or gender not in snap.trees:
+            # Vectorized scan over the filtered subset
+            mask = np.ones(len(snap.player_ids), dtype=bool)
+            if gender:
+                mask &= snap.genders == gender
+            if country:
+                mask &= snap.countries == country
+            if category:
+                mask &= snap.categories == category
+            mask[row] = False
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            dists = np.sqrt(((snap.matrix[rows] - target) ** 2).sum(axis=1))
+            top = np.argpartition(dists, min(k, len(rows) - 1))[:k] if len(rows) > k else np.arange(len(rows))
+            top = top[np.argsort(dists[top], kind='stable')]
+            return [(snap.player_ids[rows[i]], float(dists[i])) for i in top]
+
+        # KD-tree over the gender partition (ask for one extra to drop the player itself)
+        partition = snap.partitions[gender]
+        tree = snap.trees[gender]
+        count = min(k + 1, len(partition))
+        dists, idx = tree.query(target, k=count)
+        dists, idx = np.atleast_1d(dists), np.atleast_1d(idx)
+        results = []
+        for d, i in zip(dists, idx):
+            r = partition[i]
+            if r == row:
+                continue
+            results.append((snap.player_ids[r], float(d)))
+        return results[:k]
+
+
+# Singleton instance
+similarity_engine = SimilarityEngine()
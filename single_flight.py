@@ -0,0 +1,105 @@
+"""
+Single Flight - Request coalescing plus a short-lived result cache for expensive per-player reads.
+
+When many clients open the same profile at once, the first request for a
+(endpoint, params) key computes the result and every identical request that
+arrives while it runs waits for that computation instead of starting its own.
+Results are then served from a small LRU for TTL seconds, which absorbs the
+burst without holding stale data for long.
+
+Results are shared between requests: callers must treat them as read-only.
+
+Usage:
+    from single_flight import single_flight
+    result = single_flight.do('analysis', (player_id,), lambda: analysis.get_player_analysis(player_id))
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Seconds a computed result is reused
+SINGLE_FLIGHT_TTL = float(os.getenv("SINGLE_FLIGHT_TTL", "30"))
+
+# Cached results kept across all endpoints
+SINGLE_FLIGHT_MAX_ENTRIES = int(os.getenv("SINGLE_FLIGHT_MAX_ENTRIES", "2048"))
+
+OUTCOMES = ('hit', 'miss', 'coalesced', 'error')
+
+
+class SingleFlight:
+    def __init__(self, ttl=SINGLE_FLIGHT_TTL, max_entries=SINGLE_FLIGHT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()     # (endpoint, *params) -> (expires_at, result)
+        self._inflight = {}             # (endpoint, *params) -> Future
+        self._counters = {}             # endpoint -> {outcome: count}
+
+    def _count(self, endpoint, outcome):
+        counters = self._counters.setdefault(endpoint, dict.fromkeys(OUTCOMES, 0))
+        counters[outcome] += 1
+
+    def do(self, endpoint, params, fn):
+        """Result of fn() for (endpoint, params), shared with concurrent and recent identical calls."""
+        key = (endpoint,) + tuple(params)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(key)
+                    self._count(endpoint, 'hit')
+                    return entry[1]
+                del self._cache[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            self._count(endpoint, 'miss' if leader else 'coalesced')
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._count(endpoint, 'error')
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # Cache before releasing the in-flight slot so no later caller recomputes in between
+            self._cache[key] = (time.time() + self.ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def invalidate(self, endpoint=None):
+        """Drop cached results (all, or one endpoint's)."""
+        with self._lock:
+            if endpoint is None:
+                self._cache.clear()
+            else:
+                for key in [k for k in self._cache if k[0] == endpoint]:
+                    del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl_seconds': self.ttl,
+                'entries': len(self._cache),
+                'max_entries': self.max_entries,
+                'inflight': len(self._inflight),
+                'endpoints': {endpoint: dict(c) for endpoint, c in self._counters.items()},
+            }
+
+
+# Singleton instance
+single_flight = SingleFlight()
@@ -1,7 +1,13 @@
 
+import heapq
+import itertools
+import os
 import sqlite3
+import threading
+import time
 import tennis_db
 import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 # Configure logging
@@ -16,20 +22,76 @@ except ImportError:
     INSTALOADER_AVAILABLE = False
     logger.warning("Instaloader not found. Instagram fetching will be disabled.")
 
+# Cached posts older than this are served with stale=True and queued for a refresh
+SOCIAL_TTL = timedelta(hours=float(os.getenv("SOCIAL_TTL_HOURS", "24")))
+
+# Minimum seconds between two Instagram profile fetches, across all callers
+INSTAGRAM_MIN_INTERVAL = float(os.getenv("INSTAGRAM_MIN_INTERVAL", "30"))
+
+# Seconds between prefetch scheduling passes (0 disables the prefetch worker)
+SOCIAL_PREFETCH_INTERVAL = float(os.getenv("SOCIAL_PREFETCH_INTERVAL", "3600"))
+
+# Seconds before a profile whose fetch returned nothing is tried again
+SOCIAL_RETRY_AFTER = float(os.getenv("SOCIAL_RETRY_AFTER", "3600"))
+
+# Recently viewed players remembered for prioritizing prefetches
+RECENT_VIEWS_MAX = 500
+
+POSTS_PER_PLAYER = 12
+
+# Prefetch queue priorities (lower runs first)
+PRIORITY_VIEWED = 0       # Viewed with a stale cache just now
+PRIORITY_FAVORITE = 1     # Someone's favorite (more followers first)
+PRIORITY_RECENT = 2       # Viewed recently
+PRIORITY_OTHER = 3        # Any other player with an Instagram handle
+
+
+class RateLimiter:
+    """Spaces calls at least min_interval seconds apart, shared by every thread."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def acquire(self, stop=None):
+        """Wait for (and reserve) the next slot. Returns False if `stop` was set while waiting."""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_at)
+            self._next_at = slot + self.min_interval
+        delay = slot - now
+        if delay <= 0:
+            return True
+        if stop is not None:
+            return not stop.wait(delay)
+        time.sleep(delay)
+        return True
+
+
+# Global limiter for Instagram requests
+instagram_rate_limiter = RateLimiter(INSTAGRAM_MIN_INTERVAL)
+
 
 class SocialMediaService:
-    def __init__(self):
+    def __init__(self, fetcher=None, rate_limiter=None):
+        """
+        fetcher(username, limit) -> list of post dicts; defaults to the instaloader
+        fetch (pass a stub to run without network access).
+        """
         if INSTALOADER_AVAILABLE:
             self.loader = instaloader.Instaloader()
             # Disable login requirement (limits data but works for public profiles sometimes)
             # self.loader.context.is_logged_in = False 
         else:
             self.loader = None
+        self.fetcher = fetcher or self.fetch_instagram_posts
+        self.rate_limiter = rate_limiter or instagram_rate_limiter
 
     def get_connection(self):
         return tennis_db.get_connection()
 
-    def fetch_instagram_posts(self, username, limit=12):
+    def fetch_instagram_posts(self, username, limit=POSTS_PER_PLAYER):
         """
         Fetch recent posts for a public Instagram profile.
         Returns a list of dictionaries with post details.
@@ -61,64 +123,79 @@ class SocialMediaService:
         
         return posts
 
+    def get_instagram_username(self, conn, player_id):
+        row = conn.execute(
+            "SELECT username FROM player_social_media WHERE player_id = ? AND platform = 'instagram'",
+            (player_id,)
+        ).fetchone()
+        return row[0] if row and row[0] else None
+
+    @staticmethod
+    def is_stale(fetched_at, now=None):
+        if not fetched_at:
+            return True
+        try:
+            return (now or datetime.now()) - datetime.fromisoformat(fetched_at) > SOCIAL_TTL
+        except ValueError:
+            return True
+
     def get_player_social_feed(self, player_id):
         """
-        Get social feed for a player. 
-        Checks cache first. If empty or stale (> 24h), tries to refresh.
+        Get the cached social feed for a player, without fetching.
+        Returns {'data': posts, 'stale': bool, 'fetched_at': ..., 'has_account': bool};
+        stale feeds are refreshed by the prefetch worker (see SocialPrefetcher.note_view).
         """
         conn = self.get_connection()
-        c = conn.cursor()
-        
-        # Check for cached posts
-        query = """
-            SELECT shortcode, image_url, caption, posted_at, fetched_at
-            FROM social_posts
-            WHERE player_id = ? AND platform = 'instagram'
-            ORDER BY posted_at DESC
-            LIMIT 12
+        try:
+            rows = conn.execute("""
+                SELECT shortcode, image_url, caption, posted_at, fetched_at
+                FROM social_posts
+                WHERE player_id = ? AND platform = 'instagram'
+                ORDER BY posted_at DESC
+                LIMIT ?
+            """, (player_id, POSTS_PER_PLAYER)).fetchall()
+            has_account = self.get_instagram_username(conn, player_id) is not None
+        finally:
+            conn.close()
+
+        fetched_at = max((r[4] for r in rows if r[4]), default=None)
+        return {
+            'data': [
+                {
+                    'shortcode': r[0],
+                    'image_url': r[1],
+                    'caption': r[2],
+                    'posted_at': r[3],
+                    'fetched_at': r[4]
+                }
+                for r in rows
+            ],
+            'fetched_at': fetched_at,
+            # Nothing to refresh without a handle
+            'stale': has_account and self.is_stale(fetched_at),
+            'has_account': has_account
+        }
+
+    def refresh_player(self, player_id, stop=None):
         """
-        c.execute(query, (player_id,))
-        rows = c.fetchall()
-        
-        # Decide if we need to refresh
-        should_refresh = False
-        if not rows:
-            should_refresh = True
-        else:
-            last_fetched = rows[0][4] # fetched_at of the newest post in our DB (approx)
-            if last_fetched:
-                last_fetched_dt = datetime.fromisoformat(last_fetched)
-                if datetime.now() - last_fetched_dt > timedelta(hours=24):
-                    should_refresh = True
-            else:
-                should_refresh = True
-
-        # If refresh needed, find the username and fetch
-        if should_refresh:
-            # Get Instagram handle
-            c.execute("SELECT username FROM player_social_media WHERE player_id = ? AND platform = 'instagram'", (player_id,))
-            row = c.fetchone()
-            if row and row[0]:
-                username = row[0]
-                new_posts = self.fetch_instagram_posts(username)
-                if new_posts:
-                    self.save_posts(conn, player_id, new_posts)
-                    # Re-fetch from DB
-                    c.execute(query, (player_id,))
-                    rows = c.fetchall()
-
-        conn.close()
-        
-        return [
-            {
-                'shortcode': r[0],
-                'image_url': r[1],
-                'caption': r[2],
-                'posted_at': r[3],
-                'fetched_at': r[4]
-            }
-            for r in rows
-        ]
+        Fetch and cache a player's latest posts, waiting for the global rate limiter.
+        Returns the number of posts stored (0 without a handle or when nothing came back).
+        """
+        conn = self.get_connection()
+        try:
+            username = self.get_instagram_username(conn, player_id)
+            if not username:
+                return 0
+            if not self.rate_limiter.acquire(stop):
+                return 0
+            start = time.time()
+            new_posts = self.fetcher(username, POSTS_PER_PLAYER)
+            if new_posts:
+                self.save_posts(conn, player_id, new_posts)
+            logger.info(f"Social refresh {player_id} (@{username}): {len(new_posts or [])} posts in {time.time() - start:.1f}s")
+            return len(new_posts or [])
+        finally:
+            conn.close()
 
     def save_posts(self, conn, player_id, posts):
         """Result caching to DB."""
@@ -132,7 +209,7 @@ class SocialMediaService:
             try:
                 conn.execute(sql, (
                     player_id, 
-                    p['platform'],
+                    p.get('platform', 'instagram'),
                     p['shortcode'],
                     p['image_url'],
                     p['caption'],
@@ -143,5 +220,143 @@ class SocialMediaService:
                 logger.error(f"Error saving post {p['shortcode']}: {e}")
         conn.commit()
 
-# Singleton instance
+
+class SocialPrefetcher:
+    """
+    Daemon thread refreshing stale Instagram caches in the background.
+
+    Players are taken from a priority queue: viewed-while-stale first, then
+    favorites (by follower count), recently viewed players and everyone else
+    with a handle. Each fetch waits for the service's global rate limiter.
+    """
+
+    def __init__(self, service, interval=SOCIAL_PREFETCH_INTERVAL, retry_after=SOCIAL_RETRY_AFTER):
+        self.service = service
+        self.interval = interval
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._heap = []                 # (priority, -weight, seq, player_id)
+        self._queued = {}               # player_id -> (priority, -weight) of its live heap entry
+        self._seq = itertools.count()
+        self._recent = OrderedDict()    # player_id -> last view time
+        self._attempted = {}            # player_id -> last fetch time
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, player_id, priority=PRIORITY_OTHER, weight=0):
+        """Queue a refresh; a player already queued keeps its better priority."""
+        key = (priority, -weight)
+        with self._cond:
+            current = self._queued.get(player_id)
+            if current is not None and current <= key:
+                return False
+            self._queued[player_id] = key
+            heapq.heappush(self._heap, (priority, -weight, next(self._seq), player_id))
+            self._cond.notify()
+            return True
+
+    def note_view(self, player_id, stale):
+        """Record a feed view; a stale feed jumps to the head of the queue (unless just attempted)."""
+        with self._cond:
+            self._recent[player_id] = time.time()
+            self._recent.move_to_end(player_id)
+            while len(self._recent) > RECENT_VIEWS_MAX:
+                self._recent.popitem(last=False)
+        if stale and not self._recently_attempted(player_id):
+            self.enqueue(player_id, PRIORITY_VIEWED)
+
+    def _recently_attempted(self, player_id):
+        attempted = self._attempted.get(player_id)
+        return attempted is not None and time.time() - attempted < self.retry_after
+
+    def schedule(self):
+        """Queue every player with a stale cache, by priority. Returns the number queued."""
+        conn = self.service.get_connection()
+        try:
+            rows = conn.execute("""
+                SELECT sm.player_id,
+                       (SELECT COUNT(*) FROM user_favorites f WHERE f.player_id = sm.player_id),
+                       (SELECT MAX(sp.fetched_at) FROM social_posts sp
+                        WHERE sp.player_id = sm.player_id AND sp.platform = 'instagram')
+                FROM player_social_media sm
+                WHERE sm.platform = 'instagram' AND sm.username IS NOT NULL AND sm.username != ''
+            """).fetchall()
+        finally:
+            conn.close()
+
+        with self._cond:
+            recent = set(self._recent)
+        queued = 0
+        for player_id, followers, fetched_at in rows:
+            if not self.service.is_stale(fetched_at) or self._recently_attempted(player_id):
+                continue
+            if followers:
+                priority = PRIORITY_FAVORITE
+            elif player_id in recent:
+                priority = PRIORITY_RECENT
+            else:
+                priority = PRIORITY_OTHER
+            queued += self.enqueue(player_id, priority, followers or 0)
+        logger.info(f"Social prefetch scheduled {queued} players ({len(rows)} with Instagram handles)")
+        return queued
+
+    def _pop(self, timeout=None):
+        """Next queued player id, or None after `timeout` seconds / on stop."""
+        with self._cond:
+            deadline = None if timeout is None else time.time() + timeout
+            while not self._stop.is_set():
+                while self._heap:
+                    priority, neg_weight, _, player_id = heapq.heappop(self._heap)
+                    # Skip entries superseded by a better-priority enqueue
+                    if self._queued.get(player_id) == (priority, neg_weight):
+                        del self._queued[player_id]
+                        return player_id
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return None
+
+    def process_next(self, timeout=0):
+        """Refresh the next queued player. Returns its id, or None if the queue stayed empty."""
+        player_id = self._pop(timeout)
+        if player_id is None:
+            return None
+        self._attempted[player_id] = time.time()
+        try:
+            self.service.refresh_player(player_id, stop=self._stop)
+        except Exception as e:
+            logger.error(f"Social prefetch failed for {player_id}: {e}")
+        return player_id
+
+    def pending(self):
+        with self._cond:
+            return len(self._queued)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            next_schedule = 0.0
+            while not self._stop.is_set():
+                if time.time() >= next_schedule:
+                    try:
+                        self.schedule()
+                    except Exception as e:
+                        logger.error(f"Social prefetch scheduling failed: {e}")
+                    next_schedule = time.time() + self.interval
+                self.process_next(timeout=max(0.0, next_schedule - time.time()))
+
+        self._thread = threading.Thread(target=loop, name="social-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+# Singleton instances
 social_service = SocialMediaService()
+social_prefetcher = SocialPrefetcher(social_service)
@@ -1,13 +1,35 @@
 import sqlite3
 import os
+import threading
 from datetime import datetime
+import favorites_feed
+import head_to_head
+import recent_matches
+import tournaments
 
 DB_FILE = 'tennis_data.db'
 
+# Tables whose writers bump data_versions (see bump_version / get_data_version)
+VERSIONED_TABLES = ('players', 'matches', 'utr_history', 'rankings', 'player_identity', 'ranking_series', 'elo_ratings')
+
 def get_connection():
     """Get a connection to the SQLite database."""
     return sqlite3.connect(DB_FILE, timeout=30.0)
 
+_pool = threading.local()
+
+def get_pooled_connection():
+    """
+    Get this thread's long-lived read connection (sqlite3.Row rows).
+    Reused across requests served by the same worker thread; callers must not close it.
+    """
+    conn = getattr(_pool, 'conn', None)
+    if conn is None:
+        conn = get_connection()
+        conn.row_factory = sqlite3.Row
+        _pool.conn = conn
+    return conn
+
 def init_db():
     """Initialize the database tables."""
     conn = get_connection()
@@ -62,7 +84,8 @@ def init_db():
         ('tiebreak_wins', 'INTEGER DEFAULT 0'),
         ('tiebreak_losses', 'INTEGER DEFAULT 0'),
         ('three_set_wins', 'INTEGER DEFAULT 0'),
-        ('three_set_losses', 'INTEGER DEFAULT 0')
+        ('three_set_losses', 'INTEGER DEFAULT 0'),
+        ('scout_category', 'TEXT')
     ]
     
     for col_name, col_type in player_cols:
@@ -197,6 +220,7 @@ def init_db():
     c.execute('CREATE INDEX IF NOT EXISTS idx_matches_winner ON matches (winner_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_matches_loser ON matches (loser_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_matches_tournament_date ON matches (tournament, date)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_history_player ON utr_history (player_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_social_player ON player_social_media (player_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_news_date ON news_items (published_at)')
@@ -230,6 +254,256 @@ def init_db():
     ''')
     c.execute('CREATE INDEX IF NOT EXISTS idx_elo_tour ON tennis_abstract_elo(tour, elo_rank)')
     
+    # Head-to-Head table (one row per player/opponent direction, maintained by head_to_head.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS head_to_head (
+        player_id TEXT NOT NULL,
+        opponent_id TEXT NOT NULL,
+        wins INTEGER DEFAULT 0,
+        losses INTEGER DEFAULT 0,
+        total INTEGER DEFAULT 0,
+        first_match TEXT,
+        last_match TEXT,
+        hard_wins INTEGER DEFAULT 0,
+        hard_losses INTEGER DEFAULT 0,
+        clay_wins INTEGER DEFAULT 0,
+        clay_losses INTEGER DEFAULT 0,
+        grass_wins INTEGER DEFAULT 0,
+        grass_losses INTEGER DEFAULT 0,
+        carpet_wins INTEGER DEFAULT 0,
+        carpet_losses INTEGER DEFAULT 0,
+        recent_matches TEXT, -- JSON [[date, match_id], ...] newest first
+        updated_at TIMESTAMP,
+        PRIMARY KEY (player_id, opponent_id)
+    ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_h2h_player_total ON head_to_head (player_id, total DESC)')
+    
+    # Materialized favorites feed (one row per user/item/favorite player, maintained by favorites_feed.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS user_feed (
+        user_id INTEGER NOT NULL,
+        player_id TEXT NOT NULL,
+        kind TEXT NOT NULL, -- 'match' or 'news'
+        ref_id TEXT NOT NULL, -- match_id or news_items.id
+        timestamp TEXT,
+        payload TEXT NOT NULL, -- JSON feed entry as served by /users/favorites/feed
+        PRIMARY KEY (user_id, kind, ref_id, player_id)
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_feed_user_time ON user_feed (user_id, timestamp DESC)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_favorites_player ON user_favorites (player_id)')
+    
+    # Tournament editions (canonical name, level, dates, final; maintained by tournaments.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS tournaments (
+        tournament_id TEXT PRIMARY KEY,
+        name TEXT, -- tournament name as stored on matches
+        canonical_name TEXT,
+        level TEXT,
+        category TEXT,
+        tour TEXT,
+        gender TEXT,
+        source TEXT,
+        surface TEXT,
+        year INTEGER,
+        start_date TEXT,
+        end_date TEXT,
+        match_count INTEGER DEFAULT 0,
+        final_match_id TEXT,
+        final_date TEXT,
+        final_score TEXT,
+        winner_id TEXT,
+        winner_name TEXT,
+        finalist_id TEXT,
+        finalist_name TEXT,
+        updated_at TIMESTAMP
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tournaments_name ON tournaments (name, year)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tournaments_canonical ON tournaments (canonical_name, year)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tournaments_end_date ON tournaments (end_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tournaments_final_date ON tournaments (final_date)')
+    
+    # Rolling window of recent matches joined with both players, one row per side (maintained by recent_matches.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS recent_matches (
+        match_id TEXT NOT NULL,
+        date TEXT,
+        tournament TEXT,
+        round TEXT,
+        score TEXT,
+        winner_id TEXT,
+        loser_id TEXT,
+        winner_name TEXT,
+        winner_country TEXT,
+        winner_utr REAL,
+        winner_age INTEGER,
+        winner_age_group TEXT,
+        winner_gender TEXT,
+        winner_comeback_wins INTEGER,
+        winner_tiebreak_wins INTEGER,
+        winner_tiebreak_losses INTEGER,
+        winner_three_set_wins INTEGER,
+        winner_three_set_losses INTEGER,
+        loser_name TEXT,
+        loser_country TEXT,
+        loser_utr REAL,
+        loser_age INTEGER,
+        loser_age_group TEXT,
+        loser_gender TEXT,
+        loser_comeback_wins INTEGER,
+        loser_tiebreak_wins INTEGER,
+        loser_tiebreak_losses INTEGER,
+        loser_three_set_wins INTEGER,
+        loser_three_set_losses INTEGER,
+        side TEXT NOT NULL, -- 'W' or 'L': whose attributes the focus_* columns hold
+        focus_id TEXT,
+        focus_utr REAL,
+        focus_gender TEXT,
+        focus_country TEXT,
+        focus_junior INTEGER, -- 1 if junior by age or age group
+        PRIMARY KEY (match_id, side)
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_recent_matches_date ON recent_matches (date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_recent_matches_country ON recent_matches (focus_country, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_recent_matches_winner ON recent_matches (winner_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_recent_matches_loser ON recent_matches (loser_id)')
+    
+    # College roster cache (UTR club members per gender, maintained by college_service.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS college_rosters (
+        club_id TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        roster TEXT NOT NULL, -- JSON list as returned by /college/{club_id}/roster
+        player_count INTEGER,
+        fetched_at REAL, -- epoch seconds
+        PRIMARY KEY (club_id, gender)
+    )
+    ''')
+    
+    # Player identity map (any known ID -> matches ID / rankings ID, built by player_identity.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS player_identity (
+        alias_id TEXT PRIMARY KEY,
+        canonical_id TEXT NOT NULL,
+        utr_id TEXT,
+        ranking_id TEXT,
+        confidence REAL,
+        method TEXT,
+        updated_at TEXT
+    ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_identity_canonical ON player_identity (canonical_id)')
+    
+    # Compact rankings time series: one row per ranking player_id, delta-encoded
+    # day/rank/points/tours arrays in a zlib BLOB (see ranking_series.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS ranking_series (
+        player_id TEXT PRIMARY KEY,
+        n INTEGER,
+        first_date TEXT,
+        last_date TEXT,
+        data BLOB,
+        updated_at TEXT
+    ) WITHOUT ROWID
+    ''')
+
+    # Weeks whose rankings rows were pruned into ranking_series, so importers still see them as imported
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS ranking_weeks (
+        tour TEXT,
+        date TEXT,
+        pruned_at TEXT,
+        PRIMARY KEY (tour, date)
+    ) WITHOUT ROWID
+    ''')
+    
+    # In-house Elo (see elo_engine.py): current rating per player and line ('all' or a surface),
+    # rating after each day played, and the replay watermark
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS elo_ratings (
+        player_id TEXT,
+        surface TEXT,
+        rating REAL,
+        matches INTEGER,
+        last_date TEXT,
+        PRIMARY KEY (player_id, surface)
+    ) WITHOUT ROWID
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS elo_history (
+        player_id TEXT,
+        surface TEXT,
+        date TEXT,
+        rating REAL,
+        PRIMARY KEY (player_id, surface, date)
+    ) WITHOUT ROWID
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS elo_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    # Matches already replayed, with what was replayed (day|winner|loser|surface)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS elo_applied (
+        match_id TEXT PRIMARY KEY,
+        signature TEXT
+    ) WITHOUT ROWID
+    ''')
+    
+    # LLM gateway (see llm_gateway.py): cached responses and per-call metrics
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        cache_key TEXT PRIMARY KEY,
+        template TEXT,
+        template_version INTEGER,
+        model TEXT,
+        provider TEXT,
+        response TEXT,
+        created_at TEXT
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template TEXT,
+        provider TEXT,
+        model TEXT,
+        outcome TEXT,
+        latency_ms INTEGER,
+        prompt_tokens INTEGER,
+        output_tokens INTEGER,
+        created_at TEXT
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at)')
+    
+    # News feed polling state: conditional-GET validators per feed URL
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS news_feed_state (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        last_status INTEGER,
+        last_error TEXT,
+        last_fetched_at TIMESTAMP,
+        last_changed_at TIMESTAMP,
+        entries_seen INTEGER DEFAULT 0
+    )
+    ''')
+    
+    # Migration: title hash for cross-feed news de-duplication
+    c.execute("PRAGMA table_info(news_items)")
+    news_cols = [row[1] for row in c.fetchall()]
+    if 'title_hash' not in news_cols:
+        print("Migrating DB: Adding 'title_hash' column to news_items table...")
+        c.execute("ALTER TABLE news_items ADD COLUMN title_hash TEXT")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_news_title_hash ON news_items (title_hash)')
+    
     # Migration: Add match statistics columns for Sackmann data
     c.execute("PRAGMA table_info(matches)")
     match_cols = [row[1] for row in c.fetchall()]
@@ -266,10 +540,81 @@ def init_db():
             print(f"Migrating DB: Adding '{col_name}' column to matches table...")
             c.execute(f"ALTER TABLE matches ADD COLUMN {col_name} {col_type}")
     
+    # Migration: Link matches to their tournament edition (backfill with tournaments.py --rebuild)
+    if 'tournament_id' not in match_cols:
+        print("Migrating DB: Adding 'tournament_id' column to matches table...")
+        c.execute("ALTER TABLE matches ADD COLUMN tournament_id TEXT REFERENCES tournaments (tournament_id)")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_matches_tournament_id ON matches (tournament_id)')
+    
+    # Data versions: bumped by writers (bump_version, once per statement batch / commit)
+    # so in-memory indexes and caches can tell when their source tables changed
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER DEFAULT 0
+    )
+    ''')
+    # Marker counting the players / matches bumps whose writers also maintained recent_matches
+    c.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)", (recent_matches.HOOKED_VERSION,))
+    for table in VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)", (table,))
+        # Per-row triggers from earlier versions rewrote data_versions for every stored row
+        for event in ('insert', 'update', 'delete'):
+            c.execute(f"DROP TRIGGER IF EXISTS trg_version_{table}_{event}")
+    
     conn.commit()
+
+    # Databases created before the tournaments table: link their matches once (new matches are linked on write)
+    if (c.execute("SELECT 1 FROM tournaments LIMIT 1").fetchone() is None
+            and c.execute("SELECT 1 FROM matches WHERE tournament IS NOT NULL LIMIT 1").fetchone()):
+        tournaments.rebuild(conn)
+
+    # Same for feeds: favorites saved before user_feed existed have nothing fanned out yet
+    if (c.execute("SELECT 1 FROM user_feed LIMIT 1").fetchone() is None
+            and c.execute("SELECT 1 FROM user_favorites LIMIT 1").fetchone()):
+        users = favorites_feed.rebuild_all(conn)
+        print(f"Feeds: rebuilt for {users} users")
+
     conn.close()
     print(f"Database {DB_FILE} initialized.")
 
+def bump_version(conn, *tables, maintained=False):
+    """
+    Mark tables as changed for get_data_version. Writers call this once per statement
+    batch or before each commit (not per row) after writing a VERSIONED_TABLES table.
+    maintained=True: the writer also maintains recent_matches for this write
+    (on_matches_stored / refresh_players), so its maintainer need not rebuild.
+    The caller commits.
+    """
+    if not tables:
+        return
+    placeholders = ','.join(['?'] * len(tables))
+    try:
+        conn.execute(f"UPDATE data_versions SET version = version + 1 WHERE table_name IN ({placeholders})", list(tables))
+        if maintained:
+            conn.execute("UPDATE data_versions SET version = version + ? WHERE table_name = ?",
+                         (len(tables), recent_matches.HOOKED_VERSION))
+    except sqlite3.OperationalError:
+        # Database not migrated yet
+        pass
+
+def get_data_version(conn, *tables):
+    """
+    Get the current data version for one or more tables (default: all versioned tables).
+    The value only ever increases, so it can be used directly as a cache key.
+    """
+    tables = tables or VERSIONED_TABLES
+    placeholders = ','.join(['?'] * len(tables))
+    try:
+        row = conn.execute(
+            f"SELECT COALESCE(SUM(version), 0) FROM data_versions WHERE table_name IN ({placeholders})",
+            list(tables)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Database not migrated yet
+        return 0
+    return row[0]
+
 def save_player(conn, player_data):
     """
     Upsert player data.
@@ -331,9 +676,37 @@ def save_player(conn, player_data):
     
     try:
         conn.execute(sql, params)
+        bump_version(conn, 'players', maintained=True)
+        recent_matches.refresh_players(conn, [params[0]])
     except Exception as e:
         print(f"Error saving player {player_data.get('name')}: {e}")
 
+def existing_match_ids(conn, match_ids):
+    """The subset of match_ids already in matches."""
+    match_ids = list(dict.fromkeys(str(m) for m in match_ids))
+    existing = set()
+    for i in range(0, len(match_ids), 500):
+        chunk = match_ids[i:i + 500]
+        existing.update(r[0] for r in conn.execute(
+            f"SELECT match_id FROM matches WHERE match_id IN ({','.join(['?'] * len(chunk))})", chunk
+        ))
+    return existing
+
+def on_matches_stored(conn, match_ids, new_match_ids=(), changed_player_ids=()):
+    """
+    Maintain the tables derived from matches after a write: tournament editions and the
+    recent_matches window for every stored (inserted or replaced) match; head_to_head and
+    followers' feeds for brand-new ones. changed_player_ids are the players of replaced /
+    updated matches whose winner, loser, date or surface changed (head_to_head.changed_players);
+    their head-to-head rows are recomputed. The caller commits.
+    """
+    head_to_head.apply_matches(conn, new_match_ids)
+    for player_id in changed_player_ids:
+        head_to_head.rebuild_player(conn, player_id)
+    tournaments.assign_matches(conn, match_ids)
+    recent_matches.add_matches(conn, match_ids)
+    favorites_feed.fan_out_matches(conn, new_match_ids)
+
 def save_match(conn, match_data, overwrite=True):
     """
     Insert match data.
@@ -351,13 +724,21 @@ def save_match(conn, match_data, overwrite=True):
     # Minimal player insert (ignore if exists)
     player_sql = "INSERT OR IGNORE INTO players (player_id, name, utr_singles, updated_at) VALUES (?, ?, ?, ?)"
     try:
-        conn.execute(player_sql, (winner_id, winner_name, winner_utr, datetime.now().isoformat()))
-        conn.execute(player_sql, (loser_id, loser_name, loser_utr, datetime.now().isoformat()))
+        created = conn.execute(player_sql, (winner_id, winner_name, winner_utr, datetime.now().isoformat())).rowcount
+        created += conn.execute(player_sql, (loser_id, loser_name, loser_utr, datetime.now().isoformat())).rowcount
+        if created:
+            # New players only appear in this match, which on_matches_stored adds below
+            bump_version(conn, 'players', maintained=True)
     except Exception as e:
         print(f"Warning: Failed to auto-create players for match: {e}")
 
     # Determine conflict resolution
     conflict_action = "REPLACE" if overwrite else "IGNORE"
+    
+    # Brand-new matches are added to head_to_head; a replace that changes the pair is recomputed
+    match_id = str(match_data.get('match_id'))
+    before = head_to_head.match_keys(conn, [match_id])
+    is_new = not before
 
     sql = f'''
     INSERT OR {conflict_action} INTO matches (match_id, date, winner_id, loser_id, score, tournament, round, source, winner_utr, loser_utr, processed_player_id)
@@ -379,7 +760,10 @@ def save_match(conn, match_data, overwrite=True):
     )
     
     try:
-        conn.execute(sql, params)
+        if conn.execute(sql, params).rowcount:
+            bump_version(conn, 'matches', maintained=True)
+        changed = head_to_head.changed_players(before, head_to_head.match_keys(conn, [match_id])) if overwrite else ()
+        on_matches_stored(conn, [match_id], [match_id] if is_new else [], changed)
         # Check if row was inserted (changes returns 1 if inserted, 0 if ignored)
         return conn.total_changes
     except Exception as e:
@@ -408,6 +792,8 @@ def save_history(conn, history_data, overwrite=True):
     
     try:
         cursor = conn.execute(sql, params)
+        if cursor.rowcount:
+            bump_version(conn, 'utr_history')
         return cursor.rowcount
     except Exception as e:
         print(f"Error saving history for {history_data.get('player_id')}: {e}")
@@ -470,6 +856,45 @@ def get_players_for_refresh(conn, country=None, days_old=1, limit=100, min_utr=0
     columns = [d[0] for d in c.description]
     return [dict(zip(columns, row)) for row in c.fetchall()]
 
+# Match columns returned by get_player_matches
+PLAYER_MATCH_COLUMNS = '''match_id, date, winner_id, loser_id, score, tournament, round, source,
+              winner_utr, loser_utr, surface, best_of, minutes,
+              w_ace, w_df, w_svpt, w_1stIn, w_1stWon, w_2ndWon, w_SvGms, w_bpSaved, w_bpFaced,
+              l_ace, l_df, l_svpt, l_1stIn, l_1stWon, l_2ndWon, l_SvGms, l_bpSaved, l_bpFaced'''
+
+# Player fields copied onto match rows as winner_<field> / loser_<field> (utr_singles -> _utr)
+MATCH_PLAYER_FIELDS = ('name', 'utr_singles', 'age', 'age_group', 'gender',
+                       'comeback_wins', 'tiebreak_wins', 'tiebreak_losses', 'three_set_wins', 'three_set_losses')
+
+
+def attach_match_players(conn, matches, chunk_size=900):
+    """
+    Add winner_/loser_ name, current UTR, age and stats columns to match dicts in place,
+    fetching all referenced players in a few IN queries instead of a JOIN per match.
+    """
+    player_ids = {m[k] for m in matches for k in ('winner_id', 'loser_id') if m.get(k)}
+    if not player_ids:
+        return matches
+    c = conn.cursor()
+    player_data = {}
+    ids = list(player_ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f"SELECT player_id, {', '.join(MATCH_PLAYER_FIELDS)} FROM players WHERE player_id IN ({placeholders})", chunk)
+        for row in c.fetchall():
+            player_data[row[0]] = dict(zip(MATCH_PLAYER_FIELDS, row[1:]))
+
+    for m in matches:
+        for side in ('winner', 'loser'):
+            p = player_data.get(m.get(f'{side}_id'))
+            if p is None:
+                continue
+            for field, value in p.items():
+                m[f"{side}_{'utr' if field == 'utr_singles' else field}"] = value
+    return matches
+
+
 def get_player_matches(conn, player_id, year=None, limit=100, offset=0):
     """
     Get matches for a player with optional pagination and year filtering.
@@ -480,10 +905,7 @@ def get_player_matches(conn, player_id, year=None, limit=100, offset=0):
     c = conn.cursor()
     
     # Column list (explicit to avoid SELECT * overhead)
-    cols = '''match_id, date, winner_id, loser_id, score, tournament, round, source,
-              winner_utr, loser_utr, surface, best_of, minutes,
-              w_ace, w_df, w_svpt, w_1stIn, w_1stWon, w_2ndWon, w_SvGms, w_bpSaved, w_bpFaced,
-              l_ace, l_df, l_svpt, l_1stIn, l_1stWon, l_2ndWon, l_SvGms, l_bpSaved, l_bpFaced'''
+    cols = PLAYER_MATCH_COLUMNS
     
     # Use UNION for much better index utilization
     query = f'''
@@ -511,60 +933,7 @@ def get_player_matches(conn, player_id, year=None, limit=100, offset=0):
     matches = [dict(zip(columns, row)) for row in c.fetchall()]
     
     # Batch fetch player names to avoid JOIN overhead
-    if matches:
-        player_ids = set()
-        for m in matches:
-            if m.get('winner_id'):
-                player_ids.add(m['winner_id'])
-            if m.get('loser_id'):
-                player_ids.add(m['loser_id'])
-        
-        if player_ids:
-            placeholders = ','.join(['?'] * len(player_ids))
-            # Include stats columns for player detail
-            c.execute(f'''SELECT player_id, name, utr_singles, age, age_group, gender,
-                          comeback_wins, tiebreak_wins, tiebreak_losses, three_set_wins, three_set_losses 
-                          FROM players WHERE player_id IN ({placeholders})''', list(player_ids))
-            player_data = {row[0]: {
-                'name': row[1], 
-                'utr_singles': row[2],
-                'age': row[3],
-                'age_group': row[4],
-                'gender': row[5],
-                'comeback_wins': row[6],
-                'tiebreak_wins': row[7],
-                'tiebreak_losses': row[8],
-                'three_set_wins': row[9],
-                'three_set_losses': row[10]
-            } for row in c.fetchall()}
-            
-            for m in matches:
-                winner_id = m.get('winner_id')
-                loser_id = m.get('loser_id')
-                if winner_id and winner_id in player_data:
-                    p = player_data[winner_id]
-                    m['winner_name'] = p['name']
-                    m['winner_utr'] = p['utr_singles']
-                    m['winner_age'] = p['age']
-                    m['winner_age_group'] = p['age_group']
-                    m['winner_gender'] = p['gender']
-                    m['winner_comeback_wins'] = p['comeback_wins']
-                    m['winner_tiebreak_wins'] = p['tiebreak_wins']
-                    m['winner_tiebreak_losses'] = p['tiebreak_losses']
-                    m['winner_three_set_wins'] = p['three_set_wins']
-                    m['winner_three_set_losses'] = p['three_set_losses']
-                if loser_id and loser_id in player_data:
-                    p = player_data[loser_id]
-                    m['loser_name'] = p['name']
-                    m['loser_utr'] = p['utr_singles']
-                    m['loser_age'] = p['age']
-                    m['loser_age_group'] = p['age_group']
-                    m['loser_gender'] = p['gender']
-                    m['loser_comeback_wins'] = p['comeback_wins']
-                    m['loser_tiebreak_wins'] = p['tiebreak_wins']
-                    m['loser_tiebreak_losses'] = p['tiebreak_losses']
-                    m['loser_three_set_wins'] = p['three_set_wins']
-                    m['loser_three_set_losses'] = p['three_set_losses']
+    attach_match_players(conn, matches)
     
     print(f"get_player_matches: player={player_id}, year={year}, limit={limit}, offset={offset}, found={len(matches)}, time={time.time()-_start:.3f}s")
     return matches
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Tournaments - One row per tournament edition, maintained from matches.
+
+The tournaments table holds each edition's canonical (standardized) name,
+level, tour, surface, dates, match count and final (winner / finalist), and
+matches.tournament_id points at it, so tournament lists, history and draws
+are indexed reads instead of GROUP BY / DISTINCT scans over matches with
+standardize_name run on every row.
+
+An edition is a Sackmann tourney_id (taken from the match_id) or, for other
+sources, a (source, year, tournament name) group.
+
+Writers call assign_matches() with the match ids they stored; it sets their
+tournament_id and refreshes the affected editions.
+
+Usage:
+    python tournaments.py --rebuild    # One-off backfill of matches.tournament_id and tournaments
+"""
+
+import argparse
+import re
+from datetime import datetime
+
+# Ids per IN (...) query, well under SQLite's variable limit
+CHUNK_SIZE = 500
+
+TOURNAMENT_COLUMNS = [
+    'tournament_id', 'name', 'canonical_name', 'level', 'category', 'tour', 'gender', 'source', 'surface',
+    'year', 'start_date', 'end_date', 'match_count',
+    'final_match_id', 'final_date', 'final_score', 'winner_id', 'winner_name', 'finalist_id', 'finalist_name',
+    'updated_at'
+]
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', (text or '').lower()).strip('-')
+
+
+def edition_id(match_id, tournament, source, date):
+    """Canonical edition id of a match (None if it has no tournament)."""
+    if tournament is None:
+        return None
+    match_id = str(match_id or '')
+    if match_id.startswith('sackmann_') and match_id.count('_') >= 2:
+        # sackmann_{tourney_id}_{match_num}
+        return 'sackmann-' + match_id[len('sackmann_'):].rsplit('_', 1)[0]
+    year = (date or '')[:4] or '0000'
+    return f"{_slug(source) or 'unknown'}-{year}-{_slug(tournament) or 'unnamed'}"
+
+
+def standardize_name(name, level, source):
+    """Standardize tournament name based on level and source."""
+    if not name or not level:
+        return name
+
+    name = name.strip()
+    source = source or ''
+    is_female = 'wta' in source.lower() or 'women' in source.lower()
+
+    # Remove common suffixes like " 15K", " $25,000", " $15K", " CH"
+    name = re.sub(r'\s+\$?\d+(?:,\d+)?K?$', '', name, flags=re.IGNORECASE)
+    if level == 'C' and name.lower().endswith(' ch'):
+        name = name[:-3]
+    name = name.strip()
+
+    final_name = name
+    if level in ['15', '25', '35', '50', '60', '75', '80', '100']:
+        prefix = 'W' if is_female else 'M'
+        target_prefix = f"{prefix}{level}"
+
+        if not name.startswith(target_prefix):
+            # Clean up suffix redundancy if strict mismatch
+            if name.endswith(f" {prefix}{level}"):
+                name = name[:-len(f" {prefix}{level}")]
+            elif name.endswith(f" {level}"):
+                name = name[:-len(f" {level}")]
+
+            final_name = f"{target_prefix} {name}"
+
+    elif level == 'C':
+        if not name.lower().startswith('challenger'):
+            final_name = f"Challenger {name}"
+
+    return final_name
+
+
+def level_category(level):
+    if level == 'G':
+        return 'Grand Slam'
+    if level in ['M', 'PM']:
+        return 'Masters'
+    if level in ['A', 'P']:
+        return 'ATP/WTA Tour'
+    if level == 'C':
+        return 'Challenger'
+    return 'ITF/Futures'
+
+
+def _tour(source):
+    """(tour, gender) from a match source."""
+    source = (source or '').lower()
+    if source.startswith('sackmann-atp'):
+        return 'ATP', 'M'
+    if source.startswith('sackmann-wta'):
+        return 'WTA', 'F'
+    if 'utr' in source:
+        return 'UTR', None
+    return source.upper() or None, None
+
+
+def _chunks(ids):
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def refresh_editions(conn, tournament_ids=None):
+    """Recompute tournaments rows from matches (all editions, or the given ids)."""
+    if tournament_ids is None:
+        batches = [(None, [])]
+    else:
+        batches = [(f"AND m.tournament_id IN ({', '.join('?' * len(chunk))})", chunk) for chunk in _chunks(tournament_ids)]
+
+    now = datetime.now().isoformat()
+    for id_sql, params in batches:
+        id_sql = id_sql or ''
+        editions = {}
+        for row in conn.execute(f"""
+            SELECT m.tournament_id, MIN(m.tournament), MIN(m.source), MIN(m.date), MAX(m.date), COUNT(*), MAX(m.tourney_level)
+            FROM matches m WHERE m.tournament_id IS NOT NULL {id_sql}
+            GROUP BY m.tournament_id
+        """, params):
+            tour, gender = _tour(row[2])
+            editions[row[0]] = {
+                'tournament_id': row[0], 'name': row[1], 'source': row[2], 'tour': tour, 'gender': gender,
+                'start_date': row[3], 'end_date': row[4], 'match_count': row[5], 'level': row[6],
+                'year': int(row[3][:4]) if row[3] and row[3][:4].isdigit() else None,
+            }
+
+        surface_counts = {}
+        for tid, surface, n in conn.execute(f"""
+            SELECT m.tournament_id, m.surface, COUNT(*) FROM matches m
+            WHERE m.tournament_id IS NOT NULL AND m.surface IS NOT NULL {id_sql}
+            GROUP BY m.tournament_id, m.surface
+        """, params):
+            best = surface_counts.get(tid)
+            if best is None or n > best[1]:
+                surface_counts[tid] = (surface, n)
+        for tid, (surface, _) in surface_counts.items():
+            if tid in editions:
+                editions[tid]['surface'] = surface
+
+        # Latest final of each edition (the final's own level / surface take precedence)
+        for row in conn.execute(f"""
+            SELECT m.tournament_id, m.match_id, m.date, m.score, m.tourney_level, m.surface,
+                   m.winner_id, w.name, m.loser_id, l.name
+            FROM matches m
+            LEFT JOIN players w ON m.winner_id = w.player_id
+            LEFT JOIN players l ON m.loser_id = l.player_id
+            WHERE m.tournament_id IS NOT NULL AND m.round = 'F' {id_sql}
+            ORDER BY m.date, m.match_id
+        """, params):
+            e = editions.get(row[0])
+            if e is None:
+                continue
+            e.update({
+                'final_match_id': row[1], 'final_date': row[2], 'final_score': row[3],
+                'winner_id': row[6], 'winner_name': row[7], 'finalist_id': row[8], 'finalist_name': row[9],
+            })
+            if row[4] is not None:
+                e['level'] = row[4]
+            if row[5] is not None:
+                e['surface'] = row[5]
+
+        for e in editions.values():
+            e['canonical_name'] = standardize_name(e['name'], e['level'], e['source'])
+            e['category'] = level_category(e['level']) if e['level'] else None
+            e['updated_at'] = now
+
+        if tournament_ids is None:
+            conn.execute("DELETE FROM tournaments")
+        else:
+            # Editions whose matches are all gone
+            conn.executemany("DELETE FROM tournaments WHERE tournament_id = ?", [(tid,) for tid in params if tid not in editions])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO tournaments ({', '.join(TOURNAMENT_COLUMNS)}) VALUES ({', '.join('?' * len(TOURNAMENT_COLUMNS))})",
+            [[e.get(c) for c in TOURNAMENT_COLUMNS] for e in editions.values()]
+        )
+
+
+def assign_matches(conn, match_ids):
+    """Set tournament_id on newly stored / replaced matches and refresh their editions. The caller commits."""
+    affected = set()
+    for chunk in _chunks([str(m) for m in match_ids]):
+        rows = conn.execute(
+            f"SELECT match_id, tournament, source, date, tournament_id FROM matches WHERE match_id IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ).fetchall()
+        updates = []
+        for match_id, tournament, source, date, current in rows:
+            tid = edition_id(match_id, tournament, source, date)
+            if tid != current:
+                updates.append((tid, match_id))
+                if current:
+                    affected.add(current)
+            if tid:
+                affected.add(tid)
+        conn.executemany("UPDATE matches SET tournament_id = ? WHERE match_id = ?", updates)
+    refresh_editions(conn, affected)
+
+
+def rebuild(conn):
+    """Backfill matches.tournament_id for every match and rebuild the tournaments table."""
+    import tennis_db
+
+    start = datetime.now()
+    rows = conn.execute("SELECT match_id, tournament, source, date, tournament_id FROM matches").fetchall()
+    updates = []
+    for match_id, tournament, source, date, current in rows:
+        tid = edition_id(match_id, tournament, source, date)
+        if tid != current:
+            updates.append((tid, match_id))
+    conn.executemany("UPDATE matches SET tournament_id = ? WHERE match_id = ?", updates)
+    refresh_editions(conn)
+    if updates:
+        # Backfilled column (assign_matches runs in the writers' transactions, which bump it already)
+        tennis_db.bump_version(conn, 'matches')
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM tournaments").fetchone()[0]
+    print(f"Tournaments: {count} editions from {len(rows)} matches "
+          f"({len(updates)} relinked) in {(datetime.now() - start).total_seconds():.1f}s")
+    return count
+
+
+def edition_ids(conn, name, year=None):
+    """Edition ids for an edition id, a raw tournament name or a canonical name (optionally in one year)."""
+    sql = "SELECT tournament_id FROM tournaments WHERE (tournament_id = ? OR name = ? OR canonical_name = ?)"
+    params = [name, name, name]
+    if year:
+        sql += " AND year = ?"
+        params.append(int(year))
+    return [r[0] for r in conn.execute(sql, params)]
+
+
+def latest_edition_id(conn, name):
+    """The most recent edition id for an edition id, raw tournament name or canonical name (None if unknown)."""
+    row = conn.execute("""
+        SELECT tournament_id FROM tournaments WHERE (tournament_id = ? OR name = ? OR canonical_name = ?)
+        ORDER BY start_date DESC, match_count DESC LIMIT 1
+    """, (name, name, name)).fetchone()
+    return row[0] if row else None
+
+
+def main():
+    import tennis_db
+
+    parser = argparse.ArgumentParser(description='Maintain the tournaments table')
+    parser.add_argument('--rebuild', action='store_true', help='Backfill matches.tournament_id and rebuild all editions')
+    args = parser.parse_args()
+
+    tennis_db.init_db()
+    conn = tennis_db.get_connection()
+    try:
+        if args.rebuild:
+            rebuild(conn)
+        else:
+            parser.print_help()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
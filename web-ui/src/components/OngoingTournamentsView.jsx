@@ -27,6 +27,20 @@ const OngoingTournamentsView = ({ onPlayerClick }) => {
             setLoading(false);
         };
         fetchTournaments();
+
+        // Live updates: the server pushes a new snapshot whenever the tournaments change
+        if (typeof EventSource === 'undefined') return;
+        const source = new EventSource('/api/tournaments/ongoing/stream');
+        source.addEventListener('tournaments', (event) => {
+            try {
+                setTournaments(JSON.parse(event.data).data || []);
+                setError(null);
+                setLoading(false);
+            } catch (err) {
+                console.error(err);
+            }
+        });
+        return () => source.close();
     }, []);
 
     // Helper to get tournament type badge